@@ -1,14 +1,24 @@
 import os
-import asyncio
 import time
+import hashlib
 import pandas as pd
 import streamlit as st
 from datetime import datetime
-from langchain_core.documents import Document
 
 # Import Modul Internal
-from modules.database import get_vectorstore
-from modules.rag_engine import advanced_rag_chat
+from modules.database import get_vectorstore, embedding_cache_stats
+from modules.clients import pool_metrics
+from modules.fee_index import get_fee_index
+from modules.catalog import get_catalog
+from modules.ingest import plan_sync, apply_sync, rebuild_generation, collect_generations
+from modules.kb_generations import get_generation_pointer
+from modules.sync_manifest import get_sync_manifest
+from modules.answer_cache import bump_kb_version, get_answer_cache
+from modules.rag_engine import advanced_rag_stream
+from modules.loop_runner import iterate
+from modules.hedging import latency_stats
+from modules.rate_limiter import rate_limit_stats
+from modules.metrics import metrics_snapshot
 
 # Konfigurasi Path
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -33,7 +43,12 @@ with st.sidebar:
             if confirm_reset:
                 with st.spinner("Membersihkan Cloud..."):
                     try:
-                        get_vectorstore().delete(delete_all=True)
+                        # Cutover ke generasi kosong (atomik); generasi lama di-GC, bukan delete_all pada index yang sedang dilayani
+                        pointer = get_generation_pointer()
+                        pointer.activate(pointer.begin("reset"), rows=0)
+                        # Generasi baru punya index tarif & katalog sendiri (kosong)
+                        collect_generations()
+                        bump_kb_version("reset")
                         if os.path.exists(LOG_FILE):
                             os.remove(LOG_FILE)
                         st.success("Database Pinecone berhasil dikosongkan!")
@@ -44,6 +59,25 @@ with st.sidebar:
             else:
                 st.error("Silakan centang konfirmasi terlebih dahulu.")
 
+        st.divider()
+        with st.expander("🔌 Status Pool Koneksi"):
+            st.json(pool_metrics())
+        with st.expander("🧠 Cache Embedding"):
+            st.json(embedding_cache_stats())
+        with st.expander("💬 Cache Jawaban"):
+            st.json(get_answer_cache().get_stats())
+        with st.expander("⏱️ Hedging Judge"):
+            st.json(latency_stats())
+        with st.expander("🚦 Kuota LLM"):
+            st.json(rate_limit_stats())
+        with st.expander("🗂️ Generasi KB"):
+            st.json({"active": get_generation_pointer().active(), "generations": get_generation_pointer().generations()})
+        with st.expander("📈 Latensi Pipeline"):
+            summaries, counters = metrics_snapshot()
+            if summaries:
+                st.dataframe(pd.DataFrame(summaries), use_container_width=True)
+            st.json(counters)
+
 # =========================
 # MODE CHAT MAHASISWA
 # =========================
@@ -59,12 +93,18 @@ if mode == "💬 Chat Mahasiswa":
         with st.chat_message("user"): st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Llama sedang memproses..."):
-                # Menjalankan RAG Engine v15.2
-                ans, src, dbg = asyncio.run(advanced_rag_chat(prompt, st.session_state.messages, debug=True))
-                st.markdown(ans)
-                if dbg:
-                    with st.expander("🛠️ Debug Info"): st.json(dbg)
+            # Menjalankan RAG Engine v15.2 di event loop latar; token ditampilkan begitu tiba
+            result = {}
+            stream = advanced_rag_stream(prompt, st.session_state.messages, debug=True, result=result)
+            st.write_stream(iterate(stream))
+            ans, dbg = result.get("answer", ""), result.get("debug")
+            if dbg:
+                with st.expander("🛠️ Debug Info"):
+                    st.json(dbg)
+                    # Request ini terpilih profiler (RAG_PROFILE): file bisa dibuka di speedscope.app
+                    if (dbg.get("profile") or {}).get("speedscope"):
+                        with open(dbg["profile"]["speedscope"], "rb") as f:
+                            st.download_button("🔬 Unduh profil (speedscope)", f.read(), file_name=os.path.basename(dbg["profile"]["speedscope"]), mime="application/json")
 
         st.session_state.messages.append({"role": "assistant", "content": ans})
 
@@ -73,83 +113,133 @@ if mode == "💬 Chat Mahasiswa":
 # =========================
 else:
     st.header("🛡️ Manajemen Pengetahuan")
-    tab_up, tab_log = st.tabs(["📤 Upload & Sync", "📋 Riwayat Log"])
+    tab_up, tab_rebuild, tab_log = st.tabs(["📤 Upload & Sync", "🔁 Rebuild Penuh", "📋 Riwayat Log"])
 
     with tab_up:
         uploaded_file = st.file_uploader("Upload CSV Keuangan/Prodi (Gunakan format UPDATED)", type=["csv"])
         
-        if uploaded_file and st.button("🚀 Sync to Cloud"):
+        if uploaded_file:
             temp_path = f"temp_{uploaded_file.name}"
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            file_digest = hashlib.sha1(uploaded_file.getvalue()).hexdigest()
 
-            with st.spinner("Sinkronisasi Metadata ke Pinecone..."):
+            # 1. Diff terhadap manifest tersimpan (tanpa embedding) ditampilkan sebelum sinkronisasi
+            if st.button("🔍 Bandingkan dengan Data Tersimpan"):
+                with open(temp_path, "wb") as f:
+                    f.write(uploaded_file.getbuffer())
                 try:
-                    # Membaca CSV dan memastikan tidak ada nilai NaN
-                    df = pd.read_csv(temp_path).fillna("")
-                    docs = []
-                    
-                    for i, row in df.iterrows():
-                        # 1. Konversi baris ke dictionary dengan kunci UPPERCASE
-                        raw_meta = {k.strip().upper(): str(v).strip() for k, v in row.to_dict().items()}
-                        
-                        # 2. Ambil JURUSAN_PROGRAM_STUDI dari kolom fisik (Hasil updated CSV sebelumnya)
-                        # Jika tidak ada, fallback ke "UMUM"
-                        prodi = raw_meta.get("JURUSAN_PROGRAM_STUDI", "UMUM")
-                        
-                        # 3. Bentuk Metadata yang akan dikirim ke Pinecone
-                        # Metadata ini harus sinkron dengan filter di advanced_rag_chat
-                        meta = {
-                            "SOURCE": uploaded_file.name,
-                            "JENJANG": raw_meta.get("JENJANG", "S1"),
-                            "KATEGORI": raw_meta.get("KATEGORI", "KEUANGAN"),
-                            "TIPE_DATA": raw_meta.get("TIPE_DATA", "BIAYA"),
-                            "JURUSAN_PROGRAM_STUDI": prodi,
-                            "UPLOADED_AT": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        
-                        # 4. Bentuk Content (Page Content)
-                        # Kita awali dengan "Prodi:" agar cocok dengan kueri literal di Stage 2 RAG
-                        content = f"Prodi: {prodi} | Jenjang: {meta['JENJANG']} | " + \
-                                  " | ".join([f"{k}: {v}" for k, v in raw_meta.items() if k not in ["TEXT"]])
-                        
-                        # Jika kolom 'TEXT' asli ada di CSV, prioritaskan sebagai konten utama
-                        if "TEXT" in raw_meta:
-                            content = raw_meta["TEXT"]
-
-                        docs.append(Document(page_content=content, metadata=meta))
+                    plan = plan_sync(temp_path, uploaded_file.name, get_sync_manifest().get(uploaded_file.name))
+                    st.session_state.sync_plan = (file_digest, plan)
+                except Exception as e:
+                    st.error(f"Gagal membaca CSV: {e}")
+                finally:
+                    if os.path.exists(temp_path): os.remove(temp_path)
 
-                    if docs:
-                        vs = get_vectorstore()
-                        
-                        # 5. Menghapus data lama dengan sumber yang sama (Idempotent)
+            pending = st.session_state.get("sync_plan")
+            plan = pending[1] if pending and pending[0] == file_digest and pending[1]["source"] == uploaded_file.name else None
+
+            if plan:
+                summary = plan["summary"]
+                c1, c2, c3, c4 = st.columns(4)
+                c1.metric("➕ Baru", summary["added"])
+                c2.metric("✏️ Berubah", summary["changed"])
+                c3.metric("➖ Dihapus", summary["removed"])
+                c4.metric("✔️ Tetap", summary["unchanged"])
+                if plan["full"]:
+                    st.info("Belum ada manifest untuk file ini: sinkronisasi penuh (data lama dengan SOURCE sama dihapus dulu).")
+                nothing = not plan["full"] and not plan["added"] and not plan["removed"]
+                if nothing:
+                    st.success("Tidak ada perubahan dibanding data tersimpan.")
+
+                if not nothing and st.button("🚀 Sync to Cloud"):
+                    with open(temp_path, "wb") as f:
+                        f.write(uploaded_file.getbuffer())
+
+                    with st.spinner("Sinkronisasi Metadata ke Pinecone..."):
                         try:
-                            vs.delete(filter={"SOURCE": uploaded_file.name})
-                        except:
-                            pass
-                        
-                        # 6. Upload dengan ID yang unik namun teratur
-                        custom_ids = [f"{uploaded_file.name}_{idx}" for idx in range(len(docs))]
-                        vs.add_documents(docs, ids=custom_ids)
-
-                        # Logging Riwayat
-                        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-                        log_entry = pd.DataFrame([{
-                            "Waktu": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 
-                            "File": uploaded_file.name, 
-                            "Status": "Success",
-                            "Data_Count": len(docs)
-                        }])
-                        log_entry.to_csv(LOG_FILE, mode='a', index=False, header=not os.path.exists(LOG_FILE))
+                            vs = get_vectorstore()
+
+                            # 2. Hanya baris baru/berubah yang di-embed & upsert (ID = hash konten), baris hilang dihapus.
+                            # CSV dibaca per chunk, embed + upsert per batch paralel
+                            progress = st.progress(0.0)
+                            progress_text = st.empty()
+
+                            def on_progress(stats):
+                                progress.progress(min(1.0, stats["rows"] / stats["total_estimate"]))
+                                progress_text.caption(f"{stats['rows']:,} / ~{stats['total_estimate']:,} baris • {stats['upserted']:,} di-upsert • {stats['rows_per_sec']:,} baris/detik")
+
+                            count, fee_records, programs, stats = apply_sync(plan, temp_path, vs, on_progress=on_progress)
+                            st.session_state.pop("sync_plan", None)
+
+                            get_fee_index().replace_source(uploaded_file.name, fee_records)
+                            get_catalog().replace_source(uploaded_file.name, programs)
+
+                            if count:
+                                # Logging Riwayat
+                                os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+                                log_entry = pd.DataFrame([{
+                                    "Waktu": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 
+                                    "File": uploaded_file.name, 
+                                    "Status": "Success",
+                                    "Data_Count": count
+                                }])
+                                log_entry.to_csv(LOG_FILE, mode='a', index=False, header=not os.path.exists(LOG_FILE))
                         
-                        st.success(f"✅ Berhasil Sinkronisasi {len(docs)} data!")
-                        time.sleep(1)
-                        st.rerun()
+                                st.success(f"✅ Berhasil Sinkronisasi {count} data! ({stats.get('upserted', 0)} di-upsert, {stats['deleted']} dihapus)")
+                                time.sleep(1)
+                                st.rerun()
+                            else:
+                                # File kosong / hanya penghapusan: tetap beri tahu admin apa yang terjadi
+                                st.info(f"ℹ️ Tidak ada data yang disinkronkan: 0 baris ditulis ({stats['deleted']} dihapus).")
+
+                        except Exception as e:
+                            st.error(f"Gagal Sinkronisasi: {e}")
+                        finally:
+                            # Sync berhasil maupun gagal di tengah jalan -> KB bisa berubah, jawaban lama dibatalkan
+                            bump_kb_version(f"sync {uploaded_file.name}")
+                            if os.path.exists(temp_path): os.remove(temp_path)
+
+    with tab_rebuild:
+        # Rebuild penuh ke generasi baru: KB aktif tetap melayani sampai generasi baru lolos verifikasi
+        st.caption("Seluruh KB dibangun ulang dari file di bawah ke generasi baru, diverifikasi, lalu dialihkan sekaligus. File yang tidak diunggah tidak ikut ke generasi baru.")
+        rebuild_files = st.file_uploader("Upload semua CSV pengetahuan", type=["csv"], accept_multiple_files=True, key="rebuild_files")
+        if rebuild_files and st.button("🔁 Bangun Generasi Baru & Alihkan"):
+            files = []
+            for uf in rebuild_files:
+                path = f"temp_rebuild_{uf.name}"
+                with open(path, "wb") as f:
+                    f.write(uf.getbuffer())
+                files.append((path, uf.name))
+
+            with st.spinner("Membangun generasi baru (KB aktif tetap melayani)..."):
+                progress = st.progress(0.0)
+                progress_text = st.empty()
+
+                def on_rebuild_progress(stats):
+                    done = (stats["file"] - 1 + min(1.0, stats["rows"] / stats["total_estimate"])) / stats["files"]
+                    progress.progress(min(1.0, done))
+                    progress_text.caption(f"[{stats['file']}/{stats['files']}] {stats['source']}: {stats['rows']:,} / ~{stats['total_estimate']:,} baris • {stats['rows_per_sec']:,} baris/detik")
 
+                try:
+                    generation, results, report, dropped = rebuild_generation(files, label=f"rebuild {len(files)} file", on_progress=on_rebuild_progress)
+
+                    # Index tarif & katalog sudah ditulis per generasi sebelum cutover (rebuild_generation)
+                    bump_kb_version(f"cutover {generation}")
+
+                    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+                    pd.DataFrame([{
+                        "Waktu": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "File": source,
+                        "Status": f"Rebuild {generation}",
+                        "Data_Count": count
+                    } for source, (count, _, _) in results.items()]).to_csv(LOG_FILE, mode='a', index=False, header=not os.path.exists(LOG_FILE))
+
+                    st.success(f"✅ Generasi {generation} aktif ({report['size']} vektor). Generasi lama dihapus: {', '.join(dropped) or '-'}")
+                    st.json(report)
                 except Exception as e:
-                    st.error(f"Gagal Sinkronisasi: {e}")
+                    st.error(f"Rebuild dibatalkan, KB aktif tidak berubah: {e}")
                 finally:
-                    if os.path.exists(temp_path): os.remove(temp_path)
+                    for path, _ in files:
+                        if os.path.exists(path): os.remove(path)
 
     with tab_log:
         if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > 0:
@@ -1,7 +1,9 @@
-from flask import Flask, request
+from flask import Flask, Response, request
 from twilio.twiml.messaging_response import MessagingResponse
 from modules.rag_engine import advanced_rag_chat
 from modules.session_manager import get_user_mode, update_session, set_mode
+from modules.metrics import render_prometheus
+from modules.loop_runner import run
 
 # --- TAMBAHAN BARU: Import Fungsi Tiket ---
 try:
@@ -11,12 +13,20 @@ except ImportError:
 # ------------------------------------------
 
 import os
+import hmac
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__)
 
+# Rahasia bersama untuk memaksa profil lewat header; kosong = header X-Profile diabaikan (/bot publik)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+def _profile_requested():
+    token = request.headers.get("X-Profile", "")
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
 @app.route("/bot", methods=['POST'])
 def bot():
     incoming_msg = request.values.get('Body', '').strip()
@@ -75,7 +85,10 @@ def bot():
         update_session(sender_number, incoming_msg, 'user')
         try:
             # PERBAIKAN DISINI: Tambahkan [] agar parameter chat_history terisi
-            answer = advanced_rag_chat(incoming_msg, []) 
+            # advanced_rag_chat adalah coroutine -> dijalankan di loop latar (span & /metrics ikut tercatat)
+            # Header X-Profile: <PROFILE_TOKEN> memaksa profil sampling request ini (file di data/profiles/)
+            profile = True if _profile_requested() else None
+            answer, _, _ = run(advanced_rag_chat(incoming_msg, [], profile=profile))
             
             update_session(sender_number, answer, 'bot')
         except Exception as e:
@@ -86,5 +99,10 @@ def bot():
         msg.body(answer)
         return str(resp)
 
+# Latensi per stage & per panggilan LLM/embedding/search (format Prometheus) untuk di-scrape monitoring
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import re
+import random
+import timeit
+from langchain_core.documents import Document
+from modules.scoring import Booster, FINANCE_ROW_KEYWORDS, LOWER_KEY
+
+# Micro-benchmark Stage 4: loop boosting lama vs Booster (hasil ranking harus identik)
+random.seed(0)
+PRODI = ["TEKNIK INFORMATIKA", "AGRIBISNIS", "AKUNTANSI", "HUKUM EKONOMI SYARIAH", "PENDIDIKAN BAHASA ARAB",
+         "KESEHATAN MASYARAKAT", "MANAJEMEN", "ILMU HUKUM", "SISTEM INFORMASI", "FARMASI"]
+TARGETS = ["S1 Teknik Informatika", "S2 Agribisnis", "Akuntansi", "S1 Manajemen", "Ilmu Hukum"]
+YEARS = ["2025"]
+
+def make_results(n_targets=5, k=60, fallback_k=25):
+    # Simulasi 5 target x (60 + 25) hasil, banyak chunk yang sama muncul di beberapa target
+    pool = []
+    for _ in range(300):
+        prodi, jenjang = random.choice(PRODI), random.choice(["S1", "S2", "S3"])
+        kelompok = " | ".join(f"KELOMPOK_{r}: {random.randint(1, 9) * 1000000}" for r in ["I", "II", "III", "IV", "V", "VI", "VII"])
+        content = (
+            f"Prodi: {prodi} | Jenjang: {jenjang} | KATEGORI: KEUANGAN | TAHUN_AKADEMIK: 202{random.randint(3, 5)} | "
+            f"{kelompok} | Keterangan: " + "biaya pendidikan per semester " * random.randint(2, 8)
+        )
+        # Seperti hasil ingest: lowercase sudah ada di metadata
+        pool.append(Document(page_content=content, metadata={LOWER_KEY: content.lower()}))
+    return [(random.choice(pool), random.random()) for _ in range(n_targets * (k + fallback_k))]
+
+def legacy(all_results, targets, query_years, intent="FINANCE"):
+    seen, boosted = set(), []
+    for doc, score in all_results:
+        if doc.page_content in seen: continue
+        content_lower = doc.page_content.lower()
+        final_score = score
+        for t in targets:
+            if t.lower() in content_lower:
+                final_score += 250000
+                degree_match = re.search(r'\b(s1|s2|s3|magister|sarjana|profesi)\b', t.lower())
+                if degree_match and degree_match.group() in content_lower:
+                    final_score += 100000
+        for y in query_years:
+            if y in content_lower: final_score += 80000
+            else: final_score -= 50000
+        if intent == "FINANCE":
+            if any(kw in content_lower for kw in ['kelompok', 'tarif_wni', 'biaya_ukt', 'ukt', 'tarif']):
+                final_score += 150000
+        boosted.append((doc.page_content, final_score))
+        seen.add(doc.page_content)
+    boosted.sort(key=lambda x: x[1], reverse=True)
+    return boosted[:20]
+
+def compiled(all_results, targets, query_years):
+    booster = Booster(targets, query_years, keywords=FINANCE_ROW_KEYWORDS)
+    top, _ = booster.rank(all_results, 20)
+    return [(doc.page_content, score) for doc, score in top]
+
+if __name__ == "__main__":
+    results = make_results()
+    assert legacy(results, TARGETS, YEARS) == compiled(results, TARGETS, YEARS), "Ranking berbeda!"
+
+    n = 300
+    t_old = timeit.timeit(lambda: legacy(results, TARGETS, YEARS), number=n) / n * 1000
+    t_new = timeit.timeit(lambda: compiled(results, TARGETS, YEARS), number=n) / n * 1000
+    print(f"📊 {len(results)} kandidat, {len(TARGETS)} target")
+    print(f"Loop lama : {t_old:.3f} ms/pesan")
+    print(f"Booster   : {t_new:.3f} ms/pesan ({t_old / t_new:.2f}x)")
@@ -0,0 +1,32 @@
+import os
+import tempfile
+from datetime import date
+from modules.fee_index import FeeIndex, FeeRecord
+from modules.date_resolver import resolve_dates
+
+# Cek lookup index tarif: tahun dari resolver ("tahun ini") yang belum ada datanya tidak boleh
+# membuat fast-path selalu miss; batasan tahun dilepas seperti ladder filter vector.
+ROWS = [
+    FeeRecord("ILMU HUKUM", "S1", "III", "2024", "UKT", "3000000", "ukt_2024.csv", "Prodi: ILMU HUKUM | TA: 2024/2025 | KELOMPOK: III"),
+    FeeRecord("ILMU HUKUM", "S1", "III", "2025", "UKT", "3500000", "ukt_2025.csv", "Prodi: ILMU HUKUM | TA: 2025/2026 | KELOMPOK: III"),
+    FeeRecord("AGRIBISNIS", "S1", "III", "2025", "UKT", "4000000", "ukt_2025.csv", "Prodi: AGRIBISNIS | TA: 2025/2026 | KELOMPOK: III"),
+]
+
+def amounts(hits):
+    return sorted(r.amount for r in hits)
+
+if __name__ == "__main__":
+    index = FeeIndex(os.path.join(tempfile.mkdtemp(), "fee_index.json"))
+    index.replace_all({"ukt.csv": ROWS})
+
+    # Tahun yang ada datanya tetap memfilter
+    assert amounts(index.lookup("S1 Ilmu Hukum", "III", ["2024"])) == ["3000000"]
+    assert amounts(index.lookup("S1 Ilmu Hukum", "III", ["2025"])) == ["3500000"]
+    # "tahun ini" (TA 2026/2027) belum ada barisnya -> tanpa batasan tahun, bukan miss
+    this_year = resolve_dates("berapa ukt ilmu hukum kelompok 3 tahun ini", today=date(2026, 10, 18))["years"]
+    assert this_year == ["2026"], this_year
+    assert amounts(index.lookup("S1 Ilmu Hukum", "III", this_year)) == ["3000000", "3500000"]
+    # Pelonggaran hanya tahun: prodi/jenjang/kelompok yang salah tetap miss
+    assert index.lookup("S2 Ilmu Hukum", "III", this_year) == []
+    assert amounts(index.lookup("Agribisnis", "III", this_year)) == ["4000000"]
+    print("✅ lookup tarif: filter tahun dilonggarkan jika kosong")
@@ -0,0 +1,67 @@
+import os
+import asyncio
+import tempfile
+
+# Cek jalur hybrid (dense + BM25) pada KB lokal: syarat jenjang ternormalisasi (S2/PROFESI) harus tetap
+# menemukan baris berjenjang mentah "Magister"/"Profesi", dan BM25 memakai filter tingkat ladder yang sama.
+_tmp = tempfile.mkdtemp()
+os.environ.update(
+    VECTOR_BACKEND="local", KB_VERIFY_TIMEOUT="0",
+    LOCAL_INDEX_DIR=os.path.join(_tmp, "local_index"),
+    KB_POINTER_PATH=os.path.join(_tmp, "kb_pointer.json"),
+    SYNC_MANIFEST_PATH=os.path.join(_tmp, "sync_manifest.json"),
+    PRODI_CATALOG_PATH=os.path.join(_tmp, "prodi_catalog.json"),
+    FEE_INDEX_PATH=os.path.join(_tmp, "fee_index.json"),
+    RAG_LEXICAL_DIR=os.path.join(_tmp, "lexical"),
+)
+
+import pandas as pd
+from langchain_core.embeddings import Embeddings
+from modules import database
+from modules.ingest import rebuild_generation
+from modules.canonical import filter_ladders
+from modules.partitions import jenjang_key_filter
+from modules.retrieval import multi_search, lexical_index, RRF_K
+
+class ConstantEmbeddings(Embeddings):
+    """Semua teks satu vektor: dense mengembalikan seluruh isi filter, tanpa layanan embedding"""
+    def embed_documents(self, texts):
+        return [[1.0, 0.0, 0.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0, 0.0]
+
+PROGRAMS = [("ILMU HUKUM", "S1"), ("ILMU HUKUM", "Magister"), ("PENDIDIKAN DOKTER", "Profesi")]
+ROWS = [{"JURUSAN_PROGRAM_STUDI": prodi, "JENJANG": jenjang, "KATEGORI": "KEUANGAN", "TAHUN_AKADEMIK": "2025/2026",
+         "KELOMPOK": kelompok, "NOMINAL": str(1000 * (i + 1))}
+        for prodi, jenjang in PROGRAMS for i, kelompok in enumerate(["I", "II", "III"])]
+
+def search(vs, target, query, search_filter):
+    ladders = filter_ladders([target], search_filter, 15, 15, vs.meta_keys)
+    res, errors = asyncio.run(multi_search(vs, [target], 15, search_filter, vectors={}, ladders=ladders, query=query))
+    assert not errors, errors
+    return res
+
+if __name__ == "__main__":
+    database._embeddings = ConstantEmbeddings()
+    csv_path = os.path.join(_tmp, "tarif.csv")
+    pd.DataFrame(ROWS).to_csv(csv_path, index=False)
+    rebuild_generation([(csv_path, "tarif.csv")])
+    vs = database.get_vectorstore()
+    lexical = lexical_index(vs)
+    assert lexical is not None, "generasi baru harus punya index BM25"
+
+    # Filter engine memakai jenjang ternormalisasi, metadata menyimpan "Magister"/"Profesi"
+    for jenjang, raw in (("S2", "Magister"), ("PROFESI", "Profesi")):
+        flt = {"KATEGORI": "KEUANGAN", "JENJANG": {"$in": [jenjang]}}
+        hits = lexical.search("biaya kelompok iii", 10, jenjang_key_filter(flt))
+        assert hits and all(d.metadata["JENJANG"] == raw for d, _ in hits), (jenjang, hits)
+    print("✅ BM25: filter JENJANG S2/PROFESI menemukan baris Magister/Profesi")
+
+    # Jalur hybrid lengkap: ladder prodi + jenjang, BM25 dengan filter tingkat yang sama. Dokumen yang hanya
+    # ditemukan satu sisi skor RRF-nya <= 1/(RRF_K+1); semua dokumen di atas itu = dense & BM25 sepakat
+    for target, jenjang, raw in (("S2 Ilmu Hukum", "S2", "Magister"), ("Profesi Pendidikan Dokter", "PROFESI", "Profesi")):
+        res = search(vs, target, f"berapa biaya {target} kelompok iii", {"KATEGORI": "KEUANGAN", "JENJANG": {"$in": [jenjang]}})
+        assert len(res) == 3 and all(d.metadata["JENJANG"] == raw for d, _ in res), (target, [d.metadata for d, _ in res])
+        assert all(score > 1 / (RRF_K + 1) for _, score in res), (target, [round(s, 4) for _, s in res])
+    print("✅ hybrid: ladder + BM25 satu filter, jenjang Magister/Profesi tidak hilang")
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from .fee_index import kelompok_from_query
+
+# Cache jawaban per proses, dikunci dengan versi knowledge base. Versi disimpan di file
+# sehingga sync/reset dari admin Streamlit langsung membatalkan cache di proses WhatsApp.
+KB_VERSION_PATH = os.getenv("KB_VERSION_PATH", os.path.join("data", "kb_version.json"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "21600"))
+# Lookup kemiripan embedding untuk parafrase (0 = nonaktif)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+_version_lock = threading.Lock()
+_version_cache = {"mtime": None, "version": 0}
+
+def get_kb_version():
+    """Versi knowledge base saat ini (cek mtime file, murah dipanggil per pesan)"""
+    try:
+        mtime = os.path.getmtime(KB_VERSION_PATH)
+    except OSError:
+        return 0
+    with _version_lock:
+        if mtime != _version_cache["mtime"]:
+            try:
+                with open(KB_VERSION_PATH, "r") as f:
+                    _version_cache["version"] = int(json.load(f).get("version", 0))
+                _version_cache["mtime"] = mtime
+            except (OSError, ValueError):
+                pass
+        return _version_cache["version"]
+
+def bump_kb_version(reason=""):
+    """Naikkan versi KB setelah sync/reset agar jawaban lama tidak pernah disajikan"""
+    with _version_lock:
+        current = 0
+        if os.path.exists(KB_VERSION_PATH):
+            try:
+                with open(KB_VERSION_PATH, "r") as f:
+                    current = int(json.load(f).get("version", 0))
+            except (OSError, ValueError):
+                pass
+        os.makedirs(os.path.dirname(KB_VERSION_PATH) or ".", exist_ok=True)
+        tmp = KB_VERSION_PATH + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "version": current + 1,
+                "reason": reason,
+                "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }, f)
+        os.replace(tmp, KB_VERSION_PATH)
+        _version_cache["mtime"] = None
+    return current + 1
+
+def normalize_query(query):
+    return " ".join(re.sub(r"[^\w\s]", " ", str(query).lower()).split())
+
+def plan_signature(query, intent, targets, years):
+    # Angka & kelompok ikut signature: "kelompok 3" vs "kelompok 5" tidak boleh berbagi jawaban
+    numbers = tuple(sorted(set(re.findall(r"\d+", str(query)))))
+    return (
+        intent,
+        tuple(sorted({str(t).lower() for t in targets})),
+        tuple(sorted({str(y) for y in years or []})),
+        kelompok_from_query(query),
+        numbers
+    )
+
+class AnswerCache:
+    """LRU+TTL: (engine, versi KB, kueri ternormalisasi, plan) -> (jawaban, sumber, debug)"""
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "plan_hits": 0}
+
+    def _alive(self, ts, now):
+        return now - ts <= self.ttl
+
+    def make_key(self, engine, query, intent, targets, years):
+        return (engine, get_kb_version(), normalize_query(query), plan_signature(query, intent, targets, years))
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item and self._alive(item["ts"], now):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return item["value"]
+            if item:
+                del self._entries[key]
+            return None
+
+    def get_similar(self, key, query_vec):
+        """Cari entri dengan engine/versi/plan sama dan embedding kueri paling mirip"""
+        if not self.similarity or query_vec is None:
+            return None
+        engine, version, _, sig = key
+        q = np.asarray(query_vec, dtype=np.float32)
+        q /= (np.linalg.norm(q) or 1.0)
+        now = time.time()
+        best, best_sim = None, self.similarity
+        with self._lock:
+            for (e, v, _, s), item in self._entries.items():
+                if e != engine or v != version or s != sig or item["vec"] is None:
+                    continue
+                if not self._alive(item["ts"], now):
+                    continue
+                sim = float(item["vec"] @ q)
+                if sim >= best_sim:
+                    best, best_sim = item, sim
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["semantic_hits"] += 1
+            return best["value"]
+
+    def put(self, key, value, query_vec=None):
+        vec = None
+        if query_vec is not None:
+            vec = np.asarray(query_vec, dtype=np.float32)
+            vec /= (np.linalg.norm(vec) or 1.0)
+        with self._lock:
+            self._entries[key] = {"value": value, "vec": vec, "ts": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # Plan LLM juga di-cache agar pertanyaan populer yang gagal fast-path tidak memanggil planner lagi
+    def get_plan(self, engine, query):
+        key = (engine, get_kb_version(), normalize_query(query))
+        with self._lock:
+            item = self._plans.get(key)
+            if item and self._alive(item[1], time.time()):
+                self.stats["plan_hits"] += 1
+                return dict(item[0])
+            return None
+
+    def put_plan(self, engine, query, plan):
+        key = (engine, get_kb_version(), normalize_query(query))
+        with self._lock:
+            self._plans[key] = (dict(plan), time.time())
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), plans=len(self._plans), kb_version=get_kb_version())
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
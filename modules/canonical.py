@@ -0,0 +1,112 @@
+import os
+import difflib
+import threading
+from .catalog import get_catalog
+from .fee_index import normalize_jenjang, normalize_prodi
+from .date_resolver import UNDATED
+from .partitions import JENJANG_FIELDS
+
+# Kanonikalisasi entitas planner -> nilai metadata kanonik (PRODI_KEY / JENJANG_KEY yang ditulis saat ingest),
+# sehingga Stage 3 bisa memakai filter metadata ketat ($in prodi + jenjang) dengan K kecil.
+# Tabel alias dibangun dari katalog prodi hasil ingest: nama ternormalisasi + singkatan (PAI, KPI, ...).
+MAX_ALIASES = int(os.getenv("RAG_CANONICAL_MAX_ALIASES", "4"))
+FUZZY_CUTOFF = float(os.getenv("RAG_CANONICAL_FUZZY_CUTOFF", "0.85"))
+# K untuk pencarian berfilter ketat (satu prodi/jenjang hanya punya belasan baris)
+TIGHT_K = int(os.getenv("RAG_TIGHT_K", "12"))
+
+def prodi_key(value):
+    """Nilai PRODI_KEY untuk satu nama prodi (sama dengan normalisasi gazetteer/index tarif)"""
+    return normalize_prodi(value)
+
+def jenjang_key(value):
+    """Nilai JENJANG_KEY; jenjang tak dikenal -> "UMUM" (sama dengan nama partisi)"""
+    return normalize_jenjang(value) or "UMUM"
+
+def _acronym(key):
+    words = key.split()
+    return "".join(w[0] for w in words) if len(words) >= 2 else None
+
+class _AliasTable:
+    def __init__(self, programs):
+        self.keys = sorted({prodi_key(p) for p, _ in programs} - {""})
+        acronyms = {}
+        for key in self.keys:
+            acr = _acronym(key)
+            if acr:
+                acronyms.setdefault(acr, []).append(key)
+        # Singkatan ambigu (dipakai >1 prodi) tetap dipakai sebagai $in selama tidak terlalu banyak
+        self.acronyms = {a: ks for a, ks in acronyms.items() if len(ks) <= MAX_ALIASES}
+        self.key_set = set(self.keys)
+
+    def resolve(self, entity):
+        norm = prodi_key(entity)
+        if not norm:
+            return []
+        if norm in self.key_set:
+            return [norm]
+        if norm.replace(" ", "") in self.acronyms:
+            return list(self.acronyms[norm.replace(" ", "")])
+
+        padded = f" {norm} "
+        contained = [k for k in self.keys if f" {k} " in padded]
+        if contained:
+            return [max(contained, key=len)]
+        partial = [k for k in self.keys if padded in f" {k} "]
+        if partial:
+            return partial if len(partial) <= MAX_ALIASES else []
+        return difflib.get_close_matches(norm, self.keys, n=1, cutoff=FUZZY_CUTOFF)
+
+_table = None
+_table_version = None
+_table_lock = threading.Lock()
+
+def _get_table():
+    global _table, _table_version
+    catalog = get_catalog()
+    programs = catalog.programs()
+    with _table_lock:
+        if _table is None or _table_version != (catalog.path, catalog.version):
+            _table = _AliasTable(programs)
+            _table_version = (catalog.path, catalog.version)
+        return _table
+
+def canonicalize(entity):
+    """(daftar PRODI_KEY kandidat, JENJANG_KEY atau None) untuk satu entitas planner"""
+    return _get_table().resolve(entity), normalize_jenjang(entity)
+
+def filter_ladders(targets, search_filter, k, fallback_k=None, meta_keys=(), academic_years=()):
+    """{target: [(filter, k), ...]}: filter ketat dulu, dilonggarkan bertahap hanya jika hasil kosong.
+
+    Prodi dikenal (PRODI_KEY tersedia): prodi + jenjang (+ tahun) dengan K kecil -> prodi + jenjang -> prodi
+    -> filter kategori lama (K lama). Ada tahun (TA_KEY tersedia): filter kategori + tahun -> tanpa tahun.
+    Terakhir tanpa filter jika fallback_k. Target lain tidak masuk (pencarian lama primary + fallback).
+    """
+    # Baris tanpa tahun (UMUM) tetap lolos filter tahun
+    year = {"TA_KEY": {"$in": list(academic_years) + [UNDATED]}} if academic_years and "TA_KEY" in meta_keys else None
+    canonical = {"PRODI_KEY", "JENJANG_KEY"} <= set(meta_keys)
+
+    # Langkah "tanpa jenjang" harus benar-benar tanpa jenjang: search_plan (KB terpartisi) sudah menaruh
+    # JENJANG $in di search_filter, yang kalau ikut terbawa membuat tebakan jenjang salah tak pernah longgar
+    loose = {key: cond for key, cond in (search_filter or {}).items() if key not in JENJANG_FIELDS}
+
+    ladders = {}
+    for t in targets:
+        keys, jenjang = canonicalize(t) if canonical else ([], None)
+        steps = []
+        if keys:
+            tight = dict(loose, PRODI_KEY={"$in": keys})
+            first = dict(tight, JENJANG_KEY=jenjang) if jenjang else dict(search_filter or {}, PRODI_KEY={"$in": keys})
+            if year:
+                steps.append((dict(first, **year), TIGHT_K))
+            steps.append((first, TIGHT_K))
+            if tight != first:
+                steps.append((tight, TIGHT_K))
+        elif year:
+            steps.append((dict(search_filter or {}, **year), k))
+        if not steps:
+            continue
+        steps.append((search_filter, k))
+        if fallback_k:
+            steps.append((None, fallback_k))
+        ladders[t] = steps
+    return ladders
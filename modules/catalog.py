@@ -0,0 +1,95 @@
+import os
+import json
+import threading
+from .fee_index import normalize_jenjang
+from .kb_generations import active_generation, generation_file
+
+# Katalog program studi (JURUSAN_PROGRAM_STUDI + JENJANG) dari semua baris yang di-ingest,
+# keuangan maupun akademik. Dipakai sebagai gazetteer oleh planner berbasis aturan.
+CATALOG_PATH = os.getenv("PRODI_CATALOG_PATH", os.path.join("data", "prodi_catalog.json"))
+
+def programs_from_row(raw_meta):
+    prodi = (raw_meta.get("JURUSAN_PROGRAM_STUDI") or raw_meta.get("JENIS_LAYANAN") or "").strip().upper()
+    if not prodi or prodi == "UMUM":
+        return None
+    jenjang = normalize_jenjang(raw_meta.get("JENJANG")) or normalize_jenjang(raw_meta.get("SUB_KATEGORI")) or "S1"
+    return (prodi, jenjang)
+
+class ProgramCatalog:
+    """Daftar (prodi, jenjang) per file sumber, tersimpan di JSON dan reload via mtime"""
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._by_source = {}
+        self._mtime = None
+        self.version = 0
+
+    def _maybe_reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r") as f:
+            self._by_source = {src: [tuple(p) for p in rows] for src, rows in json.load(f).items()}
+        self._mtime = mtime
+        self.version += 1
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({src: [list(p) for p in rows] for src, rows in self._by_source.items()}, f)
+        os.replace(tmp, self.path)
+        self._mtime = os.path.getmtime(self.path)
+        self.version += 1
+
+    def replace_source(self, source, programs):
+        with self._lock:
+            self._maybe_reload()
+            programs = sorted({p for p in programs if p})
+            if programs:
+                self._by_source[source] = programs
+            else:
+                self._by_source.pop(source, None)
+            self._save()
+
+    def replace_all(self, by_source):
+        """Ganti seluruh isi dengan {source: programs} dalam satu simpan atomik"""
+        with self._lock:
+            rows = {src: sorted({p for p in programs if p}) for src, programs in by_source.items()}
+            self._by_source = {src: programs for src, programs in rows.items() if programs}
+            self._save()
+
+    def clear(self):
+        self.replace_all({})
+
+    def programs(self):
+        """Set (PRODI, JENJANG) dari seluruh sumber"""
+        with self._lock:
+            self._maybe_reload()
+            return {p for rows in self._by_source.values() for p in rows}
+
+_catalogs = {}
+_catalog_lock = threading.Lock()
+
+def get_catalog(generation=None):
+    """Katalog generasi tertentu; default generasi aktif (lihat kb_generations.generation_file)"""
+    path = generation_file(CATALOG_PATH, active_generation() if generation is None else generation)
+    with _catalog_lock:
+        if path not in _catalogs:
+            _catalogs[path] = ProgramCatalog(path)
+        return _catalogs[path]
+
+def drop_catalog(generation):
+    path = generation_file(CATALOG_PATH, generation)
+    if path == CATALOG_PATH:
+        return
+    with _catalog_lock:
+        _catalogs.pop(path, None)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
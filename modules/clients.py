@@ -0,0 +1,168 @@
+import os
+import asyncio
+import threading
+import weakref
+import httpx
+from .rate_limiter import RateLimitedChat
+
+# Registry klien tingkat proses: ChatGroq/ChatCohere dan pool HTTP keep-alive
+# dipakai bersama oleh rag_engine, rag_cohere, evaluator dan database.
+# Chat model dibungkus RateLimitedChat sehingga berbagi kuota lintas proses.
+# Klien async (httpx.AsyncClient) terikat ke event loop, sehingga disimpan per loop.
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+POOL_MAX_CONNECTIONS = _env_int("LLM_POOL_MAX_CONNECTIONS", 20)
+POOL_MAX_KEEPALIVE = _env_int("LLM_POOL_MAX_KEEPALIVE", 10)
+POOL_KEEPALIVE_EXPIRY = _env_float("LLM_POOL_KEEPALIVE_EXPIRY", 60.0)
+HTTP_TIMEOUT = _env_float("LLM_HTTP_TIMEOUT", 60.0)
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 2)
+
+_lock = threading.RLock()
+_sync_http = None
+_async_http = weakref.WeakKeyDictionary()   # loop -> httpx.AsyncClient
+_loop_models = weakref.WeakKeyDictionary()  # loop -> {key: chat model}
+_sync_models = {}                           # dipakai jika tidak ada loop aktif
+_shared = {}                                # objek tanpa ikatan loop (vectorstore, index)
+_stats = {"created": 0, "reused": 0, "http_clients": 0}
+
+def _limits():
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+    )
+
+def _current_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def get_http_client():
+    """Pool HTTP sinkron bersama (keep-alive) untuk seluruh proses"""
+    global _sync_http
+    with _lock:
+        if _sync_http is None:
+            _sync_http = httpx.Client(limits=_limits(), timeout=HTTP_TIMEOUT)
+            _stats["http_clients"] += 1
+        return _sync_http
+
+def get_async_http_client():
+    """Pool HTTP async untuk event loop yang sedang berjalan"""
+    loop = _current_loop()
+    if loop is None:
+        return None
+    with _lock:
+        client = _async_http.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=_limits(), timeout=HTTP_TIMEOUT)
+            _async_http[loop] = client
+            _stats["http_clients"] += 1
+        return client
+
+def _build_groq(model, temperature):
+    from langchain_groq import ChatGroq
+    return ChatGroq(
+        model=model,
+        temperature=temperature,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client()
+    )
+
+def _build_cohere(model, temperature):
+    import cohere
+    from langchain_cohere import ChatCohere
+    api_key = os.getenv("COHERE_API_KEY")
+    llm = ChatCohere(model=model, temperature=temperature, cohere_api_key=api_key)
+    # Ganti klien bawaan agar memakai pool keep-alive bersama
+    llm.client = cohere.Client(api_key=api_key, httpx_client=get_http_client())
+    async_http = get_async_http_client()
+    if async_http is not None:
+        llm.async_client = cohere.AsyncClient(api_key=api_key, httpx_client=async_http)
+    return llm
+
+_BUILDERS = {"groq": _build_groq, "cohere": _build_cohere}
+
+def get_chat_model(provider, model, temperature=0):
+    """Ambil chat model dari registry; dibuat sekali per (provider, model, loop)"""
+    key = (provider, model, temperature)
+    loop = _current_loop()
+    with _lock:
+        if loop is None:
+            bucket = _sync_models
+        else:
+            bucket = _loop_models.get(loop)
+            if bucket is None:
+                bucket = {}
+                _loop_models[loop] = bucket
+
+        llm = bucket.get(key)
+        if llm is not None:
+            _stats["reused"] += 1
+            return llm
+
+        # Semua panggilan LLM lewat scheduler kuota bersama (RPM/TPM per provider & model)
+        llm = RateLimitedChat(_BUILDERS[provider](model, temperature), provider, model)
+        bucket[key] = llm
+        _stats["created"] += 1
+        return llm
+
+def get_shared(key, factory):
+    """Objek singleton lintas thread/loop (mis. PineconeVectorStore)"""
+    with _lock:
+        obj = _shared.get(key)
+        if obj is None:
+            obj = factory()
+            _shared[key] = obj
+            _stats["created"] += 1
+        else:
+            _stats["reused"] += 1
+        return obj
+
+def _pool_snapshot(client):
+    # httpx tidak mengekspos statistik pool secara publik; baca defensif dari httpcore
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    conns = list(getattr(pool, "connections", []) or [])
+    idle = 0
+    for c in conns:
+        try:
+            idle += 1 if c.is_idle() else 0
+        except Exception:
+            pass
+    return {"open": len(conns), "idle": idle, "active": len(conns) - idle}
+
+def pool_metrics():
+    """Ringkasan registry & pool koneksi untuk dashboard/monitoring"""
+    with _lock:
+        pools = []
+        if _sync_http is not None:
+            pools.append(dict(kind="sync", **_pool_snapshot(_sync_http)))
+        for client in list(_async_http.values()):
+            pools.append(dict(kind="async", **_pool_snapshot(client)))
+
+        return {
+            "models_created": _stats["created"],
+            "models_reused": _stats["reused"],
+            "http_clients": _stats["http_clients"],
+            "event_loops": len(_loop_models),
+            "cached_models": len(_sync_models) + sum(len(b) for b in _loop_models.values()),
+            "shared_objects": sorted(str(k) for k in _shared),
+            "limits": {
+                "max_connections": POOL_MAX_CONNECTIONS,
+                "max_keepalive": POOL_MAX_KEEPALIVE,
+                "keepalive_expiry": POOL_KEEPALIVE_EXPIRY
+            },
+            "pools": pools
+        }
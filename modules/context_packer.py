@@ -0,0 +1,146 @@
+import os
+from .fee_index import ROMAN, normalize_kelompok, _KELOMPOK_COL_RE
+
+# Packer konteks antara Stage 4 dan Stage 5: baris CSV yang hampir identik (mis. satu baris per
+# kelompok UKT) digabung jadi satu baris ringkas, kolom kosong dibuang, lalu dipotong sesuai budget token.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "2000"))
+# Kolom yang mengidentifikasi "baris yang sama" (beda nilai di sini = baris berbeda, tidak digabung)
+IDENTITY_KEYS = {"Prodi", "Jenjang", "JURUSAN_PROGRAM_STUDI", "JENJANG", "KATEGORI", "SUB_KATEGORI",
+                 "TIPE_DATA", "JENIS_LAYANAN", "TAHUN", "TAHUN_AKADEMIK", "TA", "JALUR"}
+# Maksimal kolom yang boleh berbeda agar dua baris dianggap near-duplicate (mis. KELOMPOK + BIAYA_UKT)
+MAX_VARYING = 2
+
+def estimate_tokens(text):
+    # Perkiraan kasar ~4 karakter per token (cukup untuk budget; tanpa dependensi tokenizer)
+    return (len(text) + 3) // 4
+
+def _parse(content):
+    """'Prodi: X | Jenjang: Y | K: V ...' -> [(K, V)]; None jika bukan baris CSV"""
+    parts = content.split(" | ")
+    if len(parts) < 3:
+        return None
+    pairs = []
+    for part in parts:
+        key, sep, value = part.partition(": ")
+        if not sep or not key or " " in key.strip():
+            return None
+        pairs.append((key.strip(), value.strip()))
+    return pairs
+
+def _compact(pairs):
+    head = dict(pairs[:2])
+    out, kelompok, slot = [], [], None
+    for key, value in pairs:
+        # Kolom kosong & salinan header (JURUSAN_PROGRAM_STUDI == Prodi) tidak membawa informasi
+        if not value:
+            continue
+        if key == "JURUSAN_PROGRAM_STUDI" and value == head.get("Prodi"):
+            continue
+        if key == "JENJANG" and value == head.get("Jenjang"):
+            continue
+        # Format lebar KELOMPOK_I..VIII -> satu kolom "UKT KELOMPOK: I=..; II=.."
+        m = _KELOMPOK_COL_RE.match(key)
+        if m and normalize_kelompok(m.group(1)):
+            slot = len(out) if slot is None else slot
+            kelompok.append(f"{normalize_kelompok(m.group(1))}={value}")
+            continue
+        out.append((key, value))
+    if kelompok:
+        out.insert(slot, ("UKT KELOMPOK", "; ".join(kelompok)))
+    return out
+
+def _order(value):
+    kel = normalize_kelompok(value)
+    return (0, ROMAN.index(kel), "") if kel else (1, 0, value)
+
+def _merge(rows, varying):
+    """Gabungkan baris-baris satu grup: kolom sama ditulis sekali, kolom berbeda jadi daftar ringkas"""
+    values = [dict(r) for r in rows]
+    if len(varying) == 1:
+        key = varying[0]
+        merged = f"{key}: " + " / ".join(dict.fromkeys(v[key] for v in values))
+    else:
+        k1, k2 = varying
+        pairs = sorted(dict.fromkeys((v[k1], v[k2]) for v in values), key=lambda p: _order(p[0]))
+        merged = f"{k1} → {k2}: " + "; ".join(f"{a}={b}" for a, b in pairs)
+
+    out, placed = [], False
+    for key, value in rows[0]:
+        if key not in varying:
+            out.append(f"{key}: {value}")
+        elif not placed:
+            out.append(merged)
+            placed = True
+    return " | ".join(out)
+
+def compact_rows(rows):
+    """rows: [(content, extra)] urut skor -> [(content_ringkas, extra, jumlah_baris_asal)] urut skor.
+
+    Baris dengan extra (mis. SOURCE) dan kolom identitas yang sama, dan hanya berbeda di
+    <= MAX_VARYING kolom lain, digabung ke posisi anggota dengan skor tertinggi.
+    """
+    groups, order = {}, []
+    for i, (content, extra) in enumerate(rows):
+        pairs = _parse(content)
+        if pairs is None:
+            key = ("text", i)
+            groups[key] = {"extra": extra, "rows": None, "text": content}
+        else:
+            pairs = _compact(pairs)
+            ident = tuple((k, v) for k, v in pairs if k in IDENTITY_KEYS)
+            key = ("row", extra, tuple(k for k, _ in pairs), ident)
+            if key in groups:
+                groups[key]["rows"].append(pairs)
+                continue
+            groups[key] = {"extra": extra, "rows": [pairs]}
+        order.append(key)
+
+    out = []
+    for key in order:
+        g = groups[key]
+        if g["rows"] is None:
+            out.append((g["text"], g["extra"], 1))
+            continue
+        rows_ = g["rows"]
+        keys = [k for k, _ in rows_[0]]
+        varying = [k for k in keys if len({dict(r)[k] for r in rows_}) > 1]
+        if len(rows_) == 1 or not varying:
+            out.append((" | ".join(f"{k}: {v}" for k, v in rows_[0]), g["extra"], len(rows_)))
+        elif len(varying) <= MAX_VARYING:
+            out.append((_merge(rows_, varying), g["extra"], len(rows_)))
+        else:
+            # Terlalu banyak kolom berbeda -> bukan near-duplicate, tetap baris terpisah
+            out.extend((" | ".join(f"{k}: {v}" for k, v in r), g["extra"], 1) for r in rows_)
+    return out
+
+def pack_context(rows, render, budget=None):
+    """Susun teks konteks Stage 5 dalam budget token.
+
+    rows: [(content, extra)] urut skor; render(i, content, extra) -> satu baris konteks.
+    Hasil: (context_text, stats) dengan stats berisi penghematan token untuk debug.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    tokens_before = estimate_tokens("\n".join(render(i, c, e) for i, (c, e) in enumerate(rows)))
+
+    lines, used, dropped = [], 0, 0
+    for content, extra, _ in compact_rows(rows):
+        line = render(len(lines), content, extra)
+        cost = estimate_tokens(line) + 1
+        # Baris pertama selalu masuk; sisanya hanya jika masih muat (baris pendek di bawahnya tetap dicoba)
+        if lines and used + cost > budget:
+            dropped += 1
+            continue
+        lines.append(line)
+        used += cost
+
+    context_text = "\n".join(lines)
+    tokens_after = estimate_tokens(context_text)
+    return context_text, {
+        "rows_in": len(rows),
+        "rows_out": len(lines),
+        "rows_dropped": dropped,
+        "token_budget": budget,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after
+    }
@@ -1,29 +1,244 @@
 import os
+import time
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
 from langchain_pinecone import PineconeVectorStore
 from langchain_huggingface import HuggingFaceEndpointEmbeddings
 from dotenv import load_dotenv
+from .clients import get_shared
+from .kb_generations import active_generation, get_generation_pointer
+from .partitions import PartitionedVectorStore, FlatVectorStore
 
 load_dotenv()
 
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# "endpoint" (HF Inference, default) atau "local" (sentence-transformers di proses ini)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "endpoint").lower()
+
+# "pinecone" (default) atau "local" (index NumPy in-process, bisa offline)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join("data", "local_index"))
+
+# Konfigurasi cache embedding kueri (0 / kosong = nonaktif)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "")
+# Batch besar (ingestion) tidak masuk cache agar tidak mengusir kueri populer
+EMBED_CACHE_MAX_BATCH = int(os.getenv("EMBED_CACHE_MAX_BATCH", "32"))
+
+class CachedEmbeddings(Embeddings):
+    """Cache LRU+TTL di depan model embedding, opsional dengan tier disk (SQLite)"""
+
+    def __init__(self, base, model_name, max_size=2048, ttl=86400, persist_path=""):
+        self.base = base
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._mem = OrderedDict()  # key -> (vektor, waktu simpan)
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "bypass": 0}
+
+        if persist_path:
+            os.makedirs(os.path.dirname(persist_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS emb (key TEXT PRIMARY KEY, vec BLOB, ts REAL)")
+            self._db.commit()
+
+    def _key(self, text):
+        # all-MiniLM-L6-v2 memakai tokenizer uncased, jadi lowercase + spasi rapi aman
+        return self.model_name + "\x00" + " ".join(str(text).lower().split())
+
+    def _get(self, key, now):
+        item = self._mem.get(key)
+        if item is not None:
+            if now - item[1] <= self.ttl:
+                self._mem.move_to_end(key)
+                self.stats["hits"] += 1
+                return item[0]
+            del self._mem[key]
+
+        if self._db is not None:
+            row = self._db.execute("SELECT vec, ts FROM emb WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                vec = array("d", row[0]).tolist()
+                self._put_mem(key, vec, row[1])
+                self.stats["disk_hits"] += 1
+                return vec
+        return None
+
+    def _put_mem(self, key, vec, ts):
+        self._mem[key] = (vec, ts)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_size:
+            self._mem.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _put(self, key, vec, now):
+        self._put_mem(key, vec, now)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO emb (key, vec, ts) VALUES (?, ?, ?)",
+                (key, array("d", vec).tobytes(), now)
+            )
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if len(texts) > EMBED_CACHE_MAX_BATCH:
+            with self._lock:
+                self.stats["bypass"] += 1
+            return self.base.embed_documents(texts)
+
+        now = time.time()
+        keys = [self._key(t) for t in texts]
+        found, missing = {}, OrderedDict()
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                vec = self._get(key, now)
+                if vec is None:
+                    missing[key] = text
+                else:
+                    found[key] = vec
+            self.stats["misses"] += len(missing)
+
+        if missing:
+            # Hanya teks yang belum pernah dilihat yang dikirim ke endpoint (tetap satu batch)
+            vectors = self.base.embed_documents(list(missing.values()))
+            with self._lock:
+                for key, vec in zip(missing, vectors):
+                    vec = list(vec)
+                    found[key] = vec
+                    self._put(key, vec, now)
+                if self._db is not None:
+                    self._db.commit()
+
+        return [found[k] for k in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def get_stats(self):
+        with self._lock:
+            total = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hit_rate = (self.stats["hits"] + self.stats["disk_hits"]) / total if total else 0.0
+            return dict(self.stats, size=len(self._mem), max_size=self.max_size, hit_rate=round(hit_rate, 3))
+
 # Singleton untuk efisiensi koneksi
 _embeddings = None
+_embeddings_lock = threading.Lock()
 
 def get_embeddings():
     global _embeddings
-    if _embeddings is None:
-        # Menghapus parameter 'timeout' agar tidak memicu ValidationError Pydantic
-        _embeddings = HuggingFaceEndpointEmbeddings(
-            model="sentence-transformers/all-MiniLM-L6-v2",
-            huggingfacehub_api_token=os.getenv("HUGGINGFACE_API_KEY")
-        )
-    return _embeddings
-
-def get_vectorstore():
-    embeddings = get_embeddings()
-    index_name = os.getenv("PINECONE_INDEX_NAME")
-    
-    return PineconeVectorStore(
-        index_name=index_name,
-        embedding=embeddings,
-        pinecone_api_key=os.getenv("PINECONE_API_KEY")
-    )
\ No newline at end of file
+    if _embeddings is not None:
+        return _embeddings
+    # Lock agar model lokal tidak dimuat dua kali oleh thread yang berbeda
+    with _embeddings_lock:
+        if _embeddings is not None:
+            return _embeddings
+        if EMBEDDING_BACKEND == "local":
+            # Model dimuat sekali di proses ini; inferensi CPU dengan micro-batching
+            from .local_embeddings import LocalBatchedEmbeddings
+            base = LocalBatchedEmbeddings(EMBED_MODEL)
+        else:
+            # Menghapus parameter 'timeout' agar tidak memicu ValidationError Pydantic
+            base = HuggingFaceEndpointEmbeddings(
+                model=EMBED_MODEL,
+                huggingfacehub_api_token=os.getenv("HUGGINGFACE_API_KEY")
+            )
+        if EMBED_CACHE_SIZE > 0:
+            base = CachedEmbeddings(
+                base, EMBED_MODEL,
+                max_size=EMBED_CACHE_SIZE,
+                ttl=EMBED_CACHE_TTL,
+                persist_path=EMBED_CACHE_PATH
+            )
+        _embeddings = base
+        return _embeddings
+
+def embedding_cache_stats():
+    emb = get_embeddings()
+    stats = emb.get_stats() if isinstance(emb, CachedEmbeddings) else {}
+    base = emb.base if isinstance(emb, CachedEmbeddings) else emb
+    stats["backend"] = EMBEDDING_BACKEND
+    if hasattr(base, "get_stats"):
+        stats["local"] = base.get_stats()
+    return stats
+
+def _build_index():
+    from pinecone import Pinecone
+
+    # Index Pinecone dengan pool koneksi urllib3 yang dipakai ulang antar request
+    pool_threads = int(os.getenv("PINECONE_POOL_THREADS", "8"))
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=pool_threads)
+    return pc.Index(
+        name=os.getenv("PINECONE_INDEX_NAME"),
+        pool_threads=pool_threads,
+        connection_pool_maxsize=int(os.getenv("PINECONE_POOL_MAXSIZE", str(pool_threads)))
+    )
+
+def _build_local_vectorstore():
+    from .local_index import LocalVectorStore
+    return LocalVectorStore(get_embeddings(), persist_dir=LOCAL_INDEX_DIR)
+
+def _generation_store(ns):
+    # Store dasar satu generasi (namespace = nama generasi); partisi diakses lewat argumen namespace
+    if VECTOR_BACKEND == "local":
+        base = get_shared("local_vectorstore", _build_local_vectorstore)
+        return get_shared(f"local_vectorstore:{ns}", lambda: base.with_namespace(ns))
+    index = get_shared("pinecone_index", _build_index)
+    return get_shared(f"pinecone_vectorstore:{ns}",
+                      lambda: PineconeVectorStore(index=index, embedding=get_embeddings(), namespace=ns or None))
+
+def _namespaces(generation):
+    """Semua namespace milik satu generasi (generasi flat: satu, terpartisi: satu per partisi)"""
+    info = get_generation_pointer().info(generation)
+    if info.get("layout") == "partitioned":
+        return [f"{generation}/{p}" for p in info.get("partitions", [])]
+    return [generation]
+
+def get_vectorstore(generation=None):
+    """Vectorstore untuk generasi KB aktif (pointer kb_generations) atau generasi tertentu (staging).
+
+    Satu request cukup memanggil ini sekali: cutover di tengah request tidak mencampur dua generasi.
+    Generasi terpartisi dibungkus PartitionedVectorStore (fan-out per KATEGORI/JENJANG), generasi flat hasil
+    begin() dibungkus FlatVectorStore (meta_keys + BM25 yang sama); generasi legacy memakai store dasar apa adanya.
+    """
+    ns = active_generation() if generation is None else generation
+    info = get_generation_pointer().info(ns)
+    # Dibuat sekali per proses (per generasi) lewat registry klien bersama; koneksi/index dipakai bersama
+    if info.get("layout") == "partitioned":
+        return get_shared(f"partitioned_vectorstore:{ns}", lambda: PartitionedVectorStore(_generation_store(ns), ns))
+    if info.get("meta_keys") or info.get("lexical"):
+        return get_shared(f"flat_vectorstore:{ns}", lambda: FlatVectorStore(_generation_store(ns), ns))
+    return _generation_store(ns)
+
+def generation_size(generation):
+    """Jumlah vektor di satu generasi (Pinecone: statistik index, eventual consistent)"""
+    if VECTOR_BACKEND == "local":
+        base = get_shared("local_vectorstore", _build_local_vectorstore)
+        return sum(base.with_namespace(ns).count() for ns in _namespaces(generation))
+    stats = get_shared("pinecone_index", _build_index).describe_index_stats()
+    namespaces = stats.get("namespaces", {}) if isinstance(stats, dict) else getattr(stats, "namespaces", {})
+    total = 0
+    for ns in _namespaces(generation):
+        info = namespaces.get(ns or "", {})
+        total += info.get("vector_count", 0) if isinstance(info, dict) else getattr(info, "vector_count", 0)
+    return total
+
+def drop_generation(generation):
+    """Hapus seluruh isi generasi (semua namespace/partisinya); generasi aktif tidak pernah disentuh pemanggil"""
+    for ns in _namespaces(generation):
+        if VECTOR_BACKEND == "local":
+            get_shared("local_vectorstore", _build_local_vectorstore).drop_namespace(ns)
+            continue
+        try:
+            get_shared("pinecone_index", _build_index).delete(delete_all=True, namespace=ns or None)
+        except Exception as e:
+            # Namespace yang belum pernah ditulisi -> 404 dari Pinecone, dianggap sudah bersih
+            if "not found" not in str(e).lower():
+                raise
@@ -0,0 +1,68 @@
+import re
+from datetime import date
+
+# Resolver tahun akademik deterministik: frasa waktu bahasa Indonesia ("tahun ini", "2024/2025", "TA 2023",
+# "semester genap", "angkatan 2022") -> kunci tahun akademik "YYYY/YYYY+1". Dipakai fast planner & engine
+# (tanpa LLM) dan saat ingest untuk kolom metadata TA_KEY yang bisa difilter.
+# Tahun akademik dimulai Agustus: Agustus-Januari = semester ganjil, Februari-Juli = semester genap.
+TA_START_MONTH = 8
+UNDATED = "UMUM"
+
+_RANGE_RE = re.compile(r"(?<!\d)(20\d{2})\s*[/\-–]\s*(20\d{2}|\d{2})(?!\d)")
+_YEAR_RE = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+_RELATIVE_RE = re.compile(r"\b(?:tahun|ta|tahun akademik|angkatan)\s+(ini|sekarang|depan|lalu|kemarin|sebelumnya)\b")
+_SEMESTER_RE = re.compile(r"\bsemester\s+(ganjil|genap)\b")
+RELATIVE_OFFSET = {"ini": 0, "sekarang": 0, "depan": 1, "lalu": -1, "kemarin": -1, "sebelumnya": -1}
+# Kata waktu yang sudah ditangani resolver (diabaikan gazetteer prodi)
+DATE_WORDS = {"ta", "akademik", "angkatan", "semester", "ganjil", "genap", "sekarang", "depan", "lalu",
+              "kemarin", "sebelumnya"}
+
+def academic_year(start):
+    """2024 -> "2024/2025" """
+    start = int(start)
+    return f"{start}/{start + 1}"
+
+def current_start(today=None):
+    today = today or date.today()
+    return today.year if today.month >= TA_START_MONTH else today.year - 1
+
+def academic_year_key(value):
+    """Kunci tahun akademik dari nilai sel/teks ("2024/2025", "2024-25", "TA 2024", "2024"); None jika tidak ada"""
+    text = str(value or "")
+    m = _RANGE_RE.search(text)
+    if m:
+        return academic_year(m.group(1))
+    m = _YEAR_RE.search(text)
+    return academic_year(m.group(1)) if m else None
+
+def resolve_dates(query, today=None):
+    """{"academic_years": [kunci], "years": [tahun mulai], "semester": "GANJIL"|"GENAP"|None}
+
+    "years" (tahun mulai, str) kompatibel dengan plan["years"] lama (index tarif, boosting, cache key).
+    """
+    text = str(query or "").lower()
+    starts = []
+
+    for m in _RANGE_RE.finditer(text):
+        starts.append(int(m.group(1)))
+    # Tahun tunggal di luar rentang ("TA 2023", "angkatan 2022", "UKT 2024") = tahun akademik yang dimulai tahun itu
+    text_wo_ranges = _RANGE_RE.sub(" ", text)
+    starts += [int(y) for y in _YEAR_RE.findall(text_wo_ranges)]
+
+    for m in _RELATIVE_RE.finditer(text):
+        starts.append(current_start(today) + RELATIVE_OFFSET[m.group(1)])
+
+    semester = None
+    m = _SEMESTER_RE.search(text)
+    if m:
+        semester = m.group(1).upper()
+        if not starts:
+            # "semester genap" tanpa tahun -> tahun akademik berjalan
+            starts.append(current_start(today))
+
+    starts = list(dict.fromkeys(starts))
+    return {
+        "academic_years": [academic_year(s) for s in starts],
+        "years": [str(s) for s in starts],
+        "semester": semester
+    }
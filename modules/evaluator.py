@@ -1,11 +1,12 @@
 import json
 import re
-from langchain_groq import ChatGroq
+from .clients import get_chat_model
+from .rate_limiter import llm_priority
 
 class RAGEvaluator:
     def __init__(self):
         # Menggunakan Llama 3.3 70B sebagai Auditor karena akurasi penalarannya tinggi
-        self.auditor = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
+        self.auditor = get_chat_model("groq", "llama-3.3-70b-versatile")
 
     async def evaluate_answer(self, query, answer, context):
         eval_system = """Tugas: Kamu adalah auditor ahli UIN Jakarta. 
@@ -26,10 +27,12 @@ Output WAJIB JSON: {"score": 1-10, "reason": "penjelasan singkat"}"""
         )
         
         try:
-            res = (await self.auditor.ainvoke([
-                {"role": "system", "content": eval_system},
-                {"role": "user", "content": user_content}
-            ])).content
+            # Prioritas evaluasi: tidak boleh menghabiskan kuota cadangan untuk live chat
+            with llm_priority("evaluation"):
+                res = (await self.auditor.ainvoke([
+                    {"role": "system", "content": eval_system},
+                    {"role": "user", "content": user_content}
+                ])).content
             
             # Parsing JSON dari response
             match = re.search(r'\{.*\}', res, re.DOTALL)
@@ -1,17 +1,13 @@
 import json
 import re
-import os
-from langchain_cohere import ChatCohere
+from .clients import get_chat_model
+from .rate_limiter import llm_priority
 
 class RAGEvaluator:
     def __init__(self):
         # Menggunakan model Command R sebagai Auditor 
         # Model ini sangat bagus dalam membandingkan fakta (Grounding)
-        self.auditor = ChatCohere(
-            model="command-r-08-2024", 
-            temperature=0,
-            cohere_api_key=os.getenv("COHERE_API_KEY")
-        )
+        self.auditor = get_chat_model("cohere", "command-r-08-2024")
 
     async def evaluate_answer(self, query, answer, context):
         eval_system = """Tugas: Kamu adalah auditor ahli UIN Jakarta. 
@@ -33,10 +29,12 @@ Output WAJIB JSON murni: {"score": 1-10, "reason": "penjelasan singkat"}"""
         
         try:
             # Menggunakan ainvoke untuk mendukung concurrency di Dashboard Streamlit
-            res = (await self.auditor.ainvoke([
-                {"role": "system", "content": eval_system},
-                {"role": "user", "content": user_content}
-            ])).content
+            # Prioritas evaluasi: tidak boleh menghabiskan kuota cadangan untuk live chat
+            with llm_priority("evaluation"):
+                res = (await self.auditor.ainvoke([
+                    {"role": "system", "content": eval_system},
+                    {"role": "user", "content": user_content}
+                ])).content
             
             # Parsing JSON dari response
             match = re.search(r'\{.*\}', res, re.DOTALL)
@@ -0,0 +1,185 @@
+import os
+import re
+import string
+import difflib
+import threading
+from .catalog import get_catalog
+from .fee_index import DEGREE_ALIASES, PRODI_NOISE_RE, normalize_prodi
+from .date_resolver import resolve_dates, DATE_WORDS
+
+# Planner deterministik (Stage 1 fast-path): gazetteer nama prodi hasil ingest + alias jenjang,
+# keyword intent yang sama dengan aturan planner_system. LLM hanya dipanggil jika confidence rendah.
+FAST_PLANNER_THRESHOLD = float(os.getenv("FAST_PLANNER_THRESHOLD", "0.8"))
+FUZZY_CUTOFF = float(os.getenv("FAST_PLANNER_FUZZY_CUTOFF", "0.85"))
+
+FINANCE_KEYWORDS = ("ukt", "biaya", "tarif", "spp", "semester", "bayar", "total", "hitung",
+                    "mahal", "murah", "lebih", "bandingkan", "harga", "kelompok",
+                    "pembayaran", "membayar", "dibayar", "menghitung", "perhitungan", "membandingkan",
+                    "termahal", "termurah")
+DESKRIPSI_KEYWORDS = ("jelaskan", "profil", "deskripsi", "tentang", "akreditasi", "visi", "misi",
+                      "prospek", "kurikulum", "gelar", "lulusan", "fakultas", "menjelaskan")
+
+def _keyword_re(words):
+    # Utuh per kata (+ akhiran -nya/-kan/-an): "misi" tidak cocok di "komisi", "visi" tidak di "divisi".
+    # Bentuk berimbuhan awalan didaftarkan eksplisit di atas (awalan generik "per"/"di" memicu "permisi"/"divisi").
+    return re.compile(r"\b(?:" + "|".join(words) + r")(?:nya|kan|an)?\b")
+
+_FINANCE_RE = _keyword_re(FINANCE_KEYWORDS)
+_DESKRIPSI_RE = _keyword_re(DESKRIPSI_KEYWORDS)
+# Kelompok UKT sering ditulis romawi ("kelompok iii"), bukan kata isi
+_ROMAN_RE = re.compile(r"[ivx]+")
+
+DEGREE_LABEL = {"S1": "S1", "S2": "S2", "S3": "S3", "PROFESI": "Profesi", "D3": "D3"}
+STOPWORDS = {
+    "berapa", "untuk", "yang", "dan", "atau", "di", "ke", "dari", "pada", "uin", "jakarta", "syarif",
+    "hidayatullah", "mana", "satu", "prodi", "program", "studi", "jurusan", "apa", "adalah", "saya",
+    "ingin", "tahu", "tahun", "vs", "antara", "dengan", "per", "itu", "ini", "urutkan", "selama",
+    "kuliah", "wni", "wna", "pendaftaran", "jalur", "mandiri", "tolong", "mohon", "info", "informasi",
+    "mau", "tanya", "bagaimana", "apakah", "berapakah", "kak", "min", "sih", "nya"
+} | set(FINANCE_KEYWORDS) | set(DESKRIPSI_KEYWORDS) | set(DEGREE_ALIASES) | DATE_WORDS
+
+def _clean(text):
+    # Normalisasi sama dengan normalize_prodi (tanpa membuang kata jenjang) agar pola gazetteer cocok
+    t = re.sub(r"[^\w\s]", " ", str(text).lower())
+    return " ".join(PRODI_NOISE_RE.sub(" ", t).split())
+
+class _Gazetteer:
+    """Matcher multi-pattern (satu regex alternasi, nama terpanjang dulu) + indeks fuzzy per jumlah kata"""
+
+    def __init__(self, programs):
+        self.display, self.jenjangs = {}, {}
+        for prodi, jenjang in programs:
+            norm = normalize_prodi(prodi)
+            if not norm:
+                continue
+            # Nama tampilan tanpa kata jenjang, karena jenjang ditambahkan sebagai prefix entitas
+            words = [w for w in prodi.split() if w.lower().strip("()") not in DEGREE_ALIASES]
+            self.display[norm] = string.capwords(" ".join(words).lower())
+            self.jenjangs.setdefault(norm, set()).add(jenjang)
+
+        ordered = sorted(self.display, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(" + "|".join(re.escape(n) for n in ordered) + r")\b") if ordered else None
+        self.by_words = {}
+        for norm in self.display:
+            self.by_words.setdefault(len(norm.split()), []).append(norm)
+
+    def exact(self, text):
+        return [(m.group(1), m.start(), m.end()) for m in self.pattern.finditer(text)] if self.pattern else []
+
+    def fuzzy(self, tokens):
+        """Cocokkan n-gram token sisa ke nama prodi (toleransi typo); hasil: [(norm, i, j, rasio)]"""
+        found, i = [], 0
+        while i < len(tokens):
+            best = None
+            for n in sorted(self.by_words, reverse=True):
+                gram = " ".join(tokens[i:i + n])
+                if len(tokens[i:i + n]) < n or len(gram) < 4:
+                    continue
+                match = difflib.get_close_matches(gram, self.by_words[n], n=1, cutoff=FUZZY_CUTOFF)
+                if match:
+                    ratio = difflib.SequenceMatcher(None, gram, match[0]).ratio()
+                    if best is None or ratio > best[3]:
+                        best = (match[0], i, i + n, ratio)
+            if best:
+                found.append(best)
+                i = best[2]
+            else:
+                i += 1
+        return found
+
+_gaz = None
+_gaz_version = None
+_gaz_lock = threading.Lock()
+
+def _get_gazetteer():
+    global _gaz, _gaz_version
+    catalog = get_catalog()
+    programs = catalog.programs()
+    with _gaz_lock:
+        if _gaz is None or _gaz_version != (catalog.path, catalog.version):
+            _gaz = _Gazetteer(programs)
+            _gaz_version = (catalog.path, catalog.version)
+        return _gaz
+
+def _degree_near(tokens, start, end):
+    # Jenjang biasanya tepat sebelum nama prodi ("S1 Agribisnis", "Magister (S2) Hukum"), kadang sesudahnya
+    before = [i for i in range(max(0, start - 3), start) if tokens[i] in DEGREE_ALIASES]
+    if before:
+        return DEGREE_ALIASES[tokens[before[-1]]], before
+    after = [i for i in range(end, min(len(tokens), end + 2)) if tokens[i] in DEGREE_ALIASES]
+    if after:
+        return DEGREE_ALIASES[tokens[after[0]]], after
+    return None, []
+
+def detect_intent(text):
+    """(intent, batas confidence) dari keyword; campuran FINANCE+DESKRIPSI / tanpa keyword -> ke planner LLM"""
+    text = _clean(text)
+    is_finance = bool(_FINANCE_RE.search(text))
+    is_desc = bool(_DESKRIPSI_RE.search(text))
+    if is_finance and is_desc:
+        return "FINANCE", 0.6
+    if is_finance:
+        return "FINANCE", 1.0
+    if is_desc:
+        return "DESKRIPSI", 1.0
+    return "UMUM", 0.5
+
+def fast_plan(query):
+    """Plan dict {"entities","intent","years"} + "confidence"; tanpa panggilan LLM"""
+    text = _clean(query)
+    tokens = text.split()
+    gaz = _get_gazetteer()
+
+    # Posisi karakter -> indeks token, untuk memetakan hasil regex ke token
+    offsets, pos = [], 0
+    for tok in tokens:
+        offsets.append(pos)
+        pos += len(tok) + 1
+
+    spans = []
+    for norm, s, e in gaz.exact(text):
+        spans.append((norm, offsets.index(s), offsets.index(s) + len(norm.split()), 1.0))
+
+    covered = {i for _, a, b, _ in spans for i in range(a, b)}
+    leftover = [t if i not in covered and t not in STOPWORDS and not t.isdigit() else "" for i, t in enumerate(tokens)]
+    if any(leftover) and gaz.pattern is not None:
+        # Fuzzy hanya di region token yang belum tercakup
+        for norm, a, b, ratio in gaz.fuzzy(leftover):
+            if all(leftover[a:b]):
+                spans.append((norm, a, b, ratio))
+    spans.sort(key=lambda x: x[1])
+    # Kata isi yang tetap tak tercakup setelah fuzzy -> kemungkinan prodi tak dikenal ("... atau psikologi")
+    covered = {i for _, a, b, _ in spans for i in range(a, b)}
+    unknown = [t for i, t in enumerate(tokens) if i not in covered and t not in STOPWORDS and not t.isdigit()
+               and not (_ROMAN_RE.fullmatch(t) or _FINANCE_RE.fullmatch(t) or _DESKRIPSI_RE.fullmatch(t))]
+
+    entities, confidence, used_degrees = [], 1.0, set()
+    for norm, a, b, ratio in spans:
+        jenjang, deg_pos = _degree_near(tokens, a, b)
+        if deg_pos:
+            used_degrees.update(deg_pos)
+        elif len(gaz.jenjangs.get(norm, ())) == 1:
+            jenjang = next(iter(gaz.jenjangs[norm]))
+        label = f"{DEGREE_LABEL.get(jenjang, jenjang)} {gaz.display[norm]}" if jenjang else gaz.display[norm]
+        if label not in entities:
+            entities.append(label)
+        confidence = min(confidence, ratio)
+
+    if not entities:
+        confidence = 0.0
+    # Ada jenjang yang tidak menempel ke prodi manapun -> kemungkinan prodi tak dikenal
+    if any(tok in DEGREE_ALIASES and i not in used_degrees for i, tok in enumerate(tokens)):
+        confidence = min(confidence, 0.5)
+    if unknown:
+        confidence = min(confidence, 0.5)
+
+    intent, cap = detect_intent(text)
+    confidence = min(confidence, cap)
+
+    return {
+        "entities": entities[:5],
+        "intent": intent,
+        "years": resolve_dates(query)["years"],
+        "planner": "rules",
+        "confidence": round(confidence, 3)
+    }
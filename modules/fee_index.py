@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import threading
+from typing import NamedTuple, Optional
+from .kb_generations import active_generation, generation_file
+
+# Index tarif terstruktur: dibangun saat upload admin dari kolom CSV yang sudah dinormalisasi,
+# lalu dipakai engine untuk menjawab intent FINANCE secara eksak tanpa vector search.
+FEE_INDEX_PATH = os.getenv("FEE_INDEX_PATH", os.path.join("data", "fee_index.json"))
+
+ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X"]
+DEGREE_ALIASES = {
+    "s1": "S1", "sarjana": "S1",
+    "s2": "S2", "magister": "S2", "master": "S2", "pascasarjana": "S2",
+    "s3": "S3", "doktor": "S3", "doktoral": "S3",
+    "profesi": "PROFESI", "d3": "D3", "diploma": "D3"
+}
+_DEGREE_RE = re.compile(r"\b(" + "|".join(DEGREE_ALIASES) + r")\b", re.IGNORECASE)
+_KELOMPOK_COL_RE = re.compile(r"^(?:KELOMPOK|KEL|UKT)[_\s]*(?:UKT[_\s]*)?([IVX]+|\d+)$")
+_KELOMPOK_QUERY_RE = re.compile(r"\bkelompok\s*(?:ukt\s*)?([ivx]+|\d+)\b", re.IGNORECASE)
+_YEAR_RE = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+# Kata pengisi yang diabaikan saat mencocokkan nama prodi ("Bahasa dan Sastra Arab" == "Bahasa Sastra Arab")
+PRODI_NOISE_RE = re.compile(r"\b(prodi|program|studi|jurusan|dan)\b")
+
+# Kolom nominal yang tidak berjenjang kelompok
+FLAT_FEE_COLUMNS = ("TARIF_WNI", "TARIF_WNA", "TARIF", "BIAYA", "BIAYA_UKT", "SPP", "BIAYA_PENDIDIKAN", "NOMINAL")
+LONG_FEE_COLUMNS = ("BIAYA_UKT", "UKT", "TARIF", "NOMINAL", "BIAYA")
+YEAR_COLUMNS = ("TAHUN_AKADEMIK", "TAHUN", "TA")
+
+class FeeRecord(NamedTuple):
+    prodi: str
+    jenjang: str
+    kelompok: Optional[str]
+    year: Optional[str]
+    label: str
+    amount: str
+    source: str
+    content: str
+
+def normalize_jenjang(text):
+    m = _DEGREE_RE.search(str(text or ""))
+    return DEGREE_ALIASES[m.group(1).lower()] if m else None
+
+def normalize_kelompok(value):
+    v = str(value or "").strip().upper()
+    if v.isdigit():
+        n = int(v)
+        return ROMAN[n - 1] if 1 <= n <= len(ROMAN) else None
+    return v if v in ROMAN else None
+
+def kelompok_from_query(query):
+    m = _KELOMPOK_QUERY_RE.search(str(query or ""))
+    return normalize_kelompok(m.group(1)) if m else None
+
+def normalize_prodi(text):
+    t = _DEGREE_RE.sub(" ", str(text or "").lower())
+    t = re.sub(r"[^\w\s]", " ", t)
+    t = PRODI_NOISE_RE.sub(" ", t)
+    return " ".join(t.split())
+
+def _row_year(raw_meta, source):
+    for col in YEAR_COLUMNS:
+        m = _YEAR_RE.search(raw_meta.get(col, ""))
+        if m:
+            return m.group(1)
+    m = _YEAR_RE.search(source or "")
+    return m.group(1) if m else None
+
+def fee_records_from_row(raw_meta, content, source):
+    """Ubah satu baris CSV (key UPPERCASE) menjadi daftar FeeRecord; [] jika bukan baris tarif"""
+    if raw_meta.get("KATEGORI", "KEUANGAN").upper() != "KEUANGAN":
+        return []
+    prodi = raw_meta.get("JURUSAN_PROGRAM_STUDI") or raw_meta.get("JENIS_LAYANAN") or ""
+    if not prodi or prodi.upper() == "UMUM":
+        return []
+
+    jenjang = normalize_jenjang(raw_meta.get("JENJANG")) or normalize_jenjang(raw_meta.get("SUB_KATEGORI")) or "S1"
+    year = _row_year(raw_meta, source)
+    prodi = prodi.upper()
+    records = []
+
+    def add(kelompok, label, amount):
+        if str(amount).strip():
+            records.append(FeeRecord(prodi, jenjang, kelompok, year, label, str(amount).strip(), source, content))
+
+    # Format lebar: kolom KELOMPOK_I..KELOMPOK_VIII
+    for col, val in raw_meta.items():
+        m = _KELOMPOK_COL_RE.match(col)
+        if m:
+            add(normalize_kelompok(m.group(1)), "UKT", val)
+
+    # Format panjang: satu kolom KELOMPOK + satu kolom nominal
+    if not records and raw_meta.get("KELOMPOK"):
+        for col in LONG_FEE_COLUMNS:
+            if raw_meta.get(col):
+                add(normalize_kelompok(raw_meta["KELOMPOK"]), col, raw_meta[col])
+                break
+
+    # Tarif flat (mis. S2: TARIF_WNI / TARIF_WNA)
+    if not records:
+        for col in FLAT_FEE_COLUMNS:
+            if raw_meta.get(col):
+                add(None, col, raw_meta[col])
+
+    return records
+
+class FeeIndex:
+    """Index in-memory (prodi, jenjang, kelompok, tahun) -> FeeRecord, tersimpan di JSON"""
+
+    def __init__(self, path=FEE_INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._by_source = {}
+        self._by_key = {}
+        self._keys_by_prodi = {}
+        self._by_prodi = {}
+        self._mtime = None
+
+    def _rebuild(self):
+        self._by_key, self._keys_by_prodi, self._by_prodi = {}, {}, {}
+        for records in self._by_source.values():
+            for r in records:
+                key = (r.prodi, r.jenjang, r.kelompok, r.year)
+                self._by_key.setdefault(key, []).append(r)
+                self._keys_by_prodi.setdefault(r.prodi, set()).add(key)
+                self._by_prodi.setdefault(normalize_prodi(r.prodi), set()).add(r.prodi)
+
+    def _maybe_reload(self):
+        # File bisa diperbarui proses lain (admin Streamlit) -> cek mtime, murah
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        self._by_source = {src: [FeeRecord(*r) for r in rows] for src, rows in data.items()}
+        self._rebuild()
+        self._mtime = mtime
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({src: [list(r) for r in rows] for src, rows in self._by_source.items()}, f)
+        os.replace(tmp, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def replace_source(self, source, records):
+        with self._lock:
+            self._maybe_reload()
+            self._by_source[source] = list(records)
+            if not self._by_source[source]:
+                del self._by_source[source]
+            self._rebuild()
+            self._save()
+
+    def replace_all(self, by_source):
+        """Ganti seluruh isi dengan {source: records} dalam satu simpan atomik"""
+        with self._lock:
+            self._by_source = {src: list(records) for src, records in by_source.items() if records}
+            self._rebuild()
+            self._save()
+
+    def clear(self):
+        self.replace_all({})
+
+    def prodi_names(self):
+        with self._lock:
+            self._maybe_reload()
+            return sorted({p for names in self._by_prodi.values() for p in names})
+
+    def resolve_prodi(self, entity):
+        """Cocokkan entitas planner ke nama prodi di index (eksak > terkandung > unik parsial)"""
+        norm = normalize_prodi(entity)
+        if not norm:
+            return []
+        if norm in self._by_prodi:
+            return sorted(self._by_prodi[norm])
+
+        padded = f" {norm} "
+        contained = [k for k in self._by_prodi if f" {k} " in padded]
+        if contained:
+            best = max(contained, key=len)
+            return sorted(self._by_prodi[best])
+
+        partial = [k for k in self._by_prodi if padded in f" {k} "]
+        if len(partial) == 1:
+            return sorted(self._by_prodi[partial[0]])
+        return []
+
+    def lookup(self, entity, kelompok=None, years=None):
+        """Baris tarif eksak untuk satu entitas; [] berarti miss (engine fallback ke dense).
+
+        Tahun diminta ("tahun ini") tapi belum ada barisnya -> batasan tahun dilepas, sama dengan
+        ladder filter vector (TA_KEY dilonggarkan jika kosong); tahun di konten tetap terbaca judge.
+        """
+        with self._lock:
+            self._maybe_reload()
+            prodis = self.resolve_prodi(entity)
+            if not prodis:
+                return []
+            jenjang = normalize_jenjang(entity)
+            years = [str(y) for y in (years or [])]
+            keys = sorted(k for p in prodis for k in self._keys_by_prodi.get(p, ()))
+            return self._match(keys, jenjang, kelompok, years) or (self._match(keys, jenjang, kelompok, []) if years else [])
+
+    def _match(self, keys, jenjang, kelompok, years):
+        hits = []
+        for key in keys:
+            prodi, jj, kel, year = key
+            if jenjang and jj != jenjang:
+                continue
+            if kelompok and kel not in (kelompok, None):
+                continue
+            if years and year and not any(y in year for y in years):
+                continue
+            hits.extend(self._by_key[key])
+        return hits
+
+_fee_indexes = {}
+_fee_lock = threading.Lock()
+
+def get_fee_index(generation=None):
+    """Index tarif generasi tertentu; default generasi aktif (lihat kb_generations.generation_file)"""
+    path = generation_file(FEE_INDEX_PATH, active_generation() if generation is None else generation)
+    with _fee_lock:
+        if path not in _fee_indexes:
+            _fee_indexes[path] = FeeIndex(path)
+        return _fee_indexes[path]
+
+def drop_fee_index(generation):
+    path = generation_file(FEE_INDEX_PATH, generation)
+    if path == FEE_INDEX_PATH:
+        return
+    with _fee_lock:
+        _fee_indexes.pop(path, None)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def lookup_fees(targets, query, years=None):
+    """{target: [FeeRecord]} untuk target yang berhasil di-resolve ke index tarif"""
+    index = get_fee_index()
+    kelompok = kelompok_from_query(query)
+    hits = {}
+    for t in targets:
+        records = index.lookup(t, kelompok=kelompok, years=years)
+        if records:
+            hits[t] = records
+    return hits
+
+# Skor dasar hasil lookup eksak: selalu di atas skor cosine hasil vector search
+STRUCTURED_SCORE = 1000000
+
+def fee_documents(hits):
+    """Konversi hasil lookup_fees ke format (Document, skor) seperti hasil vector search"""
+    from langchain_core.documents import Document
+
+    results, seen = [], set()
+    for records in hits.values():
+        for r in records:
+            if r.content in seen:
+                continue
+            seen.add(r.content)
+            meta = {"SOURCE": r.source, "JENJANG": r.jenjang, "KATEGORI": "KEUANGAN",
+                    "JURUSAN_PROGRAM_STUDI": r.prodi, "LOOKUP": "STRUCTURED"}
+            results.append((Document(page_content=r.content, metadata=meta), STRUCTURED_SCORE))
+    return results
@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+
+# Hedged request untuk judge: jika model primary belum selesai setelah delay (~p95 latensinya),
+# model fallback ikut ditembakkan; yang pertama selesai dipakai, yang lain dibatalkan.
+HEDGE_ENABLED = os.getenv("JUDGE_HEDGE_ENABLED", "1") == "1"
+HEDGE_QUANTILE = float(os.getenv("JUDGE_HEDGE_QUANTILE", "0.95"))
+# Delay awal sebelum sampel latensi cukup, dan batas bawah delay hasil tuning
+HEDGE_DEFAULT_DELAY = float(os.getenv("JUDGE_HEDGE_DEFAULT_DELAY", "6"))
+HEDGE_MIN_DELAY = float(os.getenv("JUDGE_HEDGE_MIN_DELAY", "1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("JUDGE_HEDGE_MIN_SAMPLES", "20"))
+# Batas biaya ekstra: maksimal fraksi request (jendela bergulir) yang boleh di-hedge
+HEDGE_MAX_RATIO = float(os.getenv("JUDGE_HEDGE_MAX_RATIO", "0.1"))
+HEDGE_WINDOW = int(os.getenv("JUDGE_HEDGE_WINDOW", "200"))
+
+class LatencyTracker:
+    """Latensi terakhir per model (jendela bergulir) + rasio request yang di-hedge"""
+
+    def __init__(self, window=HEDGE_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._hedged = deque(maxlen=window)
+        self.window = window
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_skips": 0}
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key, q=HEDGE_QUANTILE):
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def delay(self, key):
+        q = self.quantile(key)
+        return HEDGE_DEFAULT_DELAY if q is None else max(HEDGE_MIN_DELAY, q)
+
+    def allow_hedge(self):
+        # Maksimal HEDGE_MAX_RATIO x window hedge dalam `window` request terakhir
+        with self._lock:
+            return sum(self._hedged) < max(1, HEDGE_MAX_RATIO * self.window)
+
+    def finish(self, hedged, fallback_won=False):
+        with self._lock:
+            self._hedged.append(1 if hedged else 0)
+            self.stats["requests"] += 1
+            self.stats["hedged"] += int(hedged)
+            self.stats["hedge_wins"] += int(fallback_won)
+
+    def skip(self):
+        with self._lock:
+            self.stats["budget_skips"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            keys = list(self._samples)
+        stats["p95"] = {k: self.quantile(k) for k in keys}
+        return stats
+
+_tracker = LatencyTracker()
+
+def latency_stats():
+    return _tracker.get_stats()
+
+async def _cancel(task):
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+async def hedged_invoke(prompt, primary, fallback):
+    """primary/fallback: (nama, model). Hasil: (response, nama model, info hedge).
+
+    Semantik lama tetap: primary gagal -> fallback. Tambahan: primary lambat -> fallback ikut
+    berlomba (jika kuota hedge masih ada), pemenang pertama yang sukses dipakai.
+    """
+    (p_name, p_model), (f_name, f_model) = primary, fallback
+    started = time.perf_counter()
+
+    async def timed(name, model):
+        t0 = time.perf_counter()
+        res = await model.ainvoke(prompt)
+        _tracker.record(name, time.perf_counter() - t0)
+        return res
+
+    p_task = asyncio.ensure_future(timed(p_name, p_model))
+    delay = _tracker.delay(p_name)
+    done, _ = await asyncio.wait({p_task}, timeout=delay if HEDGE_ENABLED else None)
+
+    if not done and _tracker.allow_hedge():
+        f_task = asyncio.ensure_future(timed(f_name, f_model))
+        pending = {p_task, f_task}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        # Primary yang dibatalkan tetap dicatat sebagai batas bawah latensinya
+                        if other is p_task:
+                            _tracker.record(p_name, time.perf_counter() - started)
+                        await _cancel(other)
+                    won = task is f_task
+                    _tracker.finish(True, fallback_won=won)
+                    return task.result(), f_name if won else p_name, {"hedged": True, "delay": round(delay, 3)}
+                error = task.exception()
+        _tracker.finish(True)
+        raise error
+
+    if not done:
+        _tracker.skip()
+    _tracker.finish(False)
+    try:
+        return await p_task, p_name, {"hedged": False, "delay": round(delay, 3)}
+    except Exception:
+        return await timed(f_name, f_model), f_name, {"hedged": False, "delay": round(delay, 3)}
+
+async def hedged_stream(prompt, primary, fallback, info):
+    """Versi streaming: hedge berdasarkan time-to-first-token; yield chunk dari model pemenang.
+
+    Tiap model di-stream oleh task sendiri ke antrean; pemenang = model pertama yang mengirim token.
+    `info` diisi "model" dan "hedged". Error setelah token pertama diteruskan ke pemanggil.
+    """
+    (p_name, p_model), (f_name, f_model) = primary, fallback
+    models = {p_name: p_model, f_name: f_model}
+    started = time.perf_counter()
+    queues, pumps, getters = {}, {}, {}
+
+    def launch(name):
+        queue, key, t0 = asyncio.Queue(), f"{name}:ttft", time.perf_counter()
+
+        async def pump():
+            first = True
+            try:
+                async for chunk in models[name].astream(prompt):
+                    if chunk.content:
+                        if first:
+                            _tracker.record(key, time.perf_counter() - t0)
+                            first = False
+                        await queue.put(("chunk", chunk))
+                await queue.put(("end", None))
+            except Exception as e:
+                await queue.put(("error", e))
+
+        queues[name] = queue
+        pumps[name] = asyncio.ensure_future(pump())
+        getters[name] = asyncio.ensure_future(queue.get())
+
+    try:
+        launch(p_name)
+        delay = _tracker.delay(f"{p_name}:ttft")
+        done, _ = await asyncio.wait({getters[p_name]}, timeout=delay if HEDGE_ENABLED else None)
+        hedged = False
+        if not done:
+            if _tracker.allow_hedge():
+                hedged = True
+                launch(f_name)
+            else:
+                _tracker.skip()
+
+        winner, event, error = None, None, None
+        while winner is None:
+            waiting = dict(getters)
+            done, _ = await asyncio.wait(set(waiting.values()), return_when=asyncio.FIRST_COMPLETED)
+            for name, getter in list(waiting.items()):
+                if getter not in done:
+                    continue
+                kind, value = getter.result()
+                if kind == "error":
+                    error = value
+                    del getters[name]
+                elif winner is None:
+                    winner, event = name, (kind, value)
+            if winner is None and not getters:
+                if f_name in queues:
+                    raise error
+                # Primary gagal sebelum token pertama -> fallback seperti perilaku lama
+                launch(f_name)
+
+        for name in list(getters):
+            if name != winner:
+                if name == p_name:
+                    # Primary yang dibatalkan tetap dicatat sebagai batas bawah latensinya
+                    _tracker.record(f"{p_name}:ttft", time.perf_counter() - started)
+                await _cancel(getters.pop(name))
+                await _cancel(pumps[name])
+        _tracker.finish(hedged, fallback_won=hedged and winner == f_name)
+        info.update(model=winner, hedged=hedged, delay=round(delay, 3))
+
+        kind, value = event
+        while kind == "chunk":
+            yield value
+            kind, value = await queues[winner].get()
+        if kind == "error":
+            raise value
+    finally:
+        for task in list(pumps.values()) + list(getters.values()):
+            if not task.done():
+                await _cancel(task)
@@ -0,0 +1,283 @@
+import os
+import time
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+from .fee_index import fee_records_from_row, get_fee_index, drop_fee_index, YEAR_COLUMNS
+from .catalog import programs_from_row, get_catalog, drop_catalog
+from .context_packer import IDENTITY_KEYS
+from .scoring import LOWER_KEY
+from .canonical import prodi_key, jenjang_key
+from .date_resolver import academic_year_key, UNDATED
+from .sync_manifest import get_sync_manifest, drop_manifest
+from .lexical import drop_lexical_index
+from .kb_generations import get_generation_pointer
+from .database import get_vectorstore, generation_size, drop_generation
+
+# Ingestion CSV bertahap: dibaca per chunk, konten/metadata dibangun per kolom (vectorized),
+# lalu embed + upsert per batch dengan paralelisme terbatas. Memori ~ satu chunk, throughput linear.
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "2000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+# Kolom yang menandai "baris yang sama" antar versi file (nilai lain berubah -> baris 'changed')
+ROW_IDENTITY_KEYS = sorted(IDENTITY_KEYS | {"KELOMPOK"})
+DELETE_BATCH = 1000
+# Verifikasi generasi staging sebelum cutover (lihat rebuild_generation)
+KB_VERIFY_TIMEOUT = float(os.getenv("KB_VERIFY_TIMEOUT", "60"))
+KB_VERIFY_PROBES = int(os.getenv("KB_VERIFY_PROBES", "6"))
+
+def count_rows(path):
+    """Perkiraan jumlah baris data (untuk progress); newline di dalam sel bertanda kutip ikut terhitung"""
+    with open(path, "rb") as f:
+        return max(0, sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b"")) - 1)
+
+def build_chunk(df, source, uploaded_at):
+    """DataFrame (semua str) -> (texts, metadatas, raw_metas); setara loop iterrows lama, tanpa loop per baris"""
+    # Kunci UPPERCASE; kolom ganda setelah normalisasi -> nilai terakhir (seperti dict comprehension lama)
+    df = df.rename(columns=lambda c: str(c).strip().upper())
+    df = df.loc[:, ~df.columns.duplicated(keep="last")]
+    df = df.apply(lambda col: col.str.strip())
+
+    n = len(df)
+    def column(name, default):
+        return df[name] if name in df.columns else pd.Series([default] * n, index=df.index)
+
+    prodi = column("JURUSAN_PROGRAM_STUDI", "UMUM")
+    meta = pd.DataFrame({
+        "SOURCE": source,
+        "JENJANG": column("JENJANG", "S1"),
+        "KATEGORI": column("KATEGORI", "KEUANGAN"),
+        "TIPE_DATA": column("TIPE_DATA", "BIAYA"),
+        "JURUSAN_PROGRAM_STUDI": prodi,
+        "UPLOADED_AT": uploaded_at
+    }, index=df.index)
+    # Nilai kanonik untuk filter metadata ketat di Stage 3 (lihat canonical); prodi seperti katalog
+    named = prodi.where(prodi.ne("") & prodi.str.upper().ne("UMUM"), column("JENIS_LAYANAN", ""))
+    meta["PRODI_KEY"] = named.map(prodi_key)
+    meta["JENJANG_KEY"] = meta["JENJANG"].map(jenjang_key)
+    # Tahun akademik kanonik (kolom tahun baris, lalu tahun di nama file) -> filter TA_KEY, bukan skor substring
+    ta = pd.Series([None] * n, index=df.index, dtype=object)
+    for col in YEAR_COLUMNS:
+        if col in df.columns:
+            ta = ta.where(ta.notna(), df[col].map(academic_year_key))
+    meta["TA_KEY"] = ta.where(ta.notna(), academic_year_key(source) or UNDATED)
+
+    # Diawali "Prodi:" agar cocok dengan kueri literal di Stage 2 RAG
+    parts = ["Prodi: " + prodi, "Jenjang: " + meta["JENJANG"]]
+    parts += [f"{k}: " + df[k] for k in df.columns if k != "TEXT"]
+    content = parts[0].str.cat(parts[1:], sep=" | ")
+    # Jika kolom 'TEXT' asli ada di CSV, prioritaskan sebagai konten utama
+    if "TEXT" in df.columns:
+        content = df["TEXT"]
+    # Lowercase sekali di sini; Stage 4 (scoring.Booster) membacanya dari metadata
+    meta[LOWER_KEY] = content.str.lower()
+
+    return content.tolist(), meta.to_dict("records"), df.to_dict("records")
+
+def row_id(source, text, meta):
+    """ID stabil berbasis hash konten + metadata (tanpa UPLOADED_AT): baris sama -> ID sama di upload berikutnya"""
+    key = "\x00".join([text] + [f"{k}={v}" for k, v in sorted(meta.items()) if k not in ("UPLOADED_AT", LOWER_KEY)])
+    return f"{source}#{hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]}"
+
+def row_identity(raw_meta):
+    return "|".join(f"{k}={raw_meta[k]}" for k in ROW_IDENTITY_KEYS if raw_meta.get(k))
+
+def _scan(path, source, uploaded_at, chunk_rows):
+    """Yield per chunk: (texts, metadatas, raw_metas, ids)"""
+    for df in pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False):
+        texts, metadatas, raw_metas = build_chunk(df, source, uploaded_at)
+        yield texts, metadatas, raw_metas, [row_id(source, t, m) for t, m in zip(texts, metadatas)]
+
+def plan_sync(path, source, previous=None, chunk_rows=None):
+    """Diff file baru vs manifest tersimpan tanpa embedding.
+
+    previous None (sumber lama ber-ID posisi / belum pernah sinkron) -> sinkronisasi penuh.
+    "changed" = pasangan baris hapus + tambah dengan identitas sama (mis. koreksi nominal).
+    """
+    manifest = {}
+    for texts, metadatas, raw_metas, ids in _scan(path, source, "", chunk_rows or INGEST_CHUNK_ROWS):
+        for raw_meta, doc_id in zip(raw_metas, ids):
+            manifest[doc_id] = row_identity(raw_meta)
+
+    old = previous or {}
+    added = [i for i in manifest if i not in old]
+    removed = [i for i in old if i not in manifest]
+    added_keys, removed_keys = Counter(manifest[i] for i in added), Counter(old[i] for i in removed)
+    changed = sum(min(n, removed_keys[k]) for k, n in added_keys.items())
+    return {
+        "source": source,
+        "full": previous is None,
+        "manifest": manifest,
+        "added": added,
+        "removed": removed,
+        "summary": {
+            "rows": len(manifest),
+            "added": len(added) - changed,
+            "changed": changed,
+            "removed": len(removed) - changed,
+            "unchanged": len(manifest) - len(added)
+        }
+    }
+
+def _upsert(vs, texts, metadatas, ids):
+    # Embed + upsert satu batch (Pinecone: satu request embed, upsert async di pool index)
+    vs.add_texts(texts, metadatas, ids=ids, batch_size=len(texts), embedding_chunk_size=len(texts))
+
+def ingest_csv(path, vs, source, on_progress=None, only=None, chunk_rows=None, batch_size=None, workers=None):
+    """Streaming CSV -> vectorstore. Hasil: (rows, fee_records, programs, stats).
+
+    only: set ID yang perlu di-upsert (None = semua baris). Index tarif & katalog tetap dari semua baris.
+    on_progress(stats) dipanggil setiap chunk selesai; stats berisi rows, upserted, total_estimate, rows_per_sec.
+    """
+    chunk_rows = chunk_rows or INGEST_CHUNK_ROWS
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    uploaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    total = count_rows(path)
+    # Index lokal: embed paralel, satu add_embeddings per chunk (di memori; ke disk lewat persist di akhir)
+    local = hasattr(vs, "add_embeddings")
+
+    rows, upserted, chunks, fee_records, programs, seen = 0, 0, 0, [], [], set()
+    started = time.perf_counter()
+    stats = {}
+    with ThreadPoolExecutor(max_workers=workers or INGEST_WORKERS) as pool:
+        for texts, metadatas, raw_metas, ids in _scan(path, source, uploaded_at, chunk_rows):
+            for raw_meta, content in zip(raw_metas, texts):
+                # Index tarif terstruktur + gazetteer prodi untuk planner berbasis aturan
+                fee_records.extend(fee_records_from_row(raw_meta, content, source))
+                programs.append(programs_from_row(raw_meta))
+            rows += len(texts)
+
+            # Hanya baris baru/berubah; baris identik di file yang sama cukup sekali
+            keep = [i for i, doc_id in enumerate(ids) if (only is None or doc_id in only) and doc_id not in seen]
+            seen.update(ids[i] for i in keep)
+            texts, metadatas, ids = [texts[i] for i in keep], [metadatas[i] for i in keep], [ids[i] for i in keep]
+            spans = range(0, len(texts), batch_size)
+
+            if local and texts:
+                futures = [pool.submit(vs.embeddings.embed_documents, texts[i:i + batch_size]) for i in spans]
+                vectors = [v for f in futures for v in f.result()]
+                vs.add_embeddings(texts, vectors, metadatas, ids)
+            elif texts:
+                futures = [pool.submit(_upsert, vs, texts[i:i + batch_size], metadatas[i:i + batch_size],
+                                       ids[i:i + batch_size]) for i in spans]
+                for f in futures:
+                    f.result()
+
+            upserted += len(texts)
+            chunks += 1
+            elapsed = time.perf_counter() - started
+            stats = {
+                "rows": rows,
+                "upserted": upserted,
+                "total_estimate": max(total, rows),
+                "chunks": chunks,
+                "seconds": round(elapsed, 2),
+                "rows_per_sec": round(rows / elapsed, 1) if elapsed else 0.0
+            }
+            if on_progress:
+                on_progress(stats)
+
+    # Index lokal & index leksikal ditulis ke disk sekali per file
+    if hasattr(vs, "persist"):
+        vs.persist()
+    return rows, fee_records, programs, stats
+
+def apply_sync(plan, path, vs, on_progress=None):
+    """Terapkan hasil plan_sync: upsert baris baru/berubah, hapus baris hilang, simpan manifest"""
+    source = plan["source"]
+    if plan["full"]:
+        # Data lama ber-ID posisi (f"{file}_{idx}") tidak bisa di-diff -> dibersihkan per SOURCE
+        try:
+            vs.delete(filter={"SOURCE": source})
+        except Exception:
+            pass
+    only = None if plan["full"] else set(plan["added"])
+    rows, fee_records, programs, stats = ingest_csv(path, vs, source, on_progress=on_progress, only=only)
+    for i in range(0, len(plan["removed"]), DELETE_BATCH):
+        vs.delete(ids=plan["removed"][i:i + DELETE_BATCH])
+    if hasattr(vs, "persist"):
+        vs.persist()
+    get_sync_manifest().replace_source(source, plan["manifest"])
+    return rows, fee_records, programs, dict(stats, deleted=len(plan["removed"]))
+
+def verify_generation(generation, expected, probes=(), timeout=None):
+    """Cek generasi staging sebelum cutover: jumlah vektor sesuai + kueri contoh menemukan dokumen.
+
+    Kueri contoh sekaligus memanaskan namespace baru (cold start) dan cache embedding.
+    """
+    timeout = KB_VERIFY_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    # Statistik Pinecone eventual consistent -> tunggu sampai jumlah vektor menyusul
+    size = generation_size(generation)
+    while size < expected and time.monotonic() < deadline:
+        time.sleep(1)
+        size = generation_size(generation)
+
+    vs = get_vectorstore(generation)
+    checks = []
+    for query in list(probes)[:KB_VERIFY_PROBES]:
+        started = time.perf_counter()
+        hits = vs.similarity_search_with_score(query, k=1)
+        checks.append({"query": query, "hits": len(hits), "ms": round((time.perf_counter() - started) * 1000, 1)})
+    return {
+        "ok": size >= expected and all(c["hits"] for c in checks),
+        "expected": expected,
+        "size": size,
+        "probes": checks
+    }
+
+def collect_generations(keep=None):
+    """GC: hapus generasi retired di luar `keep` terbaru + staging gagal; hasil: nama yang dihapus"""
+    pointer = get_generation_pointer()
+    dropped = []
+    for name in pointer.collectable(keep):
+        drop_generation(name)
+        drop_manifest(name)
+        drop_lexical_index(name)
+        drop_fee_index(name)
+        drop_catalog(name)
+        pointer.forget(name)
+        dropped.append(name)
+    return dropped
+
+def rebuild_generation(files, label="", on_progress=None):
+    """Rebuild penuh KB ke generasi baru tanpa menyentuh generasi aktif, lalu cutover atomik.
+
+    files: [(path, source)]. Generasi aktif tetap melayani sampai verifikasi lolos; gagal -> generasi
+    staging ditandai 'failed' (di-GC nanti) dan pointer tidak berubah.
+    Hasil: (generasi, {source: (rows, fee_records, programs)}, laporan verifikasi, generasi yang di-GC).
+    """
+    pointer = get_generation_pointer()
+    generation = pointer.begin(label)
+    vs = get_vectorstore(generation)
+    manifest = get_sync_manifest(generation)
+    results, expected, probes = {}, 0, []
+    try:
+        for i, (path, source) in enumerate(files):
+            def progress(stats, i=i, source=source):
+                if on_progress:
+                    on_progress(dict(stats, source=source, file=i + 1, files=len(files)))
+            plan = plan_sync(path, source)
+            rows, fee_records, programs, _ = ingest_csv(path, vs, source, on_progress=progress)
+            manifest.replace_source(source, plan["manifest"])
+            results[source] = (rows, fee_records, programs)
+            expected += len(plan["manifest"])
+            # Kueri contoh: nama prodi dari file ini, format sama dengan konten ("Prodi: ...")
+            probes += [f"Prodi: {p[0]}" for p in dict.fromkeys(p for p in programs if p)][:2]
+
+        report = verify_generation(generation, expected, probes)
+        if not report["ok"]:
+            raise RuntimeError(f"Verifikasi generasi {generation} gagal: {report['size']}/{expected} vektor, "
+                               f"probe kosong {[c['query'] for c in report['probes'] if not c['hits']]}")
+        # Index tarif & katalog generasi baru ditulis utuh (satu simpan atomik) sebelum pointer dipindah:
+        # proses lain tidak pernah melihat index kosong/setengah jadi atau index lama pada generasi baru
+        get_fee_index(generation).replace_all({source: r[1] for source, r in results.items()})
+        get_catalog(generation).replace_all({source: r[2] for source, r in results.items()})
+    except BaseException as e:
+        pointer.mark(generation, "failed", error=str(e))
+        raise
+
+    pointer.activate(generation, rows=expected, sources=list(results), verify=report)
+    return generation, results, report, collect_generations()
@@ -0,0 +1,44 @@
+import os
+import re
+
+# Routing model judge (Stage 5) berdasarkan kompleksitas plan: lookup faktual satu entitas cukup
+# model 8B, perbandingan/agregasi/banyak entitas tetap ke model besar.
+JUDGE_ROUTER_ENABLED = os.getenv("JUDGE_ROUTER_ENABLED", "1") == "1"
+
+# tier -> [(label, provider, model)] urutan primary, fallback (dipakai hedging)
+JUDGE_TIERS = {
+    "light": [
+        ("Llama 3.1 8B", "groq", os.getenv("JUDGE_LIGHT_MODEL", "llama-3.1-8b-instant")),
+        ("Llama 4", "groq", "meta-llama/llama-4-maverick-17b-128e-instruct")
+    ],
+    "standard": [
+        ("Llama 4", "groq", "meta-llama/llama-4-maverick-17b-128e-instruct"),
+        ("Llama 3.3", "groq", "llama-3.3-70b-versatile")
+    ]
+}
+
+# Kata yang menandakan penalaran: perbandingan, pengurutan, penjumlahan lintas semester/kelompok
+REASONING_RE = re.compile(
+    r"\b(lebih|banding\w*|selisih|beda\w*|total|jumlah\w*|hitung\w*|urut\w*|termurah|termahal|"
+    r"rata|mana yang|kalkulasi|sampai lulus|selama)\b", re.IGNORECASE
+)
+MULTI_SEMESTER_RE = re.compile(r"\b([2-9]|1\d)\s*semester", re.IGNORECASE)
+
+def route_judge(query, plan, targets, intent, missing_entities=()):
+    """Pilih tier termurah yang memadai; hasil: {"tier", "reasons"}"""
+    reasons = []
+    if len(targets) > 1:
+        reasons.append("multi_entity")
+    if REASONING_RE.search(query) or MULTI_SEMESTER_RE.search(query):
+        reasons.append("reasoning_keyword")
+    if intent not in ("FINANCE", "DESKRIPSI"):
+        reasons.append(f"intent_{str(intent).lower()}")
+    if missing_entities:
+        # Sebagian data tidak ada: model besar lebih disiplin menyatakan "tidak ditemukan"
+        reasons.append("missing_entity")
+    if plan.get("planner") == "llm":
+        reasons.append("low_confidence_plan")
+
+    if not JUDGE_ROUTER_ENABLED:
+        return {"tier": "standard", "reasons": ["router_disabled"]}
+    return {"tier": "standard" if reasons else "light", "reasons": reasons or ["single_entity_lookup"]}
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import threading
+
+# Generasi knowledge base (blue/green): setiap rebuild penuh ditulis ke generasi baru
+# (namespace Pinecone / folder shard index lokal), diverifikasi, lalu pointer dipindah atomik.
+# get_vectorstore() membaca pointer ini; generasi "" = data lama di namespace default.
+KB_POINTER_PATH = os.getenv("KB_POINTER_PATH", os.path.join("data", "kb_pointer.json"))
+# Generasi non-aktif yang disimpan untuk rollback (sisanya di-GC)
+KB_KEEP_GENERATIONS = int(os.getenv("KB_KEEP_GENERATIONS", "1"))
+# Generasi baru dipartisi per KATEGORI/JENJANG (lihat partitions); generasi legacy tetap flat
+KB_PARTITIONED = os.getenv("KB_PARTITIONED", "1") not in ("0", "false", "False")
+# Kolom metadata turunan yang ditulis ingest (build_chunk) untuk generasi baru; engine hanya memfilter
+# kolom yang tercatat di generasinya (generasi legacy tidak punya -> perilaku lama)
+DERIVED_META_KEYS = ("PRODI_KEY", "JENJANG_KEY", "TA_KEY")
+
+class GenerationPointer:
+    """Pointer generasi aktif + riwayat generasi, tersimpan di JSON dan reload via mtime"""
+
+    def __init__(self, path=KB_POINTER_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._state = {"active": "", "generations": {}}
+        self._mtime = None
+
+    def _maybe_reload(self):
+        # Cutover dari proses admin langsung terlihat oleh proses lain (app_wa) -> cek mtime, murah
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r") as f:
+            self._state = json.load(f)
+        self._mtime = mtime
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._state, f)
+        # os.replace atomik: pembaca melihat pointer lama atau baru, tidak pernah setengah jadi
+        os.replace(tmp, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def active(self):
+        with self._lock:
+            self._maybe_reload()
+            return self._state["active"]
+
+    def generations(self):
+        """{nama: info} termasuk generasi "" (legacy) jika pernah aktif"""
+        with self._lock:
+            self._maybe_reload()
+            return {name: dict(info) for name, info in self._state["generations"].items()}
+
+    def begin(self, label=""):
+        """Daftarkan generasi staging baru; hasil: nama generasi (dipakai sebagai namespace)"""
+        with self._lock:
+            self._maybe_reload()
+            name = f"kb-{time.strftime('%Y%m%d-%H%M%S')}"
+            while name in self._state["generations"]:
+                name += "x"
+            self._state["generations"][name] = {
+                "status": "staging", "label": label, "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "layout": "partitioned" if KB_PARTITIONED else "flat", "partitions": [], "meta_keys": list(DERIVED_META_KEYS),
+                "lexical": True, "own_files": True
+            }
+            self._save()
+            return name
+
+    def activate(self, name, **info):
+        """Cutover atomik ke generasi name; generasi aktif sebelumnya menjadi 'retired'"""
+        with self._lock:
+            self._maybe_reload()
+            gens = self._state["generations"]
+            previous = self._state["active"]
+            if previous != name:
+                gens.setdefault(previous, {"label": "legacy"})["status"] = "retired"
+                gens[previous]["retired_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            gens.setdefault(name, {}).update(info, status="active", activated_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+            self._state["active"] = name
+            self._save()
+            return previous
+
+    def info(self, name):
+        """Info satu generasi ({} untuk generasi legacy yang belum tercatat)"""
+        with self._lock:
+            self._maybe_reload()
+            return dict(self._state["generations"].get(name) or {})
+
+    def add_partitions(self, name, partitions):
+        """Catat partisi (namespace) yang pernah ditulisi di generasi name; dibaca pencarian untuk fan-out"""
+        with self._lock:
+            self._maybe_reload()
+            info = self._state["generations"].get(name)
+            if info is None:
+                return
+            known = info.setdefault("partitions", [])
+            new = sorted(set(partitions) - set(known))
+            if new:
+                known.extend(new)
+                self._save()
+
+    def retired(self):
+        """Generasi non-aktif yang masih utuh, terbaru dulu"""
+        with self._lock:
+            self._maybe_reload()
+            gens = self._state["generations"]
+            names = [n for n, g in gens.items() if n != self._state["active"] and g.get("status") == "retired"]
+            return sorted(names, key=lambda n: gens[n].get("retired_at", ""), reverse=True)
+
+    def collectable(self, keep=None):
+        """Generasi yang boleh dihapus: retired di luar `keep` terbaru + staging yang gagal"""
+        keep = KB_KEEP_GENERATIONS if keep is None else keep
+        with self._lock:
+            retired = self.retired()
+            failed = [n for n, g in self._state["generations"].items() if g.get("status") == "failed"]
+            return retired[keep:] + failed
+
+    def mark(self, name, status, **info):
+        with self._lock:
+            self._maybe_reload()
+            if name in self._state["generations"]:
+                self._state["generations"][name].update(info, status=status)
+                self._save()
+
+    def forget(self, name):
+        with self._lock:
+            self._maybe_reload()
+            if name != self._state["active"]:
+                self._state["generations"].pop(name, None)
+                self._save()
+
+_pointer = None
+_pointer_lock = threading.Lock()
+
+def get_generation_pointer():
+    global _pointer
+    with _pointer_lock:
+        if _pointer is None:
+            _pointer = GenerationPointer()
+        return _pointer
+
+def active_generation():
+    return get_generation_pointer().active()
+
+def generation_file(path, generation):
+    """Path file pendamping (index tarif, katalog) milik satu generasi.
+
+    Generasi baru punya file sendiri sehingga ikut berpindah atomik bersama pointer;
+    generasi legacy (dan generasi lama tanpa "own_files") tetap memakai path bersama.
+    """
+    if not generation or not get_generation_pointer().info(generation).get("own_files"):
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{generation}{ext}"
@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from .fee_index import ROMAN
+from .local_index import matches_filter
+
+# Index leksikal BM25 lokal per generasi KB, ditulis saat ingest atas dokumen yang sama dengan vectorstore.
+# Nama prodi persis, numeral kelompok & kode tarif yang dikaburkan embedding MiniLM ditangkap di sini,
+# lalu digabung dengan hasil dense lewat reciprocal-rank fusion (lihat retrieval.multi_search).
+LEXICAL_DIR = os.getenv("RAG_LEXICAL_DIR", os.path.join("data", "lexical"))
+BM25_K1 = float(os.getenv("RAG_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("RAG_BM25_B", "0.75"))
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+# Numeral kelompok ditulis romawi di CSV ("KELOMPOK: III") tapi sering angka di pertanyaan ("kelompok 3")
+_NUMERALS = {r.lower(): str(i + 1) for i, r in enumerate(ROMAN)}
+
+def tokenize(text):
+    return [_NUMERALS.get(t, t) for t in _TOKEN_RE.findall(str(text).lower())]
+
+def lexical_path(generation):
+    return os.path.join(LEXICAL_DIR, f"{generation or '_default'}.json")
+
+class LexicalIndex:
+    """Dokumen (id, teks, metadata) tersimpan di JSON (reload via mtime); posting BM25 dibangun malas di NumPy"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._docs = {}  # id -> (teks, metadata)
+        self._mtime = None
+        self._built = None
+
+    def __len__(self):
+        with self._lock:
+            self._maybe_reload()
+            return len(self._docs)
+
+    def _maybe_reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        self._docs = {i: (t, m) for i, t, m in zip(data["ids"], data["texts"], data["metas"])}
+        self._mtime = mtime
+        self._built = None
+
+    # ---------- tulis (ingest) ----------
+    def upsert(self, ids, texts, metadatas):
+        with self._lock:
+            self._maybe_reload()
+            self._docs.update((i, (t, dict(m))) for i, t, m in zip(ids, texts, metadatas))
+            self._built = None
+
+    def delete(self, ids=None, filter=None):
+        with self._lock:
+            self._maybe_reload()
+            for i in ids or ():
+                self._docs.pop(i, None)
+            if filter:
+                self._docs = {i: d for i, d in self._docs.items() if not matches_filter(d[1], filter)}
+            self._built = None
+
+    def clear(self):
+        with self._lock:
+            self._docs = {}
+            self._built = None
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            ids = list(self._docs)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"ids": ids, "texts": [self._docs[i][0] for i in ids], "metas": [self._docs[i][1] for i in ids]}, f)
+            os.replace(tmp, self.path)
+            self._mtime = os.path.getmtime(self.path)
+
+    # ---------- baca ----------
+    def _build(self):
+        """Per term: (indeks dokumen, bobot BM25 siap pakai); kueri cukup menjumlahkan array"""
+        ids = list(self._docs)
+        texts = [self._docs[i][0] for i in ids]
+        metas = [self._docs[i][1] for i in ids]
+        lengths = np.zeros(len(ids), np.float32)
+        postings = {}
+        for d, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[d] = len(tokens)
+            tf = {}
+            for tok in tokens:
+                tf[tok] = tf.get(tok, 0) + 1
+            for tok, n in tf.items():
+                postings.setdefault(tok, ([], []))
+                postings[tok][0].append(d)
+                postings[tok][1].append(n)
+
+        n_docs = max(1, len(ids))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(1.0, float(lengths.mean()) if len(ids) else 1.0))
+        weights = {}
+        for tok, (docs, tfs) in postings.items():
+            docs = np.asarray(docs, np.int32)
+            tfs = np.asarray(tfs, np.float32)
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            weights[tok] = (docs, idf * tfs * (BM25_K1 + 1) / (tfs + norm[docs]))
+        self._built = (ids, texts, metas, weights)
+        return self._built
+
+    def search(self, query, k=10, filter=None):
+        """[(Document, skor BM25)] urut menurun; filter metadata bergaya Pinecone seperti vectorstore"""
+        with self._lock:
+            self._maybe_reload()
+            built = self._built or self._build()
+        ids, texts, metas, weights = built
+        terms = [weights[t] for t in dict.fromkeys(tokenize(query)) if t in weights]
+        if not terms:
+            return []
+        scores = np.zeros(len(ids), np.float32)
+        for docs, w in terms:
+            scores[docs] += w
+
+        # Filter dievaluasi dari skor tertinggi ke bawah sampai dapat k (tanpa memindai seluruh korpus)
+        cand = np.flatnonzero(scores)
+        cand = cand[np.argsort(-scores[cand], kind="stable")]
+        results = []
+        for d in cand:
+            if filter and not matches_filter(metas[d], filter):
+                continue
+            results.append((Document(id=ids[d], page_content=texts[d], metadata=dict(metas[d])), float(scores[d])))
+            if len(results) >= k:
+                break
+        return results
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_lexical_index(generation):
+    with _indexes_lock:
+        if generation not in _indexes:
+            _indexes[generation] = LexicalIndex(lexical_path(generation))
+        return _indexes[generation]
+
+def drop_lexical_index(generation):
+    with _indexes_lock:
+        _indexes.pop(generation, None)
+    try:
+        os.remove(lexical_path(generation))
+    except OSError:
+        pass
@@ -0,0 +1,99 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+
+# Backend embedding lokal (EMBEDDING_BACKEND=local): model tetap di memori, request kecil
+# dari banyak sesi chat digabung (micro-batch) menjadi satu forward pass di CPU.
+LOCAL_MAX_BATCH = int(os.getenv("EMBED_LOCAL_MAX_BATCH", "64"))
+LOCAL_MAX_WAIT_MS = float(os.getenv("EMBED_LOCAL_MAX_WAIT_MS", "5"))
+LOCAL_THREADS = int(os.getenv("EMBED_LOCAL_THREADS", "0"))  # 0 = semua core
+LOCAL_DEVICE = os.getenv("EMBED_LOCAL_DEVICE", "cpu")
+
+class LocalBatchedEmbeddings(Embeddings):
+    """SentenceTransformer resident + micro-batcher thread-safe"""
+
+    def __init__(self, model_name, max_batch=LOCAL_MAX_BATCH, max_wait_ms=LOCAL_MAX_WAIT_MS,
+                 num_threads=LOCAL_THREADS, device=LOCAL_DEVICE):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=local membutuhkan paket 'sentence-transformers' "
+                "(pip install sentence-transformers)"
+            ) from e
+
+        torch.set_num_threads(num_threads or os.cpu_count() or 1)
+        self.model = SentenceTransformer(model_name, device=device)
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.stats = {"requests": 0, "forward_passes": 0, "texts": 0}
+        # Statistik diubah dari thread worker & thread pemanggil
+        self._lock = threading.Lock()
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="local-embedder", daemon=True)
+        self._worker.start()
+
+    def _encode(self, texts):
+        # all-MiniLM-L6-v2 sudah menyertakan modul Normalize, sama seperti endpoint HF
+        vectors = self.model.encode(texts, batch_size=self.max_batch, convert_to_numpy=True, show_progress_bar=False)
+        with self._lock:
+            self.stats["forward_passes"] += 1
+            self.stats["texts"] += len(texts)
+        return vectors.tolist()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+
+            # Kumpulkan request lain yang datang dalam jendela max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, fut in batch:
+                fut.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def embed_documents(self, texts):
+        texts = [str(t).replace("\n", " ") for t in texts]
+        if not texts:
+            return []
+        with self._lock:
+            self.stats["requests"] += 1
+        # Semua request (termasuk batch besar ingestion) lewat worker yang sama: satu forward pass pada satu
+        # waktu, jadi ingestion tidak berebut core CPU dengan micro-batch chat. Batch >= max_batch langsung
+        # menjadi satu forward pass sendiri (worker berhenti mengumpulkan setelah kuota batch terisi).
+        fut = Future()
+        self._queue.put((texts, fut))
+        return fut.result()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, queued=self._queue.qsize())
@@ -0,0 +1,378 @@
+import os
+import re
+import json
+import uuid
+import shutil
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Index vektor in-process (VECTOR_BACKEND=local) sebagai pengganti PineconeVectorStore.
+# API add/delete/search dibuat sama (termasuk filter metadata & namespace) agar engine
+# dan sinkronisasi admin tidak perlu tahu backend mana yang dipakai.
+
+# Key metadata yang punya posting list untuk pre-filter cepat (termasuk kolom kanonik yang difilter ladder)
+FILTER_KEYS = ("SOURCE", "JENJANG", "KATEGORI", "TIPE_DATA", "JURUSAN_PROGRAM_STUDI", "PRODI_KEY", "JENJANG_KEY", "TA_KEY")
+
+def _match_value(value, cond):
+    if not isinstance(cond, dict):
+        return value == cond
+    for op, arg in cond.items():
+        if op == "$eq" and not value == arg: return False
+        if op == "$ne" and not value != arg: return False
+        if op == "$in" and value not in arg: return False
+        if op == "$nin" and value in arg: return False
+        if op == "$exists" and (value is not None) != bool(arg): return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None: return False
+            try:
+                if op == "$gt" and not value > arg: return False
+                if op == "$gte" and not value >= arg: return False
+                if op == "$lt" and not value < arg: return False
+                if op == "$lte" and not value <= arg: return False
+            except TypeError:
+                return False
+    return True
+
+def matches_filter(meta, flt):
+    """Evaluasi filter bergaya Pinecone ($eq/$ne/$in/$nin/$gt../$and/$or) pada satu metadata"""
+    if not flt:
+        return True
+    for key, cond in flt.items():
+        if key == "$and":
+            if not all(matches_filter(meta, f) for f in cond): return False
+        elif key == "$or":
+            if not any(matches_filter(meta, f) for f in cond): return False
+        elif not _match_value(meta.get(key), cond):
+            return False
+    return True
+
+def _normalize(mat):
+    mat = np.asarray(mat, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat[None, :]
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+class _Shard:
+    """Satu namespace: matriks vektor ternormalisasi + teks/metadata + posting list"""
+
+    def __init__(self):
+        self.ids, self.texts, self.metas = [], [], []
+        self.vectors = None
+        self._buf = None  # kapasitas cadangan untuk append; vectors = _buf[:n]
+        self.pos = {}
+        self.postings = None
+        self.ivf = None
+        self.mtime = None  # mtime docs.json saat terakhir dimuat/ditulis
+        self.dirty = False  # ada tulisan yang belum di-persist
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rebuild(self):
+        self.pos = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.invalidate()
+
+    def invalidate(self):
+        # Posting list & IVF dibangun ulang malas saat pencarian berikutnya (bukan per batch ingest)
+        self.postings = None
+        self.ivf = None
+
+    def set_vectors(self, vectors):
+        self.vectors = self._buf = vectors
+
+    def write(self, rows, vecs):
+        """Tulis vektor ke baris rows (baris >= jumlah lama = tambahan), append amortized O(1) per baris.
+
+        Menimpa baris lama -> copy-on-write: pencarian yang sedang berjalan tetap memegang array lama.
+        """
+        n_old = 0 if self.vectors is None else len(self.vectors)
+        n = len(self.ids)
+        buf = self._buf
+        if buf is None or len(buf) < n or buf.shape[1] != vecs.shape[1] or min(rows, default=n_old) < n_old:
+            grown = np.empty((max(64, n, 2 * len(buf) if buf is not None else 0), vecs.shape[1]), np.float32)
+            if n_old:
+                grown[:n_old] = self.vectors
+            buf = grown
+        buf[rows] = vecs
+        self._buf = buf
+        self.vectors = buf[:n]
+
+    def _postings(self):
+        if self.postings is None:
+            postings = {k: {} for k in FILTER_KEYS}
+            for i, meta in enumerate(self.metas):
+                for k in FILTER_KEYS:
+                    if k in meta:
+                        postings[k].setdefault(meta[k], []).append(i)
+            self.postings = {k: {v: np.asarray(rows, dtype=np.int64) for v, rows in vals.items()}
+                             for k, vals in postings.items()}
+        return self.postings
+
+    def prefilter(self, flt):
+        """Kandidat baris (np.array) dari posting list + evaluasi sisa filter; None = semua"""
+        if not flt:
+            return None
+        cand = None
+        residual = {}
+        for key, cond in flt.items():
+            values = None
+            if key in FILTER_KEYS:
+                if not isinstance(cond, dict):
+                    values = [cond]
+                elif set(cond) == {"$eq"}:
+                    values = [cond["$eq"]]
+                elif set(cond) == {"$in"}:
+                    values = list(cond["$in"])
+            if values is None:
+                residual[key] = cond
+                continue
+            posting = self._postings().get(key, {})
+            rows = [posting[v] for v in values if v in posting]
+            rows = np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+            cand = rows if cand is None else np.intersect1d(cand, rows, assume_unique=True)
+
+        if cand is None:
+            cand = np.arange(len(self.ids))
+        if residual:
+            cand = np.asarray([i for i in cand if matches_filter(self.metas[i], residual)], dtype=np.int64)
+        return cand
+
+class LocalVectorStore(VectorStore):
+    """Index NumPy exact (atau IVF approximate untuk korpus besar) dengan persistensi disk"""
+
+    def __init__(self, embedding, persist_dir=None, namespace=None, ann_threshold=20000, nprobe=8):
+        self._embedding = embedding
+        self.persist_dir = persist_dir
+        self._namespace = namespace or ""
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self._shards = {}
+        self._lock = threading.RLock()
+        if persist_dir and os.path.isdir(persist_dir):
+            self._load()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    # ---------- persistensi ----------
+    def _shard_dir(self, ns):
+        # Nama namespace asli disimpan di docs.json; nama folder cukup versi aman-nya
+        return os.path.join(self.persist_dir, re.sub(r"[^\w.-]", "_", ns) if ns else "_default")
+
+    def _load(self):
+        for name in os.listdir(self.persist_dir):
+            self._load_dir(name)
+
+    def _load_dir(self, name):
+        path = os.path.join(self.persist_dir, name)
+        docs_path = os.path.join(path, "docs.json")
+        try:
+            mtime = os.path.getmtime(docs_path)
+        except OSError:
+            return
+        with open(docs_path, "r") as f:
+            data = json.load(f)
+        vectors = np.load(os.path.join(path, "vectors.npy")) if data["ids"] else None
+        if vectors is not None and len(vectors) != len(data["ids"]):
+            # Terbaca di tengah _save proses lain (vectors.npy sudah baru, docs.json belum) -> coba lagi nanti
+            return
+        shard = _Shard()
+        shard.ids, shard.texts, shard.metas = data["ids"], data["texts"], data["metas"]
+        shard.set_vectors(vectors)
+        shard.rebuild()
+        shard.mtime = mtime
+        self._shards[data.get("namespace", "" if name == "_default" else name)] = shard
+
+    def _shard(self, ns):
+        """Shard namespace ns; dimuat ulang dari disk bila proses lain (admin) menulisnya (mtime docs.json berubah)"""
+        with self._lock:
+            shard = self._shards.get(ns)
+            # Shard dengan tulisan yang belum di-persist milik proses ini -> versi memori yang benar
+            if self.persist_dir and (shard is None or not shard.dirty):
+                try:
+                    mtime = os.path.getmtime(os.path.join(self._shard_dir(ns), "docs.json"))
+                except OSError:
+                    mtime = None
+                if mtime is not None and (shard is None or mtime != shard.mtime):
+                    self._load_dir(os.path.basename(self._shard_dir(ns)))
+            return self._shards.get(ns)
+
+    def _save(self, ns):
+        shard = self._shards.get(ns)
+        if not self.persist_dir or shard is None:
+            return
+        path = self._shard_dir(ns)
+        os.makedirs(path, exist_ok=True)
+        # Tulis ke file sementara lalu os.replace agar pembaca tidak melihat file setengah jadi;
+        # vectors.npy lebih dulu, docs.json (yang mtime-nya dipantau pembaca) terakhir
+        tmp_vec = os.path.join(path, "vectors.tmp.npy")
+        np.save(tmp_vec, shard.vectors if shard.vectors is not None else np.zeros((0, 0), np.float32))
+        os.replace(tmp_vec, os.path.join(path, "vectors.npy"))
+        tmp_docs = os.path.join(path, "docs.json.tmp")
+        with open(tmp_docs, "w") as f:
+            json.dump({"namespace": ns, "ids": shard.ids, "texts": shard.texts, "metas": shard.metas}, f)
+        os.replace(tmp_docs, os.path.join(path, "docs.json"))
+        shard.mtime = os.path.getmtime(os.path.join(path, "docs.json"))
+        shard.dirty = False
+
+    def persist(self, namespace=None):
+        """Tulis shard yang berubah ke disk (semua namespace jika namespace None).
+
+        add/delete hanya mengubah memori; ingest memanggil ini sekali per file, bukan per batch.
+        """
+        with self._lock:
+            for ns, shard in list(self._shards.items()):
+                if shard.dirty and (namespace is None or ns == namespace):
+                    self._save(ns)
+
+    # ---------- tulis ----------
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None, namespace=None):
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        ns = self._namespace if namespace is None else namespace
+        vecs = _normalize(embeddings)
+
+        with self._lock:
+            shard = self._shard(ns)
+            if shard is None:
+                shard = self._shards[ns] = _Shard()
+            rows = []
+            for text, meta, doc_id in zip(texts, metadatas, ids):
+                i = shard.pos.get(doc_id)
+                if i is not None:
+                    # Upsert: id sama menimpa baris lama
+                    shard.texts[i], shard.metas[i] = text, dict(meta)
+                else:
+                    i = shard.pos[doc_id] = len(shard.ids)
+                    shard.ids.append(doc_id)
+                    shard.texts.append(text)
+                    shard.metas.append(dict(meta))
+                rows.append(i)
+            shard.write(rows, vecs)
+            shard.invalidate()
+            shard.dirty = True
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, namespace=None, batch_size=64, **kwargs):
+        texts = list(texts)
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            vectors.extend(self._embedding.embed_documents(texts[i:i + batch_size]))
+        return self.add_embeddings(texts, vectors, metadatas, ids, namespace)
+
+    def delete(self, ids=None, delete_all=None, namespace=None, filter=None, **kwargs):
+        ns = self._namespace if namespace is None else namespace
+        with self._lock:
+            shard = self._shard(ns)
+            if shard is None:
+                return None
+            if delete_all:
+                shard = self._shards[ns] = _Shard()
+            else:
+                drop = set()
+                if ids:
+                    drop.update(shard.pos[i] for i in ids if i in shard.pos)
+                if filter:
+                    drop.update(int(i) for i in shard.prefilter(filter))
+                if not drop:
+                    return None
+                keep = [i for i in range(len(shard)) if i not in drop]
+                shard.ids = [shard.ids[i] for i in keep]
+                shard.texts = [shard.texts[i] for i in keep]
+                shard.metas = [shard.metas[i] for i in keep]
+                shard.set_vectors(shard.vectors[keep] if keep else None)
+                shard.rebuild()
+            shard.dirty = True
+        return None
+
+    # ---------- baca ----------
+    def _ivf(self, shard):
+        # IVF sederhana: k-means kasar, dibangun malas setelah index berubah
+        if shard.ivf is not None:
+            return shard.ivf
+        n = len(shard)
+        n_lists = max(8, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        centroids = shard.vectors[rng.choice(n, n_lists, replace=False)]
+        for _ in range(8):
+            assign = np.argmax(shard.vectors @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = shard.vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        assign = np.argmax(shard.vectors @ centroids.T, axis=1)
+        lists = [np.flatnonzero(assign == c) for c in range(n_lists)]
+        shard.ivf = (centroids, lists)
+        return shard.ivf
+
+    def similarity_search_by_vector_with_score(self, embedding, *, k=4, filter=None, namespace=None, **kwargs):
+        ns = self._namespace if namespace is None else namespace
+        q = _normalize(embedding)[0]
+        with self._lock:
+            shard = self._shard(ns)
+            if shard is None or len(shard) == 0:
+                return []
+            vectors, texts, metas, ids = shard.vectors, shard.texts, shard.metas, shard.ids
+            cand = shard.prefilter(filter)
+            if cand is None and len(shard) >= self.ann_threshold:
+                centroids, lists = self._ivf(shard)
+                probe = np.argsort(-(centroids @ q))[:self.nprobe]
+                cand = np.concatenate([lists[c] for c in probe])
+
+        if cand is not None and len(cand) == 0:
+            return []
+        sub = vectors if cand is None else vectors[cand]
+        scores = sub @ q
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = top if cand is None else cand[top]
+
+        return [
+            (Document(id=ids[r], page_content=texts[r], metadata=dict(metas[r])), float(scores[t]))
+            for r, t in zip(rows, top)
+        ]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, namespace=None, **kwargs):
+        vec = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_score(vec, k=k, filter=filter, namespace=namespace)
+
+    def similarity_search(self, query, k=4, filter=None, namespace=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter, namespace=namespace)]
+
+    def count(self, namespace=None):
+        ns = self._namespace if namespace is None else namespace
+        with self._lock:
+            shard = self._shard(ns)
+            return len(shard) if shard else 0
+
+    def with_namespace(self, namespace):
+        """View yang berbagi shard & lock dengan store ini, dengan namespace default lain (generasi KB)"""
+        ns = namespace or ""
+        self._shard(ns)
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__)
+        view._namespace = ns
+        return view
+
+    def drop_namespace(self, namespace):
+        """Buang satu namespace beserta foldernya di disk"""
+        ns = namespace or ""
+        with self._lock:
+            self._shards.pop(ns, None)
+            if self.persist_dir:
+                shutil.rmtree(self._shard_dir(ns), ignore_errors=True)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_dir=None, **kwargs):
+        store = cls(embedding, persist_dir=persist_dir)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.persist()
+        return store
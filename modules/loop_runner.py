@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+# Satu event loop jangka panjang di thread daemon untuk UI sinkron (Streamlit).
+# asyncio.run per pesan membuat & membuang loop (beserta pool HTTP per-loop) setiap kali.
+_loop = None
+_lock = threading.Lock()
+
+def get_loop():
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="rag-event-loop", daemon=True).start()
+        return _loop
+
+def run(coro, timeout=None):
+    """Jalankan coroutine di loop latar dan tunggu hasilnya (pengganti asyncio.run)"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+_DONE = object()
+
+def iterate(agen, timeout=None):
+    """Ubah async generator yang berjalan di loop latar menjadi generator sinkron.
+
+    Seluruh generator dijalankan oleh satu task (pump) yang mengisi antrean, bukan satu task per
+    __anext__: contextvar (sesi profiler, span metrics) dan task turunannya tetap satu konteks
+    dari langkah pertama sampai selesai.
+    """
+    loop = get_loop()
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                queue.put_nowait((item, None))
+            queue.put_nowait((_DONE, None))
+        except asyncio.CancelledError:
+            queue.put_nowait((_DONE, None))
+            raise
+        except Exception as e:
+            queue.put_nowait((_DONE, e))
+        finally:
+            await agen.aclose()
+
+    task = run(_start(pump()), timeout)
+    try:
+        while True:
+            item, error = asyncio.run_coroutine_threadsafe(queue.get(), loop).result(timeout)
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        # Konsumen berhenti di tengah (rerun Streamlit) -> batalkan pump & tunggu generator dibereskan di loop-nya
+        run(_stop(task), timeout)
+
+async def _start(coro):
+    return asyncio.create_task(coro)
+
+async def _stop(task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Instrumentasi latensi: span per stage pipeline & per panggilan keluar (LLM, embedding, vector search).
+# Agregat in-process (jendela bergulir) untuk p50/p95/p99, diekspor format Prometheus (/metrics di app_wa)
+# dan panel admin Streamlit; rincian per request ikut ke dict debug sebagai "timings".
+METRICS_WINDOW = int(os.getenv("RAG_METRICS_WINDOW", "1000"))
+QUANTILES = (0.5, 0.95, 0.99)
+
+HELP = {
+    "rag_stage_seconds": ("summary", "Latensi per stage pipeline RAG"),
+    "rag_call_seconds": ("summary", "Latensi panggilan keluar (LLM, embedding, vector search)"),
+    "rag_tokens_total": ("counter", "Token LLM per model (estimasi jika usage tidak tersedia)"),
+    "rag_cache_total": ("counter", "Hasil lookup cache (plan/jawaban)"),
+    "rag_call_errors_total": ("counter", "Panggilan keluar yang gagal"),
+    "rag_filter_relax_total": ("counter", "Tingkat filter metadata yang akhirnya memberi hasil (0 = paling ketat)")
+}
+
+def _quantile(samples, q):
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+class Registry:
+    """Summary (jendela sampel + count/sum kumulatif) dan counter, dikunci untuk akses lintas thread"""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._summaries = {}  # (metric, labels) -> [deque, count, sum]
+        self._counters = {}   # (metric, labels) -> nilai
+
+    def observe(self, metric, labels, seconds):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            item = self._summaries.get(key)
+            if item is None:
+                item = self._summaries[key] = [deque(maxlen=self.window), 0, 0.0]
+            item[0].append(seconds)
+            item[1] += 1
+            item[2] += seconds
+
+    def inc(self, metric, labels, value=1):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self):
+        """[{metric, label..., count, p50, p95, p99}] dan {metric{label}: nilai} untuk panel admin"""
+        with self._lock:
+            summaries = [(k, sorted(v[0]), v[1], v[2]) for k, v in self._summaries.items()]
+            counters = dict(self._counters)
+        rows = []
+        for (metric, labels), samples, count, total in sorted(summaries):
+            row = {"metric": metric, **dict(labels), "count": count}
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}"] = round(_quantile(samples, q), 4)
+            rows.append(row)
+        return rows, {_series(m, l): v for (m, l), v in sorted(counters.items())}
+
+    def render_prometheus(self):
+        with self._lock:
+            summaries = [(k, sorted(v[0]), v[1], v[2]) for k, v in self._summaries.items()]
+            counters = dict(self._counters)
+        lines, seen = [], set()
+
+        def header(metric):
+            if metric not in seen:
+                seen.add(metric)
+                kind, text = HELP.get(metric, ("untyped", metric))
+                lines.append(f"# HELP {metric} {text}")
+                lines.append(f"# TYPE {metric} {kind}")
+
+        for (metric, labels), samples, count, total in sorted(summaries):
+            header(metric)
+            for q in QUANTILES:
+                lines.append(f"{_series(metric, labels + (('quantile', str(q)),))} {_quantile(samples, q):.6f}")
+            lines.append(f"{_series(metric + '_sum', labels)} {total:.6f}")
+            lines.append(f"{_series(metric + '_count', labels)} {count}")
+        for (metric, labels), value in sorted(counters.items()):
+            header(metric)
+            lines.append(f"{_series(metric, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def _series(metric, labels):
+    if not labels:
+        return metric
+    escaped = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return f"{metric}{{{escaped}}}"
+
+class Trace:
+    """Rincian span satu request (untuk dict debug)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, metric, labels, seconds, extra):
+        ms = round(seconds * 1000, 1)
+        with self._lock:
+            if metric == "rag_stage_seconds":
+                self.stages[labels["stage"]] = round(self.stages.get(labels["stage"], 0) + ms, 1)
+            else:
+                self.calls.append({**labels, **extra, "ms": ms})
+
+    def summary(self):
+        with self._lock:
+            return {"stages": dict(self.stages), "calls": list(self.calls),
+                    "total_ms": round((time.perf_counter() - self.started) * 1000, 1)}
+
+_registry = Registry()
+_current = contextvars.ContextVar("rag_trace", default=None)
+
+def start_trace():
+    """Trace baru untuk request ini; span di task turunan (mis. spekulasi, hedging) ikut tercatat"""
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+@contextmanager
+def span(metric, **labels):
+    """Ukur blok; yield dict `extra` (mis. tokens, cache) yang ikut ke trace, bukan ke label metrik"""
+    extra, started = {}, time.perf_counter()
+    try:
+        yield extra
+    except asyncio.CancelledError:
+        # Kalah balapan hedging / spekulasi dibatalkan: bukan error
+        extra["cancelled"] = True
+        raise
+    except BaseException:
+        extra["error"] = True
+        if metric == "rag_call_seconds":
+            _registry.inc("rag_call_errors_total", labels)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        if not extra.get("cancelled"):
+            _registry.observe(metric, labels, seconds)
+        trace = _current.get()
+        if trace is not None:
+            trace.add(metric, labels, seconds, extra)
+
+def record(metric, seconds, trace=None, **labels):
+    """Catat durasi yang diukur manual (mis. melintasi yield generator streaming, di mana contextvar tidak terbawa)"""
+    _registry.observe(metric, labels, seconds)
+    if trace is not None:
+        trace.add(metric, labels, seconds, {})
+
+def stage(name):
+    return span("rag_stage_seconds", stage=name)
+
+def count(metric, value=1, **labels):
+    _registry.inc(metric, labels, value)
+
+def metrics_snapshot():
+    return _registry.snapshot()
+
+def render_prometheus():
+    return _registry.render_prometheus()
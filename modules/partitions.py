@@ -0,0 +1,247 @@
+import os
+import math
+import uuid
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from .fee_index import normalize_jenjang
+from .local_index import matches_filter
+from .kb_generations import get_generation_pointer
+from .lexical import get_lexical_index
+
+# Retrieval terpartisi: satu generasi KB dipecah ke namespace per KATEGORI (dan JENJANG untuk kategori
+# di PARTITION_BY_JENJANG), mis. "kb-.../KEUANGAN/S1", "kb-.../AKADEMIK". Filter KATEGORI/JENJANG
+# diselesaikan dengan memilih partisi, sehingga biaya pencarian sebanding dengan irisan yang relevan.
+PARTITION_BY_JENJANG = tuple(k.strip().upper() for k in os.getenv("RAG_PARTITION_BY_JENJANG", "KEUANGAN").split(",") if k.strip())
+JENJANG_FIELDS = ("JENJANG", "JENJANG_KEY")
+PARTITION_WORKERS = int(os.getenv("RAG_PARTITION_WORKERS", "8"))
+
+_pool = ThreadPoolExecutor(max_workers=PARTITION_WORKERS, thread_name_prefix="rag-partition")
+
+def partition_of(meta):
+    """Nama partisi untuk metadata satu baris"""
+    kategori = str(meta.get("KATEGORI") or "UMUM").strip().upper()
+    if kategori in PARTITION_BY_JENJANG:
+        return f"{kategori}/{meta.get('JENJANG_KEY') or normalize_jenjang(meta.get('JENJANG')) or 'UMUM'}"
+    return kategori
+
+def _split(partition):
+    kategori, _, jenjang = partition.partition("/")
+    return kategori, jenjang or None
+
+def _jenjang_cond(cond):
+    # Nilai JENJANG di filter dinormalisasi sama seperti nama partisi ("Magister" -> "S2")
+    if not isinstance(cond, dict):
+        return normalize_jenjang(cond) or cond
+    return {op: [normalize_jenjang(v) or v for v in arg] if isinstance(arg, (list, tuple, set)) else normalize_jenjang(arg) or arg
+            for op, arg in cond.items()}
+
+def jenjang_key_filter(flt):
+    """Filter dengan syarat JENJANG/JENJANG_KEY dipindah ke JENJANG_KEY kanonik ("Magister" == "S2").
+
+    Untuk pencarian yang mencocokkan metadata baris langsung (BM25) tanpa pemilihan partisi: nilai mentah
+    JENJANG di metadata ("Magister", "Profesi") berbeda dengan nilai ternormalisasi di filter engine.
+    """
+    if not flt or not any(k in flt for k in JENJANG_FIELDS):
+        return flt
+    out = {k: v for k, v in flt.items() if k not in JENJANG_FIELDS}
+    conds = [{"JENJANG_KEY": _jenjang_cond(flt[k])} for k in JENJANG_FIELDS if k in flt]
+    if len(conds) == 1:
+        out.update(conds[0])
+    else:
+        out["$and"] = list(out.get("$and", [])) + conds
+    return out
+
+def _fair_merge(groups, k):
+    """Top-k gabungan per skor, tapi tiap partisi dijamin dapat jatah ceil(k/n) (perbandingan lintas jenjang)"""
+    groups = [g for g in groups if g]
+    if len(groups) <= 1:
+        return (groups[0] if groups else [])[:k]
+    quota = math.ceil(k / len(groups))
+    picked = [item for g in groups for item in g[:quota]]
+    rest = [item for g in groups for item in g[quota:]]
+    picked += heapq.nlargest(max(0, k - len(picked)), rest, key=lambda x: x[1])
+    return sorted(picked, key=lambda x: x[1], reverse=True)[:k]
+
+class PartitionedVectorStore:
+    """Satu generasi KB terpartisi di atas vectorstore dasar yang mendukung argumen namespace.
+
+    API yang dipakai engine/ingest (add_texts, delete, similarity_search*, embeddings) sama dengan
+    vectorstore biasa; add_embeddings hanya tersedia jika store dasar punya (index lokal).
+    """
+
+    partitioned = True
+
+    def __init__(self, base, generation):
+        self.base = base
+        self.generation = generation
+        # Kolom turunan (PRODI_KEY, JENJANG_KEY, TA_KEY) yang ada di generasi ini -> engine boleh memfilternya
+        info = get_generation_pointer().info(generation)
+        self.meta_keys = frozenset(info.get("meta_keys", ()))
+        # Index BM25 generasi ini (dokumen sama dengan vectorstore), ikut ditulis setiap add/delete
+        self.lexical = get_lexical_index(generation) if info.get("lexical") else None
+        if hasattr(base, "add_embeddings"):
+            self.add_embeddings = self._add_embeddings
+
+    @property
+    def embeddings(self):
+        return self.base.embeddings
+
+    def namespace(self, partition):
+        return f"{self.generation}/{partition}"
+
+    def partitions(self):
+        return list(get_generation_pointer().info(self.generation).get("partitions", []))
+
+    def select(self, flt):
+        """[(namespace, sisa filter)] untuk partisi yang bisa memuat dokumen yang lolos filter"""
+        parts = self.partitions()
+        if not flt or any(key.startswith("$") for key in flt):
+            return [(self.namespace(p), flt or None) for p in parts]
+        kategori_cond = flt.get("KATEGORI")
+        # JENJANG (nilai mentah) & JENJANG_KEY (kanonik) sama-sama diselesaikan lewat pecahan jenjang partisi
+        jenjang_conds = {k: _jenjang_cond(flt[k]) for k in JENJANG_FIELDS if k in flt}
+        residual = {k: v for k, v in flt.items() if k != "KATEGORI" and k not in JENJANG_FIELDS}
+
+        selected = []
+        for p in parts:
+            kategori, jenjang = _split(p)
+            if kategori_cond is not None and not matches_filter({"KATEGORI": kategori}, {"KATEGORI": kategori_cond}):
+                continue
+            rest = dict(residual)
+            if jenjang is None:
+                # Partisi tanpa pecahan jenjang -> syarat jenjang tetap disaring di dalam partisi
+                rest.update((k, flt[k]) for k in jenjang_conds)
+            elif not all(matches_filter({"J": jenjang}, {"J": cond}) for cond in jenjang_conds.values()):
+                continue
+            selected.append((self.namespace(p), rest or None))
+        return selected
+
+    # ---------- tulis ----------
+    def _group(self, texts, metadatas, ids):
+        groups = {}
+        for text, meta, doc_id in zip(texts, metadatas, ids):
+            g = groups.setdefault(partition_of(meta), ([], [], []))
+            g[0].append(text)
+            g[1].append(meta)
+            g[2].append(doc_id)
+        get_generation_pointer().add_partitions(self.generation, groups)
+        return groups
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        for partition, (t, m, i) in self._group(texts, metadatas, ids).items():
+            self.base.add_texts(t, m, ids=i, namespace=self.namespace(partition), **kwargs)
+        if self.lexical is not None:
+            self.lexical.upsert(ids, texts, metadatas)
+        return ids
+
+    def _add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        vectors = dict(zip(ids, embeddings))
+        for partition, (t, m, i) in self._group(list(texts), list(metadatas), list(ids)).items():
+            self.base.add_embeddings(t, [vectors[x] for x in i], m, i, namespace=self.namespace(partition))
+        if self.lexical is not None:
+            self.lexical.upsert(ids, texts, metadatas)
+        return list(ids)
+
+    def delete(self, ids=None, delete_all=None, filter=None, **kwargs):
+        # ID tidak membawa nama partisi -> dihapus di semua partisi (hapus ID yang tidak ada = no-op)
+        if ids or delete_all:
+            targets = [(self.namespace(p), None) for p in self.partitions()]
+        else:
+            targets = self.select(filter)
+        for ns, rest in targets:
+            if ids:
+                self.base.delete(ids=ids, namespace=ns)
+            elif delete_all or not rest:
+                self.base.delete(delete_all=True, namespace=ns)
+            else:
+                self.base.delete(filter=rest, namespace=ns)
+        if self.lexical is not None:
+            if delete_all:
+                self.lexical.clear()
+            else:
+                self.lexical.delete(ids=ids, filter=None if ids else filter)
+
+    def persist(self):
+        """Simpan shard index lokal & index leksikal ke disk (dipanggil ingest sekali per file, bukan per batch)"""
+        if hasattr(self.base, "persist"):
+            for partition in self.partitions():
+                self.base.persist(namespace=self.namespace(partition))
+        if self.lexical is not None:
+            self.lexical.save()
+
+    # ---------- baca ----------
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None, **kwargs):
+        targets = self.select(filter)
+        if len(targets) == 1:
+            ns, rest = targets[0]
+            return self.base.similarity_search_by_vector_with_score(embedding, k=k, filter=rest, namespace=ns)
+        # Beberapa partisi dicari paralel; perbandingan lintas jenjang (S1 vs S2) digabung adil per partisi
+        futures = [_pool.submit(self.base.similarity_search_by_vector_with_score, embedding, k=k, filter=rest, namespace=ns)
+                   for ns, rest in targets]
+        groups = [f.result() for f in futures]
+        if filter and "JENJANG" in filter:
+            return _fair_merge(groups, k)
+        return heapq.nlargest(k, (item for g in groups for item in g), key=lambda x: x[1])
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def count(self):
+        return sum(self.base.count(namespace=ns) for ns, _ in self.select(None))
+
+class FlatVectorStore:
+    """Generasi KB flat (satu namespace) dengan fitur generasi yang sama: meta_keys & index BM25.
+
+    Baca didelegasikan ke store dasar; tulis/hapus ikut memperbarui index leksikal seperti versi terpartisi.
+    """
+
+    partitioned = False
+
+    def __init__(self, base, generation):
+        self.base = base
+        self.generation = generation
+        info = get_generation_pointer().info(generation)
+        self.meta_keys = frozenset(info.get("meta_keys", ()))
+        self.lexical = get_lexical_index(generation) if info.get("lexical") else None
+        if hasattr(base, "add_embeddings"):
+            self.add_embeddings = self._add_embeddings
+
+    def __getattr__(self, name):
+        if name == "base":
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        self.base.add_texts(texts, metadatas, ids=ids, **kwargs)
+        if self.lexical is not None:
+            self.lexical.upsert(ids, texts, metadatas)
+        return ids
+
+    def _add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        self.base.add_embeddings(texts, embeddings, metadatas, ids)
+        if self.lexical is not None:
+            self.lexical.upsert(ids, texts, metadatas)
+        return list(ids)
+
+    def delete(self, ids=None, delete_all=None, filter=None, **kwargs):
+        self.base.delete(ids=ids, delete_all=delete_all, filter=filter, **kwargs)
+        if self.lexical is not None:
+            if delete_all:
+                self.lexical.clear()
+            else:
+                self.lexical.delete(ids=ids, filter=None if ids else filter)
+
+    def persist(self):
+        if hasattr(self.base, "persist"):
+            self.base.persist()
+        if self.lexical is not None:
+            self.lexical.save()
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import inspect
+import threading
+import contextvars
+from collections import Counter
+
+# Profiler sampling opt-in per request: thread terpisah mengambil stack loop + await-chain setiap task
+# milik request (termasuk yang sedang menunggu I/O), lalu menulis collapsed-stack & speedscope.
+# RAG_PROFILE = fraksi request yang diprofil (0 = mati, 1 = semua); header X-Profile: 1 di /bot memaksa.
+PROFILE_RATE = float(os.getenv("RAG_PROFILE", "0") or 0)
+PROFILE_INTERVAL = float(os.getenv("RAG_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = os.getenv("RAG_PROFILE_DIR", os.path.join("data", "profiles"))
+
+_session = contextvars.ContextVar("rag_profile", default=None)
+_factory_lock = threading.Lock()
+_factories = {}  # loop -> [factory lama, jumlah sesi aktif]
+_ROOT = os.path.abspath(".") + os.sep
+
+def _frame_label(code):
+    path = code.co_filename
+    path = path[len(_ROOT):] if path.startswith(_ROOT) else os.sep.join(path.split(os.sep)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+def _running_agen(frame):
+    # `async for` menunggu objek asend tanpa frame; async generator yang sedang berjalan ada di locals pemanggil
+    for value in frame.f_locals.values():
+        if inspect.isasyncgen(value) and value.ag_running:
+            return value
+    return None
+
+def _await_stack(coro):
+    """Frame root -> leaf dari coroutine yang sedang suspend (mengikuti cr_await / ag_await, termasuk async for)"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame.f_code)
+        awaited = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None) or getattr(coro, "gi_yieldfrom", None)
+        if awaited is not None and type(awaited).__name__ in ("async_generator_asend", "async_generator_athrow"):
+            awaited = _running_agen(frame) or awaited
+        coro = awaited
+    return frames
+
+def _thread_stack(frame, root):
+    """Frame root -> leaf thread loop, dipotong mulai dari frame coroutine task (boilerplate event loop dibuang)"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is root:
+            break
+        frame = frame.f_back
+    return [f.f_code for f in reversed(frames)]
+
+def _task_factory(loop, coro, **kwargs):
+    previous = _factories[loop][0]
+    task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+    session = _session.get()
+    if session is not None:
+        session.track(task)
+    return task
+
+class ProfileSession:
+    """Satu sesi profil; dipakai sebagai context manager di dalam coroutine request"""
+
+    def __init__(self, label):
+        self.label = label
+        self.files = None
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._stop = threading.Event()
+        self._token = None
+
+    def track(self, task):
+        with self._lock:
+            self._tasks.add(task)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.track(asyncio.current_task())
+        self._token = _session.set(self)
+        # Task factory hanya terpasang selama ada sesi aktif (task turunan request ikut disampel)
+        with _factory_lock:
+            entry = _factories.get(self.loop)
+            if entry is None:
+                _factories[self.loop] = [self.loop.get_task_factory(), 1]
+                self.loop.set_task_factory(_task_factory)
+            else:
+                entry[1] += 1
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="rag-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Hentikan sampling & tulis file; hasil (juga di self.files): path speedscope/collapsed"""
+        self._stop.set()
+        self._thread.join()
+        try:
+            _session.reset(self._token)
+        except ValueError:
+            # Generator streaming: keluar dari step (context) berbeda dengan saat masuk
+            _session.set(None)
+        with _factory_lock:
+            entry = _factories[self.loop]
+            entry[1] -= 1
+            if entry[1] == 0:
+                self.loop.set_task_factory(entry[0])
+                del _factories[self.loop]
+        self.files = self._write(time.perf_counter() - self.started)
+        return self.files
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(PROFILE_INTERVAL):
+            now = time.perf_counter()
+            try:
+                self._sample(now - last)
+            except RuntimeError:
+                # Struktur task berubah saat dibaca dari thread lain; sampel ini dilewati
+                pass
+            last = now
+
+    def _sample(self, weight):
+        thread_frame = sys._current_frames().get(self.thread_id)
+        running = asyncio.tasks._current_tasks.get(self.loop)
+        with self._lock:
+            self._tasks = {t for t in self._tasks if not t.done()}
+            tasks = list(self._tasks)
+        for task in tasks:
+            coro = task.get_coro()
+            root = [f"<{getattr(coro, '__qualname__', task.get_name())}>"]
+            if task is running and thread_frame is not None:
+                stack = _thread_stack(thread_frame, getattr(coro, "cr_frame", None))
+            else:
+                # Task sedang menunggu (I/O, sleep, future): waktu tunggu dihitung pada titik await-nya
+                stack = _await_stack(coro)
+                root.append("(await)")
+            key = tuple(root[:1] + [_frame_label(c) for c in stack] + root[1:])
+            self._counts[key] += weight
+
+    def _write(self, duration):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.label}-{id(self) & 0xffff:04x}")
+
+        # Collapsed stack (flamegraph.pl / speedscope): "a;b;c <ms>"
+        with open(base + ".collapsed.txt", "w", encoding="utf-8") as f:
+            for stack, seconds in self._counts.most_common():
+                f.write(";".join(stack) + f" {round(seconds * 1000)}\n")
+
+        frames, index, samples, weights = [], {}, [], []
+        for stack, seconds in self._counts.items():
+            ids = []
+            for name in stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({"name": name})
+                ids.append(index[name])
+            samples.append(ids)
+            weights.append(round(seconds * 1000, 3))
+        doc = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.label,
+            "exporter": "modules.profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": self.label, "unit": "milliseconds",
+                "startValue": 0, "endValue": round(sum(weights), 3),
+                "samples": samples, "weights": weights
+            }]
+        }
+        with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(doc, f)
+        return {
+            "speedscope": base + ".speedscope.json",
+            "collapsed": base + ".collapsed.txt",
+            "duration_ms": round(duration * 1000, 1),
+            "stacks": len(self._counts)
+        }
+
+def maybe_profile(label, force=None):
+    """Sesi profil jika dipaksa (force=True) atau terpilih sampling RAG_PROFILE; None jika tidak (tanpa overhead)"""
+    if force is False or (not force and (PROFILE_RATE <= 0 or random.random() >= PROFILE_RATE)):
+        return None
+    return ProfileSession(label)
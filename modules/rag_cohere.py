@@ -2,24 +2,68 @@ import os
 import json
 import asyncio
 import re
-from langchain_cohere import ChatCohere
+from .clients import get_chat_model
 from .database import get_vectorstore
+from .retrieval import multi_search, embed_batch, Speculation, lexical_index, plan_search
+from .fee_index import fee_documents
+from .fast_planner import fast_plan, FAST_PLANNER_THRESHOLD
+from .answer_cache import get_answer_cache
+from .scoring import Booster
+from .context_packer import pack_context
+from .metrics import start_trace, stage, count
+
+def purify(t):
+    noise = r'\b(biaya|tarif|harga|kuliah|mana|mahal|lebih|total|bandingkan|dan|atau|vs|antara|untuk|berapa|ukt)\b'
+    t_clean = re.sub(r'[^\w\s]', '', str(t))
+    t_final = re.sub(noise, '', t_clean, flags=re.IGNORECASE).strip()
+    return t_final if len(t_final) > 2 else t_clean
+
+# K dense per target (primary / banyak target / fallback FINANCE) untuk engine Cohere
+SEARCH_LIMITS = {"k": 30, "k_multi": 50, "fallback_k": 20, "fallback_below": 5}
+
+def search_plan(query, plan, partitioned=False, meta_keys=(), fused=False):
+    """Stage 2 (purify) lalu Stage 2.5 + parameter Stage 3 bersama (retrieval.plan_search)"""
+    # --- STAGE 2: SMART PURIFY ---
+    targets = list(set([purify(e) for e in plan.get("entities", []) if purify(e)]))[:5]
+    if not targets: targets = [query]
+    return plan_search(query, plan, targets, SEARCH_LIMITS, partitioned, meta_keys, fused)
 
 async def advanced_rag_chat(query, chat_history, debug=False):
-    # Inisialisasi model Cohere terbaru yang stabil
+    # Model Cohere terbaru yang stabil, diambil dari registry klien bersama
     # Model Command R dioptimasi khusus untuk alur kerja RAG
-    llm = ChatCohere(
-        model="command-r-08-2024", 
-        temperature=0,
-        cohere_api_key=os.getenv("COHERE_API_KEY")
-    )
+    llm = get_chat_model("cohere", "command-r-08-2024")
     
     vs = get_vectorstore()
+    # Index BM25 generasi aktif: hybrid RRF menggantikan boost substring Stage 4
+    fused = lexical_index(vs) is not None
+    answers = get_answer_cache()
+    spec = None
+    trace = start_trace()
 
     try:
         # --- STAGE 1: INTENT HARDENING (STRICT JSON) ---
-        # Cohere memerlukan instruksi yang sangat jelas agar tidak memberikan teks basa-basi
-        planner_system = """Tugas: Ekstrak JSON murni tanpa penjelasan.
+        # Fast-path planner berbasis aturan; LLM hanya dipanggil jika confidence rendah
+        with stage("planner"):
+            try:
+                plan = fast_plan(query)
+            except Exception as e:
+                plan = {"confidence": 0.0}
+                if debug: print(f"Fast planner error: {e}")
+
+            if plan.get("confidence", 0.0) < FAST_PLANNER_THRESHOLD:
+                # Plan LLM untuk kueri yang sama sudah pernah dibuat -> pakai ulang tanpa token
+                cached_plan = answers.get_plan("cohere", query)
+                count("rag_cache_total", cache="plan", result="hit" if cached_plan else "miss")
+                plan = cached_plan or plan
+
+            if plan.get("confidence", 0.0) < FAST_PLANNER_THRESHOLD and plan.get("planner") != "llm":
+                # Retrieval spekulatif dari tebakan fast-path (atau kueri mentah) berjalan selama planner LLM bekerja
+                *_, guess_targets, guess_params = search_plan(query, plan, getattr(vs, "partitioned", False), getattr(vs, "meta_keys", ()), fused)
+                if guess_targets:
+                    spec = Speculation(vs, query, guess_targets, guess_params, debug=debug)
+
+                # Cohere memerlukan instruksi yang sangat jelas agar tidak memberikan teks basa-basi
+                planner_system = """Tugas: Ekstrak JSON murni tanpa penjelasan.
 {
   "entities": ["Prodi LENGKAP"], 
   "intent": "FINANCE"|"DESKRIPSI", 
@@ -27,71 +71,94 @@ async def advanced_rag_chat(query, chat_history, debug=False):
 }
 Aturan: Jika ada kata UKT, Biaya, Tarif, SPP, atau Perbandingan -> Intent WAJIB 'FINANCE'."""
         
-        res_planner = (await llm.ainvoke(
-            [{"role": "user", "content": planner_system + f"\n\nQUERY: {query}"}],
-            preamble="You are a JSON generator. Respond ONLY with valid JSON."
-        )).content
+                res_planner = (await llm.ainvoke(
+                    [{"role": "user", "content": planner_system + f"\n\nQUERY: {query}"}],
+                    preamble="You are a JSON generator. Respond ONLY with valid JSON."
+                )).content
         
-        try:
-            match = re.search(r'\{.*\}', res_planner, re.DOTALL)
-            plan = json.loads(match.group()) if match else json.loads(res_planner)
-        except:
-            plan = {"entities": [], "intent": "UMUM", "years": []}
+                try:
+                    match = re.search(r'\{.*\}', res_planner, re.DOTALL)
+                    plan = json.loads(match.group()) if match else json.loads(res_planner)
+                except:
+                    plan = {"entities": [], "intent": "UMUM", "years": []}
+                plan["planner"] = "llm"
+                answers.put_plan("cohere", query, plan)
 
-        intent = plan.get("intent", "UMUM")
-        query_years = plan.get("years", [])
+        with stage("purify"):
+            intent, query_years, targets, fee_hits, search_targets, search_params = search_plan(query, plan, getattr(vs, "partitioned", False), getattr(vs, "meta_keys", ()), fused)
 
-        # --- STAGE 2: SMART PURIFY ---
-        def purify(t):
-            noise = r'\b(biaya|tarif|harga|kuliah|mana|mahal|lebih|total|bandingkan|dan|atau|vs|antara|untuk|berapa|ukt)\b'
-            t_clean = re.sub(r'[^\w\s]', '', str(t))
-            t_final = re.sub(noise, '', t_clean, flags=re.IGNORECASE).strip()
-            return t_final if len(t_final) > 2 else t_clean
+        # --- CACHE: jawaban untuk kueri + plan yang sama pada versi KB yang sama ---
+        cache_key = answers.make_key("cohere", query, intent, targets, query_years)
+        cached = answers.get(cache_key)
+        if cached:
+            if spec: spec.cancel()
+            count("rag_cache_total", cache="answer", result="hit")
+            answer, sources, info = cached
+            return answer, sources, dict(info, cache="hit", timings=trace.summary())
 
-        targets = list(set([purify(e) for e in plan.get("entities", []) if purify(e)]))[:5]
-        if not targets: targets = [query]
+        structured_results = fee_documents(fee_hits)
 
         # --- STAGE 3: HYBRID SEARCH WITH AGGRESSIVE FALLBACK ---
-        all_results = []
-        search_filter = {"KATEGORI": "KEUANGAN"} if intent == "FINANCE" else {"KATEGORI": "AKADEMIK"} if intent == "DESKRIPSI" else None
-        dynamic_k = 50 if len(targets) > 1 else 30
-
-        for t in targets:
-            # Primary Search (Filtered)
-            res = vs.similarity_search_with_score(t, k=dynamic_k, filter=search_filter)
-            
-            # Fallback jika filter terlalu ketat
-            if intent == "FINANCE" and len(res) < 5:
-                res.extend(vs.similarity_search_with_score(t, k=20))
-            all_results.extend(res)
+        # Hasil spekulatif dipakai ulang untuk target yang sama (filter & K sama); sisanya dicari sekarang
+        with stage("speculation_wait"):
+            spec_vectors, spec_results = await spec.collect(search_targets, search_params) if spec else ({}, {})
+        fresh_targets = [t for t in search_targets if t not in spec_results]
+
+        # Embed semua target + kueri mentah dalam satu request batch (N round-trip -> 1)
+        # Kueri mentah tetap di-embed jika lookup kemiripan cache aktif
+        query_vectors = dict(spec_vectors)
+        to_embed = [t for t in fresh_targets + [query] if t not in query_vectors]
+        with stage("embedding"):
+            try:
+                if to_embed and (fresh_targets or answers.similarity):
+                    query_vectors.update(await embed_batch(vs.embeddings, to_embed))
+            except Exception as e:
+                # Batch gagal: multi_search kembali ke embed per target
+                if debug: print(f"Embedding batch error: {e}")
+
+        # Parafrase yang hampir identik (plan, angka & kelompok sama) -> jawaban tersimpan
+        cached = answers.get_similar(cache_key, query_vectors.get(query))
+        if cached:
+            count("rag_cache_total", cache="answer", result="semantic")
+            answer, sources, info = cached
+            return answer, sources, dict(info, cache="semantic", timings=trace.summary())
+        count("rag_cache_total", cache="answer", result="miss")
+
+        # Semua target dicari paralel (primary + fallback)
+        with stage("retrieval"):
+            all_results, search_errors = await multi_search(
+                vs, fresh_targets, vectors=query_vectors, debug=debug, query=query, **search_params
+            ) if fresh_targets else ([], [])
+        for t in search_targets:
+            if t in spec_results:
+                all_results.extend(spec_results[t][0])
+                search_errors.extend(spec_results[t][1])
+        all_results = structured_results + all_results
 
         # --- STAGE 4: CONTEXTUAL BOOSTING (ENTITY & DEGREE AWARE) ---
-        seen, boosted = set(), []
-        found_map = {t: False for t in targets} 
-
-        for doc, score in all_results:
-            if doc.page_content in seen: continue
-            content_lower = doc.page_content.lower()
-            
-            final_score = score
-            for t in targets:
-                if t.lower() in content_lower: 
-                    final_score += 500000 # Boost masif untuk akurasi prodi
-                    found_map[t] = True
-                    
-                    # Extra Boost untuk Jenjang (S1/S2/S3)
-                    if any(deg in content_lower for deg in ['s1', 's2', 's3', 'magister', 'sarjana', 'profesi']):
-                        final_score += 150000 
-            
-            # Filter Tahun
-            for y in query_years:
-                final_score += 100000 if y in content_lower else -50000
-
-            boosted.append({"content": doc.page_content, "score": final_score, "source": doc.metadata.get('SOURCE', 'Database')})
-            seen.add(doc.page_content)
-
-        boosted.sort(key=lambda x: x['score'], reverse=True)
-        context_text = "\n".join([f"[[SUMBER {i+1}]]: {d['source']} | DATA: {d['content']}" for i, d in enumerate(boosted[:15])])
+        # Boost masif untuk akurasi prodi (+500000), extra untuk Jenjang S1/S2/S3 di teks (+150000),
+        # filter tahun (+100000 / -50000)
+        # KB dengan TA_KEY: tahun sudah jadi filter metadata di Stage 3, tidak diskor per dokumen lagi
+        # KB dengan index BM25: urutan hybrid RRF dipakai apa adanya (Booster hanya dedup, top-k & deteksi target)
+        with stage("boosting"):
+            if fused:
+                booster = Booster(targets, target_boost=0, degree_boost=0, year_boost=0, year_penalty=0)
+            else:
+                booster = Booster(
+                    targets, () if "TA_KEY" in getattr(vs, "meta_keys", ()) else query_years,
+                    target_boost=500000, degree_boost=150000, year_boost=100000, year_penalty=-50000, degree_any=True
+                )
+            top, found = booster.rank(all_results, 15)
+            boosted = [{"content": doc.page_content, "score": score, "source": doc.metadata.get('SOURCE', 'Database')} for doc, score in top]
+            found_map = {t: t in found for t in targets}
+            # Baris near-duplicate dari sumber yang sama digabung & konteks dipotong sesuai budget token
+            context_text, context_stats = pack_context(
+                [(d['content'], d['source']) for d in boosted],
+                lambda i, c, src: f"[[SUMBER {i+1}]]: {src} | DATA: {c}"
+            )
+
+        for t in fee_hits:
+            found_map[t] = True
 
         # --- STAGE 5: FINAL REASONING (SOLUTIVE AGENT) ---
         missing_entities = [t for t, found in found_map.items() if not found]
@@ -105,18 +172,31 @@ Aturan: Jika ada kata UKT, Biaya, Tarif, SPP, atau Perbandingan -> Intent WAJIB
             f"Konteks Internal: Cari={targets}. Hilang={missing_entities}."
         )
 
-        response = await llm.ainvoke([
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": f"Q: {query}\n\n[DATA TERVERIFIKASI]:\n{context_text}"}
-        ])
+        with stage("judge"):
+            response = await llm.ainvoke([
+                {"role": "system", "content": system_msg},
+                {"role": "user", "content": f"Q: {query}\n\n[DATA TERVERIFIKASI]:\n{context_text}"}
+            ])
         
-        return response.content, boosted, {
+        info = {
             "plan": plan, 
             "targets": targets, 
             "found_status": found_map,
             "intent": intent, 
-            "model": "Cohere Command R (Full RAG)"
+            "model": "Cohere Command R (Full RAG)",
+            "search_errors": search_errors,
+            "structured_hits": {t: len(r) for t, r in fee_hits.items()},
+            "speculative_hits": list(spec_results),
+            "context": context_stats,
+            "kb_version": cache_key[1],
+            "cache": "miss",
+            "timings": trace.summary()
         }
+        # Retrieval parsial (ada error search) tidak di-cache agar tidak mengunci jawaban yang kurang lengkap
+        if not search_errors:
+            answers.put(cache_key, (response.content, boosted, info), query_vec=query_vectors.get(query))
+        return response.content, boosted, info
 
     except Exception as e:
+        if spec: spec.cancel()
         return f"Waduh, ada kendala teknis: {str(e)}", [], {}
\ No newline at end of file
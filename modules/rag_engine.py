@@ -1,19 +1,80 @@
 import os
 import json
+import time
 import asyncio
 import re
-from langchain_groq import ChatGroq
+from .clients import get_chat_model
 from .database import get_vectorstore
+from .retrieval import multi_search, embed_batch, Speculation, lexical_index, plan_search
+from .fee_index import fee_documents
+from .fast_planner import fast_plan, FAST_PLANNER_THRESHOLD
+from .answer_cache import get_answer_cache
+from .scoring import Booster, FINANCE_ROW_KEYWORDS
+from .context_packer import pack_context
+from .hedging import hedged_invoke, hedged_stream
+from .judge_router import route_judge, JUDGE_TIERS
+from .metrics import start_trace, stage, count, record
+from .profiler import maybe_profile
 
-async def advanced_rag_chat(query, chat_history, debug=False):
-    planner = ChatGroq(model="llama-3.1-8b-instant", temperature=0)
-    judge_primary = ChatGroq(model="meta-llama/llama-4-maverick-17b-128e-instruct", temperature=0)
-    judge_fallback = ChatGroq(model="llama-3.3-70b-versatile", temperature=0) 
+def purify(t):
+    # Menghapus noise operasional tapi menjaga integritas Jenjang
+    noise = r'\b(biaya|tarif|harga|kuliah|mana|mahal|lebih|total|bandingkan|dan|atau|vs|antara|untuk|berapa)\b'
+    t_clean = re.sub(r'[^\w\s]', '', str(t))
+    t_final = re.sub(noise, '', t_clean, flags=re.IGNORECASE).strip()
+    return t_final if len(t_final) > 2 else t_clean
+
+# K dense per target (primary / banyak target / fallback FINANCE) untuk engine Groq
+SEARCH_LIMITS = {"k": 40, "k_multi": 60, "fallback_k": 25, "fallback_below": 10}
+
+def search_plan(query, plan, partitioned=False, meta_keys=(), fused=False):
+    """Stage 2 (smart purify) lalu Stage 2.5 + parameter Stage 3 bersama (retrieval.plan_search)"""
+    # --- STAGE 2: SMART PURIFY ---
+    raw_list = plan.get("entities", [])
+    if not raw_list:
+        raw_list = [w for w in query.split() if len(w) > 4]
+
+    targets = list(set([purify(e) for e in raw_list if purify(e)]))[:5]
+    return plan_search(query, plan, targets, SEARCH_LIMITS, partitioned, meta_keys, fused)
+
+async def _prepare(query, debug=False, judge_tier=None):
+    """Stage 1-4 + prompt Stage 5; cache hit dikembalikan sebagai {"cached": (jawaban, sumber, debug)}.
+
+    judge_tier memaksa tier judge (mis. A/B di stress-test); cache jawaban dilewati agar hasil tier lain tidak terpakai.
+    """
+    # Klien diambil dari registry bersama (pool keep-alive), bukan dibuat per pesan
+    planner = get_chat_model("groq", "llama-3.1-8b-instant")
     vs = get_vectorstore()
+    # Index BM25 generasi aktif: hybrid RRF menggantikan boost substring Stage 4
+    fused = lexical_index(vs) is not None
+    answers = get_answer_cache()
+    spec = None
+    # Span per stage & per panggilan keluar (LLM/embedding/search) -> info["timings"] + /metrics
+    trace = start_trace()
 
     try:
         # --- STAGE 1: INTENT HARDENING (ZERO-TOLERANCE ON FINANCE) ---
-        planner_system = """Tugas: Ekstrak JSON {"entities": ["Prodi/Jenjang"], "intent": "FINANCE"|"DESKRIPSI", "years": ["Tahun"]}.
+        # Fast-path: planner berbasis aturan (gazetteer prodi hasil ingest), tanpa round-trip LLM.
+        # LLM planner hanya dipanggil jika confidence rendah (prodi tak dikenal, typo berat, intent campur)
+        with stage("planner"):
+            try:
+                plan = fast_plan(query)
+            except Exception as e:
+                plan = {"confidence": 0.0}
+                if debug: print(f"Fast planner error: {e}")
+
+            if plan.get("confidence", 0.0) < FAST_PLANNER_THRESHOLD:
+                # Plan LLM untuk kueri yang sama sudah pernah dibuat -> pakai ulang tanpa token
+                cached_plan = answers.get_plan("groq", query)
+                count("rag_cache_total", cache="plan", result="hit" if cached_plan else "miss")
+                plan = cached_plan or plan
+
+            if plan.get("confidence", 0.0) < FAST_PLANNER_THRESHOLD and plan.get("planner") != "llm":
+                # Retrieval spekulatif dari tebakan fast-path (atau kueri mentah) berjalan selama planner LLM bekerja
+                *_, guess_targets, guess_params = search_plan(query, plan, getattr(vs, "partitioned", False), getattr(vs, "meta_keys", ()), fused)
+                if guess_targets:
+                    spec = Speculation(vs, query, guess_targets, guess_params, debug=debug)
+
+                planner_system = """Tugas: Ekstrak JSON {"entities": ["Prodi/Jenjang"], "intent": "FINANCE"|"DESKRIPSI", "years": ["Tahun"]}.
 Aturan Mutlak:
 1. FINANCE: WAJIB digunakan jika ada kata: UKT, biaya, tarif, spp, semester, bayar, total, hitung, MAHAL, MURAH, LEBIH, BANDINGKAN.
    - Contoh: "Mana yang lebih..." atau "Berapa total..." adalah FINANCE.
@@ -21,94 +82,100 @@ Aturan Mutlak:
    - Contoh: "S1 Agribisnis", "S2 Hukum", "Profesi Ners".
 3. JANGAN mengabaikan Jenjang (S1/S2/S3) karena tarifnya berbeda."""
         
-        res_planner = (await planner.ainvoke([
-            {"role": "system", "content": planner_system},
-            {"role": "user", "content": query}
-        ])).content
+                res_planner = (await planner.ainvoke([
+                    {"role": "system", "content": planner_system},
+                    {"role": "user", "content": query}
+                ])).content
         
-        try:
-            match = re.search(r'\{.*\}', res_planner, re.DOTALL)
-            plan = json.loads(match.group()) if match else json.loads(res_planner)
-        except:
-            plan = {"entities": [], "intent": "UMUM", "years": []}
-
-        intent = plan.get("intent", "UMUM")
-        query_years = plan.get("years", [])
+                try:
+                    match = re.search(r'\{.*\}', res_planner, re.DOTALL)
+                    plan = json.loads(match.group()) if match else json.loads(res_planner)
+                except:
+                    plan = {"entities": [], "intent": "UMUM", "years": []}
+                plan["planner"] = "llm"
+                answers.put_plan("groq", query, plan)
 
-        # --- STAGE 2: SMART PURIFY ---
-        def purify(t):
-            # Menghapus noise operasional tapi menjaga integritas Jenjang
-            noise = r'\b(biaya|tarif|harga|kuliah|mana|mahal|lebih|total|bandingkan|dan|atau|vs|antara|untuk|berapa)\b'
-            t_clean = re.sub(r'[^\w\s]', '', str(t))
-            t_final = re.sub(noise, '', t_clean, flags=re.IGNORECASE).strip()
-            return t_final if len(t_final) > 2 else t_clean
+        with stage("purify"):
+            intent, query_years, targets, fee_hits, search_targets, search_params = search_plan(query, plan, getattr(vs, "partitioned", False), getattr(vs, "meta_keys", ()), fused)
 
-        raw_list = plan.get("entities", [])
-        if not raw_list:
-            raw_list = [w for w in query.split() if len(w) > 4]
+        # --- CACHE: jawaban untuk kueri + plan yang sama pada versi KB yang sama ---
+        cache_key = answers.make_key("groq", query, intent, targets, query_years)
+        cached = answers.get(cache_key) if judge_tier is None else None
+        if cached:
+            if spec: spec.cancel()
+            count("rag_cache_total", cache="answer", result="hit")
+            answer, sources, info = cached
+            return {"cached": (answer, sources, dict(info, cache="hit", timings=trace.summary()))}
 
-        targets = list(set([purify(e) for e in raw_list if purify(e)]))[:5]
+        structured_results = fee_documents(fee_hits)
 
         # --- STAGE 3: HYBRID SEARCH WITH AGGRESSIVE FALLBACK ---
-        all_results = []
-        search_filter = {"KATEGORI": "KEUANGAN"} if intent == "FINANCE" else {"KATEGORI": "AKADEMIK"} if intent == "DESKRIPSI" else None
-        
-        # Menaikkan K secara dinamis untuk perbandingan
-        dynamic_k = 60 if len(targets) > 1 else 40
+        # Hasil spekulatif dipakai ulang untuk target yang sama (filter & K sama); sisanya dicari sekarang
+        with stage("speculation_wait"):
+            spec_vectors, spec_results = await spec.collect(search_targets, search_params) if spec else ({}, {})
+        fresh_targets = [t for t in search_targets if t not in spec_results]
 
-        for t in targets:
+        # Embed semua target + kueri mentah dalam satu request batch (N round-trip -> 1)
+        # Kueri mentah tetap di-embed jika lookup kemiripan cache aktif
+        query_vectors = dict(spec_vectors)
+        to_embed = [t for t in fresh_targets + [query] if t not in query_vectors]
+        with stage("embedding"):
             try:
-                # 1. Primary Search (Filtered)
-                res = vs.similarity_search_with_score(t, k=dynamic_k, filter=search_filter)
-                
-                # 2. Fallback Search (Unfiltered) - Jika Finance tapi hasil sedikit
-                # Ini kunci agar Record ID 83 & 41 tidak terblokir filter yang salah
-                if intent == "FINANCE" and len(res) < 10:
-                    fallback = vs.similarity_search_with_score(t, k=25)
-                    res.extend(fallback)
-                    
-                all_results.extend(res)
+                if to_embed and (fresh_targets or answers.similarity):
+                    query_vectors.update(await embed_batch(vs.embeddings, to_embed))
             except Exception as e:
-                if debug: print(f"Search error: {e}")
+                # Batch gagal: multi_search kembali ke embed per target
+                if debug: print(f"Embedding batch error: {e}")
+
+        # Parafrase yang hampir identik (plan, angka & kelompok sama) -> jawaban tersimpan
+        cached = answers.get_similar(cache_key, query_vectors.get(query)) if judge_tier is None else None
+        if cached:
+            count("rag_cache_total", cache="answer", result="semantic")
+            answer, sources, info = cached
+            return {"cached": (answer, sources, dict(info, cache="semantic", timings=trace.summary()))}
+        count("rag_cache_total", cache="answer", result="miss")
+
+        # Semua target dicari paralel (primary + fallback)
+        with stage("retrieval"):
+            all_results, search_errors = await multi_search(
+                vs, fresh_targets, vectors=query_vectors, debug=debug, query=query, **search_params
+            ) if fresh_targets else ([], [])
+        for t in search_targets:
+            if t in spec_results:
+                all_results.extend(spec_results[t][0])
+                search_errors.extend(spec_results[t][1])
+        all_results = structured_results + all_results
 
         # --- STAGE 4: CONTEXTUAL BOOSTING (ENTITY & DEGREE AWARE) ---
-        seen, boosted = set(), []
-        found_map = {t: False for t in targets} 
-
-        for doc, score in all_results:
-            if doc.page_content in seen: continue
-            content_lower = doc.page_content.lower()
-            
-            final_score = score
-            for t in targets:
-                if t.lower() in content_lower: 
-                    final_score += 250000 # Boost masif untuk kecocokan prodi
-                    found_map[t] = True
-                    
-                    # Extra Boost jika Jenjang (S1/S2) juga cocok di teks
-                    degree_match = re.search(r'\b(s1|s2|s3|magister|sarjana|profesi)\b', t.lower())
-                    if degree_match and degree_match.group() in content_lower:
-                        final_score += 100000 
-            
-            # Filter Tahun
-            for y in query_years:
-                if y in content_lower: final_score += 80000
-                else: final_score -= 50000 
-
-            if intent == "FINANCE":
-                # Prioritaskan baris tarif
-                if any(kw in content_lower for kw in ['kelompok', 'tarif_wni', 'biaya_ukt', 'ukt', 'tarif']):
-                    final_score += 150000
-
-            boosted.append((doc.page_content, final_score))
-            seen.add(doc.page_content)
-
-        boosted.sort(key=lambda x: x[1], reverse=True)
-        # Ambil Top 20 konteks terbaik
-        context_text = "\n".join([f"[{i}]: {c}" for i, (c, s) in enumerate(boosted[:20])])
+        # Boost masif untuk kecocokan prodi (+250000), extra jika Jenjang target (S1/S2) juga ada di teks (+100000),
+        # filter tahun (+80000 / -50000), dan untuk FINANCE prioritaskan baris tarif (+150000)
+        # KB dengan TA_KEY: tahun sudah jadi filter metadata di Stage 3, tidak diskor per dokumen lagi
+        # KB dengan index BM25: urutan hybrid RRF dipakai apa adanya (Booster hanya dedup, top-k & deteksi target)
+        with stage("boosting"):
+            if fused:
+                booster = Booster(targets, target_boost=0, degree_boost=0, year_boost=0, year_penalty=0, keyword_boost=0)
+            else:
+                booster = Booster(
+                    targets, () if "TA_KEY" in getattr(vs, "meta_keys", ()) else query_years,
+                    keywords=FINANCE_ROW_KEYWORDS if intent == "FINANCE" else (),
+                    target_boost=250000, degree_boost=100000, year_boost=80000, year_penalty=-50000, keyword_boost=150000
+                )
+            # Ambil Top 20 konteks terbaik
+            top, found = booster.rank(all_results, 20)
+            boosted = [(doc.page_content, score) for doc, score in top]
+            found_map = {t: t in found for t in targets}
+            # Baris near-duplicate (mis. satu baris per kelompok UKT) digabung & konteks dipotong sesuai budget token
+            context_text, context_stats = pack_context([(c, None) for c, s in boosted], lambda i, c, _: f"[{i}]: {c}")
+
+        for t in fee_hits:
+            found_map[t] = True
 
         # --- STAGE 5: FINAL REASONING (SOLUTIVE AGENT) ---
         missing_entities = [t for t, found in found_map.items() if not found]
+        # Model judge termurah yang memadai untuk kompleksitas pertanyaan ini
+        route = route_judge(query, plan, targets, intent, missing_entities)
+        if judge_tier:
+            route = {"tier": judge_tier, "reasons": ["forced"]}
         
         system_msg = (
             "Humas UIN Jakarta. Kamu bekerja berdasarkan [DATA].\n"
@@ -125,21 +192,122 @@ Aturan Mutlak:
             {"role": "user", "content": f"Q: {query}\n\n[DATA]:\n{context_text}"}
         ]
 
-        try:
-            response = await judge_primary.ainvoke(judge_prompt)
-            model_info = "Llama 4"
-        except:
-            response = await judge_fallback.ainvoke(judge_prompt)
-            model_info = "Llama 3.3"
-
-        return response.content, boosted, {
-            "plan": plan, 
-            "targets": targets, 
-            "found_status": found_map,
-            "intent": intent, 
-            "model": model_info
+        return {
+            "judge_prompt": judge_prompt,
+            "boosted": boosted,
+            "cache_key": cache_key,
+            "query_vec": query_vectors.get(query),
+            # Retrieval parsial (ada error search) tidak di-cache agar tidak mengunci jawaban yang kurang lengkap
+            "cacheable": not search_errors and judge_tier is None,
+            "route": route,
+            "trace": trace,
+            "info": {
+                "plan": plan, 
+                "targets": targets, 
+                "found_status": found_map,
+                "intent": intent, 
+                "search_errors": search_errors,
+                "structured_hits": {t: len(r) for t, r in fee_hits.items()},
+                "speculative_hits": list(spec_results),
+                "context": context_stats,
+                "route": route,
+                "kb_version": cache_key[1],
+                "cache": "miss"
+            }
         }
 
+    except Exception:
+        if spec: spec.cancel()
+        raise
+
+def _judges(route):
+    """[(label, model)] primary + fallback untuk tier hasil routing"""
+    return [(label, get_chat_model(provider, model)) for label, provider, model in JUDGE_TIERS[route["tier"]]]
+
+def _finish(state, answer, model_info):
+    info = dict(state["info"], model=model_info, timings=state["trace"].summary())
+    if state["cacheable"]:
+        get_answer_cache().put(state["cache_key"], (answer, state["boosted"], info), query_vec=state["query_vec"])
+    return answer, state["boosted"], info
+
+async def advanced_rag_chat(query, chat_history, debug=False, judge_tier=None, profile=None):
+    """profile=True memaksa profil sampling request ini (default: sampling RAG_PROFILE); path file masuk debug["profile"]"""
+    session = maybe_profile("chat", profile)
+    if session is None:
+        return await _chat(query, debug, judge_tier)
+    with session:
+        answer, sources, info = await _chat(query, debug, judge_tier)
+    return answer, sources, dict(info, profile=session.files)
+
+async def _chat(query, debug, judge_tier):
+    try:
+        state = await _prepare(query, debug, judge_tier)
+        if "cached" in state:
+            return state["cached"]
+
+        # Primary gagal -> fallback; primary lambat (> ~p95) -> fallback ikut berlomba, pemenang dipakai
+        with stage("judge"):
+            response, model_info, hedge = await hedged_invoke(state["judge_prompt"], *_judges(state["route"]))
+        state["info"]["hedge"] = hedge
+        return _finish(state, response.content, model_info)
+
     except Exception as e:
         return f"Waduh, ada kendala teknis: {str(e)}", [], {}
+
+async def advanced_rag_stream(query, chat_history, debug=False, result=None, judge_tier=None, profile=None):
+    """Varian streaming Stage 5: yield token jawaban begitu tiba.
+
+    Setelah stream selesai, dict `result` diisi "answer", "sources" dan "debug"
+    (sama dengan tiga nilai kembalian advanced_rag_chat). profile: lihat advanced_rag_chat.
+    """
+    result = {} if result is None else result
+
+    session = maybe_profile("stream", profile)
+    if session: session.start()
+
+    try:
+        try:
+            state = await _prepare(query, debug, judge_tier)
+        except Exception as e:
+            answer = f"Waduh, ada kendala teknis: {str(e)}"
+            result.update(answer=answer, sources=[], debug={})
+            yield answer
+            return
+
+        if "cached" in state:
+            answer, sources, info = state["cached"]
+            result.update(answer=answer, sources=sources, debug=info)
+            yield answer
+            return
+
+        # Fallback jika primary gagal sebelum token pertama, atau ikut berlomba jika TTFT primary > ~p95
+        chunks, hedge, error = [], {}, None
+        stream = hedged_stream(state["judge_prompt"], *_judges(state["route"]), hedge)
+        started = time.perf_counter()
+        try:
+            async for chunk in stream:
+                chunks.append(chunk.content)
+                yield chunk.content
+        except Exception as e:
+            error = e
+        finally:
+            await stream.aclose()
+            # Durasi dicatat manual: konsumen selain loop_runner.iterate bisa melanjutkan generator dari task berbeda
+            record("rag_stage_seconds", time.perf_counter() - started, state["trace"], stage="judge")
+        model_info = hedge.pop("model", None) if error is None else None
+        state["info"]["hedge"] = hedge
+
+        if model_info:
+            answer, sources, info = _finish(state, "".join(chunks), model_info)
+        else:
+            tail = f"\n\n_(Jawaban terputus: {error})_" if chunks else f"Waduh, ada kendala teknis: {str(error)}"
+            yield tail
+            answer, sources, info = "".join(chunks) + tail, state["boosted"], dict(state["info"], model=None, timings=state["trace"].summary())
+        result.update(answer=answer, sources=sources, debug=info)
+
+    finally:
+        if session:
+            session.stop()
+            result["debug"] = dict(result.get("debug") or {}, profile=session.files)
+
     #lumayan lah ya
\ No newline at end of file
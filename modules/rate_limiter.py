@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+from .context_packer import estimate_tokens
+from .metrics import span, count
+
+# Scheduler kuota LLM bersama: token bucket RPM + TPM per (provider, model) disimpan di SQLite
+# sehingga semua proses (Streamlit, bot WhatsApp, stress-test) berbagi kuota yang sama.
+RATE_DB_PATH = os.getenv("LLM_RATE_DB", os.path.join("data", "rate_limits.db"))
+# Perkiraan token jawaban yang dipesan di muka (dikoreksi dengan usage aktual setelah respons)
+COMPLETION_RESERVE = int(os.getenv("LLM_COMPLETION_RESERVE", "400"))
+MAX_POLL = float(os.getenv("LLM_RATE_MAX_POLL", "1.0"))
+
+DEFAULT_LIMITS = {
+    "groq": {"rpm": 30, "tpm": 6000},
+    "groq/llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000},
+    "cohere": {"rpm": 20, "tpm": 100000}
+}
+
+# Prioritas: live chat > evaluasi > batch. Prioritas rendah tidak boleh menghabiskan porsi cadangan bucket
+PRIORITIES = {"live": 0, "evaluation": 1, "batch": 2}
+RESERVE = {"live": 0.0, "evaluation": 0.2, "batch": 0.4}
+
+_priority = contextvars.ContextVar("llm_priority", default="live")
+
+def _load_limits():
+    limits = dict(DEFAULT_LIMITS)
+    # Override via env, mis. LLM_RATE_LIMITS='{"groq/llama-3.1-8b-instant": {"rpm": 30, "tpm": 20000}}'
+    try:
+        limits.update(json.loads(os.getenv("LLM_RATE_LIMITS", "{}")))
+    except ValueError:
+        pass
+    return limits
+
+LIMITS = _load_limits()
+
+def limits_for(provider, model):
+    return LIMITS.get(f"{provider}/{model}") or LIMITS.get(provider) or {"rpm": 60, "tpm": 100000}
+
+@contextmanager
+def llm_priority(name):
+    """Tandai panggilan LLM di dalam blok ini dengan prioritas tertentu (live/evaluation/batch)"""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class RateLimiter:
+    """Token bucket bersama lintas proses (SQLite, transaksi IMMEDIATE) + antrean prioritas per proses"""
+
+    def __init__(self, path=RATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waiting = {}
+        self._seq = itertools.count()
+        self.stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "penalized": 0,
+                      "by_priority": {p: 0 for p in PRIORITIES}}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, req REAL, tok REAL, ts REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def _update(self, key, limits, fn):
+        """Refill bucket sesuai waktu berlalu, lalu jalankan fn(req, tok) -> (req, tok, hasil) secara atomik"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT req, tok, ts FROM bucket WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            rpm, tpm = limits["rpm"], limits["tpm"]
+            if row is None:
+                req, tok = float(rpm), float(tpm)
+            else:
+                elapsed = max(0.0, now - row[2])
+                req = min(rpm, row[0] + elapsed * rpm / 60.0)
+                tok = min(tpm, row[1] + elapsed * tpm / 60.0)
+            req, tok, result = fn(req, tok)
+            conn.execute("INSERT OR REPLACE INTO bucket (key, req, tok, ts) VALUES (?, ?, ?, ?)", (key, req, tok, now))
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _try(self, key, limits, tokens, priority):
+        rpm, tpm = limits["rpm"], limits["tpm"]
+        reserve = RESERVE.get(priority, 0.0)
+        # Prompt lebih besar dari bucket tidak boleh menunggu selamanya
+        tokens = min(tokens, tpm * (1 - reserve))
+
+        def take(req, tok):
+            need_req = 1 + reserve * rpm - req
+            need_tok = tokens + reserve * tpm - tok
+            if need_req <= 0 and need_tok <= 0:
+                return req - 1, tok - tokens, 0.0
+            wait = max(need_req * 60.0 / rpm, need_tok * 60.0 / tpm, 0.01)
+            return req, tok, wait
+
+        return self._update(key, limits, take)
+
+    def _first_in_line(self, key, ticket):
+        with self._lock:
+            return min(self._waiting.get(key, {ticket})) == ticket
+
+    def _enqueue(self, key, priority):
+        ticket = (PRIORITIES.get(priority, 0), next(self._seq))
+        with self._lock:
+            self._waiting.setdefault(key, set()).add(ticket)
+        return ticket
+
+    def _dequeue(self, key, ticket, waited, priority, acquired):
+        with self._lock:
+            self._waiting[key].discard(ticket)
+            if not acquired:
+                return
+            self.stats["acquired"] += 1
+            self.stats["by_priority"][priority] = self.stats["by_priority"].get(priority, 0) + 1
+            if waited > 0:
+                self.stats["waited"] += 1
+                self.stats["wait_seconds"] += waited
+
+    async def acquire(self, provider, model, tokens, priority=None):
+        """Tunggu (tanpa memblokir loop) sampai kuota tersedia; hasil: tiket untuk settle/penalize"""
+        priority = priority or _priority.get()
+        key, limits = f"{provider}/{model}", limits_for(provider, model)
+        ticket, started = self._enqueue(key, priority), time.perf_counter()
+        waited, acquired = 0.0, False
+        try:
+            while True:
+                # Antrean prioritas di dalam proses: hanya kepala antrean yang mencoba mengambil token
+                if self._first_in_line(key, ticket):
+                    wait = await asyncio.to_thread(self._try, key, limits, tokens, priority)
+                else:
+                    wait = 0.05
+                if wait == 0:
+                    acquired = True
+                    break
+                await asyncio.sleep(min(wait, MAX_POLL))
+                waited = time.perf_counter() - started
+        finally:
+            self._dequeue(key, ticket, waited, priority, acquired)
+        return (key, limits, tokens)
+
+    def acquire_sync(self, provider, model, tokens, priority=None):
+        priority = priority or _priority.get()
+        key, limits = f"{provider}/{model}", limits_for(provider, model)
+        ticket, started = self._enqueue(key, priority), time.perf_counter()
+        waited, acquired = 0.0, False
+        try:
+            while True:
+                wait = self._try(key, limits, tokens, priority) if self._first_in_line(key, ticket) else 0.05
+                if wait == 0:
+                    acquired = True
+                    break
+                time.sleep(min(wait, MAX_POLL))
+                waited = time.perf_counter() - started
+        finally:
+            self._dequeue(key, ticket, waited, priority, acquired)
+        return (key, limits, tokens)
+
+    def settle(self, ticket, actual_tokens):
+        """Koreksi bucket dengan usage aktual (refund jika estimasi terlalu besar, tagih jika kurang)"""
+        if not actual_tokens:
+            return
+        key, limits, estimated = ticket
+        self._update(key, limits, lambda req, tok: (req, min(limits["tpm"], tok + estimated - actual_tokens), None))
+
+    def penalize(self, ticket):
+        """Provider membalas 429: kosongkan bucket agar semua proses ikut mundur"""
+        key, limits, _ = ticket
+        self._update(key, limits, lambda req, tok: (0.0, 0.0, None))
+        with self._lock:
+            self.stats["penalized"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = json.loads(json.dumps(self.stats))
+        rows = self._conn().execute("SELECT key, req, tok FROM bucket").fetchall()
+        stats["buckets"] = {k: {"req": round(r, 1), "tok": round(t)} for k, r, t in rows}
+        return stats
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+def rate_limit_stats():
+    return get_rate_limiter().get_stats()
+
+def estimate_prompt_tokens(messages, **kwargs):
+    """Perkiraan token prompt (+ cadangan jawaban) dari list pesan dict/BaseMessage/str"""
+    if hasattr(messages, "to_messages"):
+        messages = messages.to_messages()  # PromptValue dari `prompt | llm`
+    if isinstance(messages, (str, dict)) or hasattr(messages, "content"):
+        messages = [messages]
+    parts = [str(m.get("content", "") if isinstance(m, dict) else getattr(m, "content", m)) for m in messages]
+    # Argumen teks tambahan (mis. preamble Cohere) ikut dikirim sebagai prompt
+    parts += [v for v in kwargs.values() if isinstance(v, str)]
+    return estimate_tokens("\n".join(parts)) + COMPLETION_RESERVE
+
+def usage_tokens(result):
+    """Token aktual dari AIMessage/chunk (usage_metadata) atau LLMResult (llm_output.token_usage)"""
+    usage = getattr(result, "usage_metadata", None) or {}
+    if not usage and getattr(result, "llm_output", None):
+        usage = result.llm_output.get("token_usage") or {}
+    return usage.get("total_tokens")
+
+def _is_rate_limited(error):
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or "429" in str(error) or "rate limit" in str(error).lower()
+
+@contextmanager
+def _metered(limiter, ticket, provider, model, kind, started):
+    # Satu panggilan ber-tiket: usage aktual (extra["usage"]) mengoreksi bucket, 429 mengosongkannya
+    with span("rag_call_seconds", kind=kind, model=model) as extra:
+        extra["quota_wait_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        try:
+            yield extra
+        except Exception as e:
+            if _is_rate_limited(e):
+                limiter.penalize(ticket)
+            raise
+        usage = extra.pop("usage", None)
+        limiter.settle(ticket, usage)
+        extra["tokens"] = usage or ticket[2]
+        extra["tokens_estimated"] = not usage
+        count("rag_tokens_total", extra["tokens"], provider=provider, model=model)
+
+@contextmanager
+def metered_call(provider, model, tokens, kind="llm", priority=None):
+    """Tunggu kuota (blocking) lalu ukur satu panggilan API; isi extra["usage"] dengan token aktual jika ada"""
+    limiter, started = get_rate_limiter(), time.perf_counter()
+    ticket = limiter.acquire_sync(provider, model, tokens, priority)
+    with _metered(limiter, ticket, provider, model, kind, started) as extra:
+        yield extra
+
+@asynccontextmanager
+async def ametered_call(provider, model, tokens, kind="llm", priority=None):
+    """Versi async metered_call (menunggu kuota tanpa memblokir loop)"""
+    limiter, started = get_rate_limiter(), time.perf_counter()
+    ticket = await limiter.acquire(provider, model, tokens, priority)
+    with _metered(limiter, ticket, provider, model, kind, started) as extra:
+        yield extra
+
+# Menghasilkan runnable dari model mentah (tools, structured output) -> dibungkus lagi agar tetap antre kuota.
+# bind/with_config/with_retry/with_fallbacks/pipe/| berasal dari Runnable dan memanggil invoke/stream milik proxy.
+_DERIVED = frozenset({"bind_tools", "with_structured_output"})
+
+class RateLimitedChat(Runnable):
+    """Proxy chat model (Runnable): semua pintu panggilan API menunggu kuota scheduler, lalu settle/penalize"""
+
+    def __init__(self, llm, provider, model):
+        self._llm = llm
+        self._provider = provider
+        self._model = model
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in ("_llm", "_provider", "_model"):
+            raise AttributeError(name)
+        attr = getattr(self._llm, name)
+        if name in _DERIVED:
+            return lambda *args, **kwargs: RateLimitedChat(attr(*args, **kwargs), self._provider, self._model)
+        return attr
+
+    @property
+    def InputType(self):
+        return self._llm.InputType
+
+    @property
+    def OutputType(self):
+        return self._llm.OutputType
+
+    def get_name(self, suffix=None, *, name=None):
+        return self._llm.get_name(suffix, name=name)
+
+    def _tokens(self, input, kwargs):
+        return estimate_prompt_tokens(input, **kwargs)
+
+    async def ainvoke(self, input, *args, **kwargs):
+        async with ametered_call(self._provider, self._model, self._tokens(input, kwargs)) as extra:
+            result = await self._llm.ainvoke(input, *args, **kwargs)
+            extra["usage"] = usage_tokens(result)
+        return result
+
+    def invoke(self, input, *args, **kwargs):
+        with metered_call(self._provider, self._model, self._tokens(input, kwargs)) as extra:
+            result = self._llm.invoke(input, *args, **kwargs)
+            extra["usage"] = usage_tokens(result)
+        return result
+
+    async def astream(self, input, *args, **kwargs):
+        async with ametered_call(self._provider, self._model, self._tokens(input, kwargs), kind="llm_stream") as extra:
+            t0 = time.perf_counter()
+            async for chunk in self._llm.astream(input, *args, **kwargs):
+                extra["usage"] = usage_tokens(chunk) or extra.get("usage")
+                if "ttft_ms" not in extra and getattr(chunk, "content", chunk):
+                    extra["ttft_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                yield chunk
+
+    def stream(self, input, *args, **kwargs):
+        with metered_call(self._provider, self._model, self._tokens(input, kwargs), kind="llm_stream") as extra:
+            t0 = time.perf_counter()
+            for chunk in self._llm.stream(input, *args, **kwargs):
+                extra["usage"] = usage_tokens(chunk) or extra.get("usage")
+                if "ttft_ms" not in extra and getattr(chunk, "content", chunk):
+                    extra["ttft_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                yield chunk
+
+    def batch(self, inputs, config=None, *, return_exceptions=False, **kwargs):
+        """Tiap input lewat invoke (tiket sendiri); berurutan karena kuota yang menjadi batas"""
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        results = []
+        for input, cfg in zip(inputs, configs):
+            try:
+                results.append(self.invoke(input, cfg, **kwargs))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    async def abatch(self, inputs, config=None, *, return_exceptions=False, **kwargs):
+        """Tiap input lewat ainvoke (tiket sendiri); urutan antre diatur scheduler"""
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        return await asyncio.gather(*(self.ainvoke(input, cfg, **kwargs) for input, cfg in zip(inputs, configs)),
+                                    return_exceptions=return_exceptions)
+
+    # API lama (generate/predict): satu tiket per prompt (= satu request API), bukan satu untuk seluruh batch
+    def _merge(self, results):
+        return LLMResult(
+            generations=[g for r in results for g in r.generations],
+            llm_output=self._llm._combine_llm_outputs([r.llm_output for r in results]),
+            run=[info for r in results for info in (r.run or [])] or None
+        )
+
+    def generate(self, messages, stop=None, callbacks=None, **kwargs):
+        results = []
+        for msgs in messages:
+            with metered_call(self._provider, self._model, self._tokens(msgs, kwargs)) as extra:
+                result = self._llm.generate([msgs], stop=stop, callbacks=callbacks, **kwargs)
+                extra["usage"] = usage_tokens(result)
+            results.append(result)
+        return self._merge(results)
+
+    async def agenerate(self, messages, stop=None, callbacks=None, **kwargs):
+        async def one(msgs):
+            async with ametered_call(self._provider, self._model, self._tokens(msgs, kwargs)) as extra:
+                result = await self._llm.agenerate([msgs], stop=stop, callbacks=callbacks, **kwargs)
+                extra["usage"] = usage_tokens(result)
+            return result
+        return self._merge(await asyncio.gather(*(one(msgs) for msgs in messages)))
+
+    def generate_prompt(self, prompts, stop=None, callbacks=None, **kwargs):
+        return self.generate([p.to_messages() for p in prompts], stop=stop, callbacks=callbacks, **kwargs)
+
+    async def agenerate_prompt(self, prompts, stop=None, callbacks=None, **kwargs):
+        return await self.agenerate([p.to_messages() for p in prompts], stop=stop, callbacks=callbacks, **kwargs)
+
+    def predict(self, text, *, stop=None, **kwargs):
+        return self.invoke(text, stop=stop, **kwargs).content
+
+    async def apredict(self, text, *, stop=None, **kwargs):
+        return (await self.ainvoke(text, stop=stop, **kwargs)).content
+
+    def predict_messages(self, messages, *, stop=None, **kwargs):
+        return self.invoke(messages, stop=stop, **kwargs)
+
+    async def apredict_messages(self, messages, *, stop=None, **kwargs):
+        return await self.ainvoke(messages, stop=stop, **kwargs)
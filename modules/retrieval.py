@@ -0,0 +1,262 @@
+import os
+import asyncio
+import weakref
+from .metrics import span, count
+from .fee_index import lookup_fees, normalize_jenjang
+from .canonical import filter_ladders
+from .date_resolver import resolve_dates, academic_year_key
+from .partitions import jenjang_key_filter
+
+# Stage 3: semua pencarian (primary + fallback) dijalankan konkuren di thread pool
+# dengan batas konkurensi per event loop dan timeout per panggilan.
+SEARCH_CONCURRENCY = int(os.getenv("RAG_SEARCH_CONCURRENCY", "8"))
+SEARCH_TIMEOUT = float(os.getenv("RAG_SEARCH_TIMEOUT", "8"))
+# Hybrid: BM25 lokal dicari paralel dengan dense lalu digabung reciprocal-rank fusion (RRF)
+LEXICAL_K = int(os.getenv("RAG_LEXICAL_K", "20"))
+FUSED_DENSE_K = int(os.getenv("RAG_FUSED_DENSE_K", "15"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+_semaphores = weakref.WeakKeyDictionary()  # loop -> asyncio.Semaphore
+
+def _get_semaphore():
+    loop = asyncio.get_running_loop()
+    sem = _semaphores.get(loop)
+    if sem is None:
+        sem = asyncio.Semaphore(SEARCH_CONCURRENCY)
+        _semaphores[loop] = sem
+    return sem
+
+async def run_search(fn, *args, timeout=None, **kwargs):
+    """Jalankan satu panggilan vectorstore sinkron tanpa memblokir event loop"""
+    async with _get_semaphore():
+        return await asyncio.wait_for(
+            asyncio.to_thread(fn, *args, **kwargs),
+            timeout or SEARCH_TIMEOUT
+        )
+
+async def embed_batch(embeddings, texts):
+    """Embed semua teks unik dalam SATU request batch; hasil: {teks: vektor}"""
+    unique = list(dict.fromkeys(t for t in texts if t))
+    if not unique:
+        return {}
+    with span("rag_call_seconds", kind="embedding", model=type(embeddings).__name__) as extra:
+        extra["texts"] = len(unique)
+        vectors = await run_search(embeddings.embed_documents, unique)
+    return dict(zip(unique, vectors))
+
+async def _search_call(vs, t, vectors, k, search_filter):
+    # Jika vektor target sudah ada (hasil batch), cari langsung by-vector tanpa embed ulang
+    vec = vectors.get(t) if vectors else None
+    with span("rag_call_seconds", kind="vector_search", model=type(vs).__name__) as extra:
+        extra.update(target=t, k=k, filtered=bool(search_filter))
+        if vec is not None:
+            res = await run_search(vs.similarity_search_by_vector_with_score, vec, k=k, filter=search_filter)
+        else:
+            res = await run_search(vs.similarity_search_with_score, t, k=k, filter=search_filter)
+        extra["results"] = len(res)
+    return res
+
+def lexical_index(vs):
+    """Index BM25 generasi vectorstore ini jika ada & berisi; None = retrieval dense saja (perilaku lama)"""
+    lexical = getattr(vs, "lexical", None)
+    return lexical if lexical is not None and len(lexical) else None
+
+def rrf(*ranked):
+    """Reciprocal-rank fusion beberapa daftar [(Document, skor)]; dokumen disamakan lewat page_content"""
+    fused, docs = {}, {}
+    for results in ranked:
+        ordered = sorted(results, key=lambda x: x[1], reverse=True)
+        for rank, (doc, _) in enumerate(ordered):
+            key = doc.page_content
+            fused[key] = fused.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            docs.setdefault(key, doc)
+    return sorted(((docs[key], score) for key, score in fused.items()), key=lambda x: x[1], reverse=True)
+
+async def _lexical_call(lexical, t, k, search_filter):
+    # Metadata BM25 = metadata baris mentah: syarat jenjang dicocokkan lewat JENJANG_KEY kanonik
+    with span("rag_call_seconds", kind="lexical_search", model="bm25") as extra:
+        res = await run_search(lexical.search, t, k, jenjang_key_filter(search_filter))
+        extra["results"] = len(res)
+    return res
+
+async def _ladder_search(vs, t, vectors, ladder):
+    # Filter ketat dulu; dilonggarkan satu tingkat hanya jika hasil kosong (atau gagal).
+    # Hasil: (dokumen, error, filter tingkat yang dipakai) -> BM25 memakai filter tingkat yang sama
+    errors = []
+    for i, (step_filter, step_k) in enumerate(ladder):
+        try:
+            res = await _search_call(vs, t, vectors, step_k, step_filter)
+        except Exception as e:
+            errors.append(f"{t} (tingkat {i}): {type(e).__name__} {e}")
+            continue
+        if res:
+            count("rag_filter_relax_total", level=str(i))
+            return list(res), errors, step_filter
+    count("rag_filter_relax_total", level="empty")
+    return [], errors, ladder[-1][0]
+
+async def multi_search(vs, targets, k, search_filter=None, fallback_k=None, fallback_below=0, vectors=None, debug=False, ladders=None, query=None):
+    """Cari semua target sekaligus; fallback (tanpa filter) ikut diluncurkan paralel.
+
+    Hasil fallback hanya dipakai jika hasil primary < fallback_below atau primary gagal,
+    sehingga semantik sama dengan loop serial lama tapi wall time cukup satu round-trip.
+    ladders: {target: [(filter, k), ...]} untuk target yang sudah dikanonikalisasi -> pencarian
+    berfilter ketat dengan K kecil yang dilonggarkan bertahap (menggantikan primary + fallback).
+    Jika generasi punya index BM25, hasil per target = RRF(dense, BM25) dengan skor RRF; BM25 mencari target
+    + pertanyaan asli (query) agar token persis di pertanyaan ("kelompok 3", kode tarif) ikut dicocokkan,
+    dengan filter yang sama seperti dense (tingkat ladder yang menghasilkan dokumen).
+    Error/timeout per target ditoleransi: target lain tetap dikembalikan.
+    """
+    async def plain(t):
+        jobs = [_search_call(vs, t, vectors, k, search_filter)]
+        if fallback_k:
+            jobs.append(_search_call(vs, t, vectors, fallback_k, None))
+        primary, *rest = await asyncio.gather(*jobs, return_exceptions=True)
+        fallback = rest[0] if rest else []
+
+        errors = []
+        if isinstance(primary, BaseException):
+            errors.append(f"{t}: {type(primary).__name__} {primary}")
+            primary = []
+        if isinstance(fallback, BaseException):
+            errors.append(f"{t} (fallback): {type(fallback).__name__} {fallback}")
+            fallback = []
+
+        res = list(primary)
+        if fallback_k and len(res) < fallback_below:
+            res.extend(fallback)
+        return res, errors
+
+    lexical = lexical_index(vs)
+
+    async def hybrid(t):
+        text = f"{t} {query}" if query else t
+        if t in ladders:
+            # BM25 memakai filter tingkat ladder yang menghasilkan dokumen dense (prodi/jenjang/TA ketat ikut);
+            # index BM25 lokal (milidetik), jadi menunggu ladder dense tidak menambah round-trip
+            res, errors, step_filter = await _ladder_search(vs, t, vectors, ladders[t])
+            if lexical is None:
+                return res, errors
+            try:
+                return rrf(res, await _lexical_call(lexical, text, LEXICAL_K, step_filter)), errors
+            except Exception as e:
+                return res, errors + [f"{t} (bm25): {type(e).__name__} {e}"]
+
+        # Dense (primary + fallback) dan BM25 diluncurkan bersamaan, lalu digabung RRF
+        if lexical is None:
+            return await plain(t)
+        dense_out, lex = await asyncio.gather(plain(t), _lexical_call(lexical, text, LEXICAL_K, search_filter), return_exceptions=True)
+        if isinstance(dense_out, BaseException):
+            raise dense_out
+        res, errors = dense_out
+        if isinstance(lex, BaseException):
+            return res, errors + [f"{t} (bm25): {type(lex).__name__} {lex}"]
+        return rrf(res, lex), errors
+
+    ladders = ladders or {}
+    outcomes = await asyncio.gather(*(hybrid(t) for t in targets))
+
+    all_results, errors = [], []
+    for res, errs in outcomes:
+        all_results.extend(res)
+        errors.extend(errs)
+
+    if debug and errors:
+        print(f"Search error: {errors}")
+    return all_results, errors
+
+def target_params(params, t):
+    """Parameter yang benar-benar menentukan hasil satu target (ladder-nya sendiri atau k/filter/fallback)"""
+    ladder = (params.get("ladders") or {}).get(t)
+    if ladder is not None:
+        # Dense & BM25 sama-sama memakai filter tingkat ladder
+        return ladder
+    return params.get("k"), params.get("search_filter"), params.get("fallback_k"), params.get("fallback_below", 0)
+
+def plan_search(query, plan, targets, limits, partitioned=False, meta_keys=(), fused=False):
+    """Stage 2.5 + parameter Stage 3 dari sebuah plan (bersama untuk semua engine, juga retrieval spekulatif).
+
+    targets: hasil Stage 2 (purify khas engine); limits: K engine {"k", "k_multi", "fallback_k", "fallback_below"}
+    partitioned: KB dipartisi per KATEGORI/JENJANG -> jenjang target ikut di filter (hanya partisi itu yang dicari)
+    meta_keys: kolom kanonik di metadata (PRODI_KEY/JENJANG_KEY/TA_KEY) -> prodi & tahun menjadi filter ketat
+    fused: generasi punya index BM25 -> hasil dense digabung RRF dengan BM25, K dense cukup kecil
+    """
+    intent = plan.get("intent", "UMUM")
+    # Tahun dari resolver deterministik (frasa "tahun ini", "TA 2023", "2024/2025", ...); plan LLM hanya cadangan
+    dates = resolve_dates(query)
+    query_years = dates["years"] or plan.get("years", [])
+    academic_years = dates["academic_years"] or [y for y in map(academic_year_key, query_years) if y]
+
+    # --- STAGE 2.5: STRUCTURED FEE LOOKUP (FINANCE) ---
+    # Entitas yang dikenal index tarif dijawab eksak; hanya yang miss lanjut ke dense retrieval
+    fee_hits = lookup_fees(targets, query, query_years) if intent == "FINANCE" else {}
+    if fee_hits:
+        search_targets = [t for t in targets if t not in fee_hits]
+    else:
+        # Jika tidak ada target sama sekali, kueri mentah yang dicari
+        search_targets = targets or [query]
+
+    search_filter = {"KATEGORI": "KEUANGAN"} if intent == "FINANCE" else {"KATEGORI": "AKADEMIK"} if intent == "DESKRIPSI" else None
+    # KB terpartisi: tiap target FINANCE menyebut jenjang -> hanya partisi jenjang itu (S1 vs S2: fan-out paralel)
+    degrees = [normalize_jenjang(t) for t in search_targets]
+    if partitioned and intent == "FINANCE" and degrees and all(degrees):
+        search_filter["JENJANG"] = {"$in": sorted(set(degrees))}
+
+    # Primary Search (Filtered) + Fallback Search untuk Finance jika hasil primary < fallback_below
+    search_params = {
+        "search_filter": search_filter,
+        # Menaikkan K secara dinamis untuk perbandingan
+        "k": limits["k_multi"] if len(targets) > 1 else limits["k"],
+        "fallback_k": limits["fallback_k"] if intent == "FINANCE" else None,
+        "fallback_below": limits["fallback_below"]
+    }
+    if fused:
+        # Nama prodi / kelompok persis sudah ditangkap BM25 -> dense tidak perlu over-fetch
+        search_params["k"] = min(search_params["k"], FUSED_DENSE_K)
+        search_params["fallback_k"] = search_params["fallback_k"] and min(search_params["fallback_k"], FUSED_DENSE_K)
+    # Filter ketat ($in prodi kanonik + jenjang + tahun akademik) dengan K kecil; dilonggarkan bertahap hanya jika kosong
+    ladders = filter_ladders(search_targets, search_filter, search_params["k"], search_params["fallback_k"], meta_keys, academic_years)
+    if ladders:
+        search_params["ladders"] = ladders
+    return intent, query_years, targets, fee_hits, search_targets, search_params
+
+class Speculation:
+    """Retrieval spekulatif (embed + search per target) yang berjalan selama planner LLM bekerja"""
+
+    def __init__(self, vs, query, targets, params, debug=False):
+        self.vs = vs
+        self.query = query
+        self.targets = list(targets)
+        self.params = dict(params)
+        self.task = asyncio.create_task(self._run(debug))
+
+    async def _run(self, debug):
+        try:
+            vectors = await embed_batch(self.vs.embeddings, self.targets + [self.query])
+        except Exception:
+            vectors = {}
+        # Per target agar plan final yang hanya sebagian sama tetap bisa memakai ulang hasilnya
+        outcomes = await asyncio.gather(*(
+            multi_search(self.vs, [t], vectors=vectors, debug=debug, query=self.query, **self.params) for t in self.targets
+        ))
+        return vectors, dict(zip(self.targets, outcomes))
+
+    def cancel(self):
+        if not self.task.done():
+            self.task.cancel()
+
+    async def collect(self, targets, params):
+        """(vektor, {target: (hasil, error)}) yang masih berlaku untuk plan final; tidak cocok -> dibatalkan
+
+        Dibandingkan per target: k & ladder target lain ikut berubah saat jumlah target berubah,
+        tapi hasil target yang ladder/filter/k-nya sendiri sama tetap sah dipakai.
+        """
+        valid = {t for t in set(targets) & set(self.targets) if target_params(params, t) == target_params(self.params, t)}
+        if not valid:
+            self.cancel()
+            return {}, {}
+        try:
+            vectors, per_target = await self.task
+        except (asyncio.CancelledError, Exception):
+            return {}, {}
+        return vectors, {t: r for t, r in per_target.items() if t in valid}
@@ -0,0 +1,87 @@
+import os
+import re
+import heapq
+import threading
+
+# Stage 4 (contextual boosting) yang dikompilasi sekali per pesan: pola target/jenjang/tahun/keyword
+# disiapkan di muka, teks lowercase diambil dari metadata ingest, dan top-k diambil dengan heap.
+LOWER_CACHE_SIZE = int(os.getenv("RAG_LOWER_CACHE_SIZE", "20000"))
+# Metadata berisi page_content.lower() yang ditulis saat ingest (build_chunk)
+LOWER_KEY = "CONTENT_LOWER"
+
+DEGREE_RE = re.compile(r'\b(s1|s2|s3|magister|sarjana|profesi)\b')
+DEGREE_WORDS = ('s1', 's2', 's3', 'magister', 'sarjana', 'profesi')
+FINANCE_ROW_KEYWORDS = ('kelompok', 'tarif_wni', 'biaya_ukt', 'ukt', 'tarif')
+
+_lower_cache = {}
+_lower_lock = threading.Lock()
+
+def lower_text(doc):
+    """page_content.lower(): dari metadata ingest; dokumen tanpa kolom itu (KB lama, index tarif) lewat cache"""
+    low = doc.metadata.get(LOWER_KEY)
+    if low is not None:
+        return low
+    text = doc.page_content
+    with _lower_lock:
+        low = _lower_cache.get(text)
+        if low is None:
+            if len(_lower_cache) >= LOWER_CACHE_SIZE:
+                # Eviksi FIFO (dict menjaga urutan sisip), cukup untuk working set korpus
+                del _lower_cache[next(iter(_lower_cache))]
+            low = _lower_cache[text] = text.lower()
+    return low
+
+class Booster:
+    """Skoring Stage 4 dengan semantik sama dengan loop lama (substring match, bukan word match)"""
+
+    def __init__(self, targets, years=(), keywords=(), target_boost=250000, degree_boost=100000,
+                 year_boost=80000, year_penalty=-50000, keyword_boost=150000, degree_any=False):
+        self.targets = list(targets)
+        # degree_any=False: jenjang milik target harus ada di teks (rag_engine);
+        # degree_any=True : jenjang apa pun di teks sudah cukup (rag_cohere)
+        self.patterns = []
+        for t in self.targets:
+            t_lower = t.lower()
+            if degree_any:
+                degrees = DEGREE_WORDS
+            else:
+                m = DEGREE_RE.search(t_lower)
+                degrees = (m.group(),) if m else ()
+            self.patterns.append((t, t_lower, degrees))
+        self.years = tuple(years or ())
+        self.keywords = tuple(keywords or ())
+        self.target_boost = target_boost
+        self.degree_boost = degree_boost
+        self.year_boost = year_boost
+        self.year_penalty = year_penalty
+        self.keyword_boost = keyword_boost
+
+    def rank(self, results, top_k):
+        """(top-k [(Document, skor)] urut menurun, set target yang ditemukan di teks manapun)"""
+        seen, scored, found = set(), [], set()
+        for doc, score in results:
+            content = doc.page_content
+            if content in seen:
+                continue
+            seen.add(content)
+            low = lower_text(doc)
+
+            final_score = score
+            for t, t_lower, degrees in self.patterns:
+                if t_lower in low:
+                    final_score += self.target_boost
+                    found.add(t)
+                    for deg in degrees:
+                        if deg in low:
+                            final_score += self.degree_boost
+                            break
+            for y in self.years:
+                final_score += self.year_boost if y in low else self.year_penalty
+            for kw in self.keywords:
+                if kw in low:
+                    final_score += self.keyword_boost
+                    break
+            scored.append((doc, final_score))
+
+        # nlargest(key) setara sorted(reverse=True)[:k] termasuk urutan untuk skor sama
+        return heapq.nlargest(top_k, scored, key=lambda x: x[1]), found
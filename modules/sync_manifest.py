@@ -0,0 +1,82 @@
+import os
+import json
+import threading
+from .kb_generations import active_generation
+
+# Manifest sinkronisasi: per file sumber, {id baris (hash konten): kunci identitas baris}.
+# Dipakai untuk diff upload baru vs data tersimpan agar hanya baris berubah yang di-embed ulang.
+# Satu manifest per generasi KB (lihat kb_generations), karena ID tersimpan berbeda per generasi.
+SYNC_MANIFEST_PATH = os.getenv("SYNC_MANIFEST_PATH", os.path.join("data", "sync_manifest.json"))
+
+class SyncManifest:
+    """Manifest per file sumber, tersimpan di JSON dan reload via mtime"""
+
+    def __init__(self, path=SYNC_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._by_source = {}
+        self._mtime = None
+
+    def _maybe_reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r") as f:
+            self._by_source = json.load(f)
+        self._mtime = mtime
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._by_source, f)
+        os.replace(tmp, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def get(self, source):
+        """{id: identitas} untuk sumber ini; None jika belum pernah disinkron dengan ID hash"""
+        with self._lock:
+            self._maybe_reload()
+            rows = self._by_source.get(source)
+            return dict(rows) if rows is not None else None
+
+    def replace_source(self, source, rows):
+        with self._lock:
+            self._maybe_reload()
+            self._by_source[source] = dict(rows)
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._by_source = {}
+            self._save()
+
+_manifests = {}
+_manifest_lock = threading.Lock()
+
+def manifest_path(generation):
+    """Manifest terpisah per generasi KB; generasi legacy ("") memakai path lama"""
+    if not generation:
+        return SYNC_MANIFEST_PATH
+    root, ext = os.path.splitext(SYNC_MANIFEST_PATH)
+    return f"{root}.{generation}{ext}"
+
+def get_sync_manifest(generation=None):
+    """Manifest generasi tertentu; default generasi aktif"""
+    if generation is None:
+        generation = active_generation()
+    with _manifest_lock:
+        if generation not in _manifests:
+            _manifests[generation] = SyncManifest(manifest_path(generation))
+        return _manifests[generation]
+
+def drop_manifest(generation):
+    with _manifest_lock:
+        _manifests.pop(generation, None)
+    try:
+        os.remove(manifest_path(generation))
+    except OSError:
+        pass
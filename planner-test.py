@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+# Katalog prodi sementara (bukan data/ milik deployment); env harus diset sebelum modules diimpor
+_tmp = tempfile.mkdtemp()
+os.environ["PRODI_CATALOG_PATH"] = os.path.join(_tmp, "prodi_catalog.json")
+os.environ["KB_POINTER_PATH"] = os.path.join(_tmp, "kb_pointer.json")
+
+from modules.catalog import ProgramCatalog
+from modules.fast_planner import detect_intent, fast_plan
+
+# Cek intent fast planner: keyword dicocokkan per kata, bukan substring ("komisi" bukan "misi").
+# Intent campuran (confidence < 1) berarti jatuh ke planner LLM.
+CASES = [
+    ("berapa ukt teknik informatika", "FINANCE", 1.0),
+    ("rincian pembayaran semester ganjil", "FINANCE", 1.0),
+    ("biayanya berapa untuk s1 hukum", "FINANCE", 1.0),
+    ("jelaskan visi dan misi prodi hukum", "DESKRIPSI", 1.0),
+    ("akreditasi fakultas syariah", "DESKRIPSI", 1.0),
+    ("biaya ukt vs visi prodi", "FINANCE", 0.6),
+    ("biaya kuliah komisi penyiaran islam", "FINANCE", 1.0),
+    ("berapa ukt divisi keuangan", "FINANCE", 1.0),
+    ("kontak divisi humas", "UMUM", 0.5),
+    ("permisi, mau tanya", "UMUM", 0.5),
+]
+
+PROGRAMS = [("TEKNIK INFORMATIKA", "S1"), ("ILMU HUKUM", "S1"), ("ILMU HUKUM", "S2"), ("AGRIBISNIS", "S1")]
+# Kata isi yang tetap tak dikenal gazetteer (prodi di luar katalog) menurunkan confidence -> planner LLM
+PLAN_CASES = [
+    ("mana yang lebih mahal teknik informatika atau psikologi", ["S1 Teknik Informatika"], 0.5),
+    ("mana yang lebih mahal teknik informatika atau agribisnis", ["S1 Teknik Informatika", "S1 Agribisnis"], 1.0),
+    ("berapa ukt s2 ilmu hukum tahun 2024", ["S2 Ilmu Hukum"], 1.0),
+    ("biayanya berapa untuk ilmu hukum kelompok iii", ["Ilmu Hukum"], 1.0),
+    ("berapa ukt kedokteran gigi", [], 0.0),
+]
+
+if __name__ == "__main__":
+    failed = 0
+    for query, intent, cap in CASES:
+        got = detect_intent(query)
+        ok = got == (intent, cap)
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {query!r}: {got} (harapan {(intent, cap)})")
+
+    ProgramCatalog(os.environ["PRODI_CATALOG_PATH"]).replace_all({"prodi.csv": PROGRAMS})
+    for query, entities, confidence in PLAN_CASES:
+        plan = fast_plan(query)
+        got = (plan["entities"], plan["confidence"])
+        ok = got == (entities, confidence)
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {query!r}: {got} (harapan {(entities, confidence)})")
+    assert not failed, f"{failed} kasus gagal"
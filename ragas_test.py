@@ -17,8 +17,11 @@ from langchain_huggingface import HuggingFaceEmbeddings
 
 # Import fungsi RAG utama Anda
 from modules.rag_engine import advanced_rag_chat 
+from modules.rate_limiter import metered_call, ametered_call, estimate_prompt_tokens, usage_tokens, llm_priority
 
 # 2. HACK GROQ API: Mencegah parameter 'n' masuk ke Groq (Penyebab Error 400)
+# Juri RAGAS juga antre di scheduler kuota bersama dengan prioritas batch; invoke/ainvoke lewat generate/agenerate,
+# stream/astream diukur sendiri; usage aktual mengoreksi bucket dan 429 mengosongkannya (sama seperti RateLimitedChat)
 class SafeChatGroq(ChatGroq):
     def invoke(self, input, config=None, **kwargs):
         kwargs.pop('n', None)
@@ -30,11 +33,34 @@ class SafeChatGroq(ChatGroq):
         
     def generate(self, messages, stop=None, callbacks=None, **kwargs):
         kwargs.pop('n', None)
-        return super().generate(messages, stop=stop, callbacks=callbacks, **kwargs)
+        tokens = sum(estimate_prompt_tokens(m) for m in messages)
+        with metered_call("groq", self.model_name, tokens, priority="batch") as extra:
+            result = super().generate(messages, stop=stop, callbacks=callbacks, **kwargs)
+            extra["usage"] = usage_tokens(result)
+        return result
 
     async def agenerate(self, messages, stop=None, callbacks=None, **kwargs):
         kwargs.pop('n', None)
-        return await super().agenerate(messages, stop=stop, callbacks=callbacks, **kwargs)
+        tokens = sum(estimate_prompt_tokens(m) for m in messages)
+        async with ametered_call("groq", self.model_name, tokens, priority="batch") as extra:
+            result = await super().agenerate(messages, stop=stop, callbacks=callbacks, **kwargs)
+            extra["usage"] = usage_tokens(result)
+        return result
+
+    def stream(self, input, config=None, **kwargs):
+        # Jalur streaming ChatGroq memanggil _stream langsung (tidak lewat generate) -> diukur sendiri
+        kwargs.pop('n', None)
+        with metered_call("groq", self.model_name, estimate_prompt_tokens(input), kind="llm_stream", priority="batch") as extra:
+            for chunk in super().stream(input, config=config, **kwargs):
+                extra["usage"] = usage_tokens(chunk) or extra.get("usage")
+                yield chunk
+
+    async def astream(self, input, config=None, **kwargs):
+        kwargs.pop('n', None)
+        async with ametered_call("groq", self.model_name, estimate_prompt_tokens(input), kind="llm_stream", priority="batch") as extra:
+            async for chunk in super().astream(input, config=config, **kwargs):
+                extra["usage"] = usage_tokens(chunk) or extra.get("usage")
+                yield chunk
 
 async def run_evaluation():
     print("🚀 Memulai Evaluasi RAGAS (Compatibility Mode) untuk Chatbot UIN...")
@@ -70,16 +96,14 @@ async def run_evaluation():
         q = item["question"]
         print(f"💬 Menjawab: {q}")
         
-        answer, docs = await advanced_rag_chat(q, [])
+        with llm_priority("batch"):
+            answer, docs = await advanced_rag_chat(q, [])
         doc_texts = [d["content"] for d in docs]
         
         questions.append(q)
         answers.append(answer)
         contexts.append(doc_texts)
         ground_truths.append(item["ground_truth"])
-        
-        # Jeda agar tidak kena Rate Limit Groq (TPM)
-        await asyncio.sleep(2)
 
     # Siapkan Dataset
     dataset = Dataset.from_dict({
@@ -94,7 +118,7 @@ async def run_evaluation():
     juri_llm = SafeChatGroq(model="llama-3.3-70b-versatile", temperature=0)
     juri_embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2") 
 
-    # Konfigurasi antrean agar tidak Timeout
+    # Kuota RPM/TPM diatur scheduler (modules/rate_limiter); worker tetap satu seperti semula
     safe_config = RunConfig(timeout=300, max_workers=1)
 
     print("\n⏳ Menghitung skor RAGAS (Abaikan peringatan kuning)...")
@@ -5,6 +5,7 @@ import asyncio
 import time
 from modules.rag_engine import advanced_rag_chat
 from modules.evaluator import RAGEvaluator
+from modules.rate_limiter import llm_priority
 
 # Konfigurasi Halaman
 st.set_page_config(page_title="RAG Stress Test Dashboard", layout="wide")
@@ -20,6 +21,14 @@ with st.sidebar:
     st.header("Test Configuration")
     run_button = st.button("▶️ Mulai Stress Test", type="primary")
     show_debug = st.checkbox("Tampilkan Debug Info", value=True)
+    # Hook untuk memastikan routing judge tidak menurunkan kualitas: bandingkan skor auto vs Llama 4 penuh
+    routing_mode = st.selectbox("Routing Judge", ["Auto (router)", "Semua Llama 4", "A/B: router vs Llama 4"])
+
+ROUTING_RUNS = {
+    "Auto (router)": [("auto", None)],
+    "Semua Llama 4": [("standard", "standard")],
+    "A/B: router vs Llama 4": [("auto", None), ("standard", "standard")]
+}
 
 # Dataset Pertanyaan (Bisa dipindah ke file JSON/CSV)
 test_queries = [
@@ -49,19 +58,21 @@ async def start_stress_test():
     
     table_placeholder = st.empty()
     
-    total = len(test_queries)
+    runs = [(item, label, tier) for item in test_queries for label, tier in ROUTING_RUNS[routing_mode]]
+    total = len(runs)
     fails = 0
     total_score = 0
 
-    for i, item in enumerate(test_queries):
+    for i, (item, routing, judge_tier) in enumerate(runs):
         query, cat = item["q"], item["cat"]
         
         # UI Update
-        status_text.status(f"⏳ Menguji [{i+1}/{total}]: {query}")
+        status_text.status(f"⏳ Menguji [{i+1}/{total}] ({routing}): {query}")
         
         try:
-            # 1. Jalankan RAG
-            answer, sources, debug = await advanced_rag_chat(query, [])
+            # 1. Jalankan RAG (prioritas evaluasi agar tidak merebut kuota live chat)
+            with llm_priority("evaluation"):
+                answer, sources, debug = await advanced_rag_chat(query, [], judge_tier=judge_tier)
             
             # 2. Audit
             context_text = "\n".join([s for s, score in sources[:5]])
@@ -76,7 +87,8 @@ async def start_stress_test():
             res_entry = {
                 "No": i + 1, "Category": cat, "Query": query, 
                 "Score": score, "Reason": audit["reason"],
-                "Intent": debug.get("intent"), "Model": debug.get("model")
+                "Intent": debug.get("intent"), "Model": debug.get("model"),
+                "Routing": routing, "Tier": debug.get("route", {}).get("tier")
             }
             results.append(res_entry)
             
@@ -120,5 +132,9 @@ if run_button:
         cat_avg = df.groupby('Category')['Score'].mean()
         st.bar_chart(cat_avg)
 
+    # Kualitas per tier judge: skor tier "light" harus setara dengan Llama 4 untuk kategori yang sama
+    st.write("Rata-rata Skor per Kategori x Routing / Tier")
+    st.dataframe(df.pivot_table(index="Category", columns=["Routing", "Tier"], values="Score", aggfunc="mean"), use_container_width=True)
+
     st.success("✅ Stress Test Selesai! Data telah disimpan ke `last_audit_report.csv`")
     df.to_csv("last_audit_report.csv", index=False)
\ No newline at end of file